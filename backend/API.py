@@ -1,13 +1,123 @@
+import importlib.util
+import itertools
+import os
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
-from flask import Flask, jsonify, request, g, render_template
+from flask import Flask, jsonify, request, g, render_template, send_file
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 FRONTEND_DIR = PROJECT_ROOT / "frontend"
 if not FRONTEND_DIR.exists():
     FRONTEND_DIR = PROJECT_ROOT / "frontend "
 DB_PATH = PROJECT_ROOT / "database" / "taxi_data.db"
+PIPELINE_OUTPUT_DIR = PROJECT_ROOT / "data_pipeline" / "output"
+
+#zone geometry written by the pipeline: full resolution plus simplified levels
+#(see data_pipeline/geometry.py), as GeoJSON or TopoJSON
+GEOMETRY_LEVELS = ("full", "high", "medium", "low")
+GEOMETRY_FORMATS = ("geojson", "topojson")
+
+#pre-aggregated trips built by database/rollups.sql; each measure is stored as
+#<measure>_n (non-NULL count), <measure>_sum and <measure>_sumsq, so
+#SUM(<measure>_sum) / SUM(<measure>_n) gives the same value as AVG(<measure>)
+ROLLUP_MEASURES = (
+    "fare_amount", "total_amount", "trip_distance", "trip_duration_min", "speed_mph",
+    "cost_per_mile", "tip_percentage", "tolls_amount", "extra", "congestion_surcharge",
+)
+
+#PRAGMA user_version of databases with the rollup tables and compact monthly
+#trip partitions (database/schema.sql); older ones are answered from trips
+SCHEMA_VERSION = 1
+#...and from this version on with trip_samples for /api/fare-vs-distance
+SAMPLES_SCHEMA_VERSION = 2
+#...and with meta.data_version, set by every load
+META_SCHEMA_VERSION = 3
+#...and with each sampled trip's filter columns, to sample under any filter
+FILTERED_SAMPLES_SCHEMA_VERSION = 4
+
+#what an aggregate can be answered from under the request's filter, coarsest
+#first (trip_filters.py); the first one answers unfiltered requests
+ZONE_HOUR_SOURCES = ("rollup_zone_hour", "rollup_trips")
+ROUTE_SOURCES = ("rollup_routes",)
+
+#fare-vs-distance points per response by default and at most (database/
+#load_data.py stores SAMPLE_SIZE per month), and how many samples it draws
+SAMPLE_POINTS = 2000
+MAX_SAMPLE_POINTS = 5000
+SAMPLE_COUNT = 4
+
+#day of week as stored in the compact tables: 0 = Monday ... 6 = Sunday
+DAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+WEEKEND_DAYS = "(5, 6)"
+
+#what answers the aggregate endpoints: SQLite queries, or the NumPy column
+#store in column_store.py (same JSON); set per deployment with API_ENGINE
+QUERY_ENGINES = ("sqlite", "numpy")
+QUERY_ENGINE = os.environ.get("API_ENGINE", "sqlite")
+if QUERY_ENGINE not in QUERY_ENGINES:
+    raise ValueError(f"API_ENGINE must be one of {', '.join(QUERY_ENGINES)}, not {QUERY_ENGINE!r}")
+
+#read-only connections kept open between requests (db_pool.py): at most
+#DB_POOL_SIZE idle ones, each with its own mmap and page cache (cache_size < 0 is KiB)
+DB_POOL_SIZE = 8
+DB_PRAGMAS = {"mmap_size": 256 * 2**20, "cache_size": -32 * 1024, "temp_store": "MEMORY"}
+
+#where /api/geojson keeps its enriched, pre-compressed bodies (payload_store.py)
+PAYLOAD_DIR = PROJECT_ROOT / "database" / "payloads"
+
+#what /api/dashboard can batch: dataset (its /api/ route) → the grouping it
+#shares with others (see shared_scan), or None.  Datasets sharing a grouping
+#run on one thread and are derived from one query; the rest run in parallel
+#on up to DASHBOARD_WORKERS threads
+DASHBOARD_DATASETS = {
+    "summary": None,
+    "trips-by-hour": None,
+    "trips-by-day": None,
+    "peak-hours": None,
+    "weekday-vs-weekend": None,
+    "zone-stats": "pickup_zone",
+    "top-pickup-zones": "pickup_zone",
+    "top-dropoff-zones": None,
+    "borough-stats": None,
+    "avg-fare-by-borough": None,
+    "fare-vs-distance": None,
+    "tolls-and-fees": None,
+    "top-routes": None,
+    "demand-by-hour-borough": None,
+    "demand-weekday-weekend-by-zone": None,
+    "geojson": None,
+}
+DASHBOARD_WORKERS = 4
+
+#finished /api/ responses kept per data version (response_cache.py)
+RESPONSE_CACHE_ENTRIES = 256
+RESPONSE_CACHE_BYTES = 64 * 2**20
+
+@lru_cache(maxsize=None)
+def _backend_module(name):
+    #backend/<name>.py, loaded by path so the API also works when imported from outside backend/
+    spec = importlib.util.spec_from_file_location(name, Path(__file__).with_name(f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+_response_cache = _backend_module("response_cache")
+_trip_filters = _backend_module("trip_filters")
+response_cache = _response_cache.ResponseCache(RESPONSE_CACHE_ENTRIES, RESPONSE_CACHE_BYTES)
+db_pool = _backend_module("db_pool").ConnectionPool(DB_POOL_SIZE, DB_PRAGMAS)
+zone_payloads = _backend_module("payload_store").PayloadStore(PAYLOAD_DIR)
+dashboard_workers = ThreadPoolExecutor(DASHBOARD_WORKERS, thread_name_prefix="dashboard")
+#the shared scans of the /api/dashboard group running on this thread
+_dashboard_group = threading.local()
+#(file identity, data version) of the database last seen; replaced whole, never
+#changed in place, so concurrent requests read either the old or the new pair
+_data_version = (None, None)
 
 app = Flask(
     __name__,
@@ -18,19 +128,18 @@ app = Flask(
 
 
 def get_db():
-    #Open one connection per request and reuse it
+    #Take one connection from the pool per request and reuse it (rows behave like dicts)
     if "_database" not in g:
-        g._database = sqlite3.connect(str(DB_PATH))
-        g._database.row_factory = sqlite3.Row #this line is the one that makes rows behave like dicts when querying them 
+        g._database = db_pool.acquire(DB_PATH)
     return g._database
 
 
 @app.teardown_appcontext
 def close_db(exception):
-    #for closing the db when request ends 
+    #give the connection back when the request ends; one that failed is closed instead
     db = g.pop("_database", None)
     if db is not None:
-        db.close()
+        db_pool.release(db, healthy=not isinstance(exception, sqlite3.Error))
 
 
 def query(sql, args=(), one=False):
@@ -40,6 +149,202 @@ def query(sql, args=(), one=False):
     return rows[0] if one and rows else rows
 
 
+def day_name(column):
+    #SQL for the day name of a 0-6 day-of-week column
+    whens = " ".join(f"WHEN {i} THEN '{day}'" for i, day in enumerate(DAY_NAMES))
+    return f"CASE {column} {whens} END"
+
+
+def _raw_rollup(keys):
+    #trips in the shape of a rollup table, one trip per row
+    measures = ", ".join(
+        f"({m} IS NOT NULL) AS {m}_n, {m} AS {m}_sum, {m} * {m} AS {m}_sumsq" for m in ROLLUP_MEASURES
+    )
+    return f"(SELECT {keys}, 1 AS trip_count, {measures} FROM trips)"
+
+
+_RAW_DOW = "CASE pickup_day_of_week " + " ".join(f"WHEN '{day}' THEN {i}" for i, day in enumerate(DAY_NAMES)) + " END"
+
+RAW_ROLLUPS = {
+    "rollup_trips": _raw_rollup(
+        "substr(pickup_datetime, 1, 7) AS pickup_month, substr(pickup_datetime, 1, 10) AS pickup_date, "
+        f"pickup_hour, {_RAW_DOW} AS pickup_dow, pickup_zone_id, payment_type"
+    ),
+    "rollup_zone_hour": _raw_rollup(
+        f"substr(pickup_datetime, 1, 7) AS pickup_month, {_RAW_DOW} AS pickup_dow, pickup_hour, pickup_zone_id"
+    ),
+    "rollup_routes": """(SELECT substr(pickup_datetime, 1, 7) AS pickup_month, pickup_zone_id, dropoff_zone_id,
+        1 AS trip_count FROM trips)""",
+}
+
+
+def _schema_version():
+    #PRAGMA user_version of the database, read once per request
+    if "_schema_version" not in g:
+        g._schema_version = get_db().execute("PRAGMA user_version").fetchone()[0]
+    return g._schema_version
+
+
+def _compact():
+    #True if the database has the current layout (rollups, compact partitions)
+    return _schema_version() >= SCHEMA_VERSION
+
+
+def rollup(name):
+    #The rollup table if the database has it, else the same columns computed from trips
+    return name if _compact() else RAW_ROLLUPS[name]
+
+
+def data_version():
+    """
+    Version of the data the API answers from, or None without a database.
+    Databases from load_data.py stamp a new meta.data_version on every load;
+    for older ones the database file's identity stands in.
+    """
+    global _data_version
+    identity = _response_cache.file_identity(DB_PATH)
+    if identity is None:
+        return None
+    seen_identity, version = _data_version
+    if seen_identity != identity:
+        version = identity
+        if _schema_version() >= META_SCHEMA_VERSION:
+            row = query("SELECT value FROM meta WHERE key = 'data_version'", one=True)
+            if row:
+                version = row["value"]
+        _data_version = (identity, version)
+    return version
+
+
+def skip_response_cache():
+    #this response must not be cached (it differs between identical requests)
+    g._skip_response_cache = True
+
+
+def column_store():
+    #The NumPy engine for this database, or None to answer from SQLite (it only holds unfiltered totals)
+    if QUERY_ENGINE != "numpy" or not _compact() or request_filter().active:
+        return None
+    return _backend_module("column_store").open_store(DB_PATH)
+
+
+def request_filter():
+    #The filter parameters of this request (trip_filters.py), parsed once
+    if "_trip_filter" not in g:
+        g._trip_filter = _trip_filters.parse_filter(request.args)
+    return g._trip_filter
+
+
+@app.errorhandler(_trip_filters.FilterError)
+def bad_filter(error):
+    return jsonify({"error": str(error)}), 400
+
+
+def filtered(sources, alias=None):
+    """
+    (source, where, params) for an aggregate under the request's filter:
+    the first of ``sources`` that has every column the filter needs, with
+    the filter as a WHERE clause on ``alias``.  When none has them, the trips
+    of the months in range, filtered in a subquery as rows of rollup_routes
+    (the only source without every filter column) with trip_count = 1.
+    Unfiltered: the first source and no WHERE.
+    """
+    trip_filter = request_filter()
+    name = _trip_filters.choose_source(trip_filter, sources)
+    if name != "trips":
+        where, params = _trip_filters.where(trip_filter, name, alias)
+        return rollup(name), where, params
+    start, end = trip_filter.start, trip_filter.end_exclusive
+    trips = trips_source(start and start.isoformat(), end and end.isoformat())
+    where, params = _trip_filters.where(trip_filter, "trips", compact=_compact())
+    #+: grouping by the bare zone columns would have SQLite walk the route
+    #index in group order and look every trip up; this way it reads the
+    #matching trips from the filter's covering index (indexes.sql) and sorts them
+    return (
+        f"(SELECT +pickup_zone_id AS pickup_zone_id, +dropoff_zone_id AS dropoff_zone_id, 1 AS trip_count "
+        f"FROM {trips} {where})"
+    ), "", params
+
+
+def trips_source(start=None, end=None):
+    """
+    What to select trips FROM when pickups are known to fall in [start, end)
+    (ISO date strings, either may be None): only the monthly partitions
+    (database/load_data.py) that overlap the range, instead of the trips view
+    over all of them.  Only columns the old trips table and the compact
+    partitions share can be selected from it.
+    """
+    if not _compact():
+        return "trips"
+    if start is None and end is None:
+        return "trips_compact"
+    tables = [row["table_name"] for row in query("""
+        SELECT table_name FROM trip_partitions
+        WHERE (? IS NULL OR last_pickup >= ?) AND (? IS NULL OR first_pickup < ?)
+        ORDER BY month
+    """, (start, start, end, end))]
+    if not tables:
+        #no partition overlaps: keep the columns, return no rows
+        return "(SELECT * FROM trips_compact WHERE 0)"
+    if len(tables) == 1:
+        return tables[0]
+    return "(" + " UNION ALL ".join(f"SELECT * FROM {t}" for t in tables) + ")"
+
+
+def shared_scan(name):
+    """
+    Rows of grouping ``name`` when the /api/dashboard batch running on this
+    thread has several datasets derived from it, queried once for all of them;
+    otherwise None, and each route runs its own query.  Only datasets that
+    take integers or whole rows from a grouping share it: a float sum derived
+    differently would not be the same double as the route's own query.
+    """
+    scans = getattr(_dashboard_group, "scans", None)
+    if scans is None:
+        return None
+    #datasets can be given different filters
+    key = (name, request_filter())
+    if key not in scans:
+        scans[key] = SHARED_SCANS[name]()
+    return scans[key]
+
+
+@app.before_request
+def cached_response():
+    #answer repeat /api/ requests from the response cache
+    if request.method not in ("GET", "HEAD") or not request.path.startswith("/api/"):
+        return None
+    version = data_version()
+    if version is None:
+        return None
+    g._cache_key = (request.path, _response_cache.normalized_args(request.args))
+    g._cache_version = version
+    entry = response_cache.get(g._cache_key, version)
+    if entry is None:
+        return None
+    g._cache_hit = True
+    response = app.response_class(entry.body, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    return response
+
+
+@app.after_request
+def store_response(response):
+    #cache successful /api/ responses and answer If-None-Match with 304
+    if "_cache_key" not in g:
+        return response
+    if not g.get("_cache_hit"):
+        if response.status_code != 200 or g.get("_skip_response_cache"):
+            return response
+        response.add_etag()
+        response_cache.put(g._cache_key, g._cache_version, _response_cache.CachedResponse(
+            response.get_data(), response.mimetype, response.get_etag()[0],
+        ))
+    #browsers may keep the body but must revalidate it
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
 @app.route("/")
 def home():
     return render_template("index.html")
@@ -47,15 +352,20 @@ def home():
 
 @app.route("/api/summary")
 def summary():
-    data = query("""
+    store = column_store()
+    if store is not None:
+        return jsonify(store.summary())
+    source, where, params = filtered(ZONE_HOUR_SOURCES)
+    data = query(f"""
         SELECT
-            COUNT(*)               AS total_trips,
-            ROUND(AVG(fare_amount), 2)      AS avg_fare,
-            ROUND(AVG(trip_distance), 2)    AS avg_distance,
-            ROUND(AVG(trip_duration_min), 2) AS avg_duration_min,
-            ROUND(AVG(speed_mph), 2)        AS avg_speed_mph
-        FROM trips
-    """, one=True)
+            COALESCE(SUM(trip_count), 0)    AS total_trips,
+            ROUND(SUM(fare_amount_sum) / SUM(fare_amount_n), 2)      AS avg_fare,
+            ROUND(SUM(trip_distance_sum) / SUM(trip_distance_n), 2)  AS avg_distance,
+            ROUND(SUM(trip_duration_min_sum) / SUM(trip_duration_min_n), 2) AS avg_duration_min,
+            ROUND(SUM(speed_mph_sum) / SUM(speed_mph_n), 2)          AS avg_speed_mph
+        FROM {source}
+        {where}
+    """, params, one=True)
     return jsonify(data)
 
 
@@ -63,107 +373,141 @@ def summary():
 @app.route("/api/trips-by-hour")
 def trips_by_hour():
     """Trip count per hour of day (0-23). → bar chart."""
-    rows = query("""
-        SELECT pickup_hour AS hour, COUNT(*) AS trip_count
-        FROM trips
+    store = column_store()
+    if store is not None:
+        return jsonify(store.trips_by_hour())
+    source, where, params = filtered(ZONE_HOUR_SOURCES)
+    rows = query(f"""
+        SELECT pickup_hour AS hour, SUM(trip_count) AS trip_count
+        FROM {source}
+        {where}
         GROUP BY pickup_hour
         ORDER BY pickup_hour
-    """)
+    """, params)
     return jsonify(rows)
 
 
 @app.route("/api/trips-by-day")
 def trips_by_day():
     """Trip count per day of week. → bar chart (weekday vs weekend)."""
-    rows = query("""
-        SELECT pickup_day_of_week AS day, COUNT(*) AS trip_count
-        FROM trips
-        GROUP BY pickup_day_of_week
-        ORDER BY
-            CASE pickup_day_of_week
-                WHEN 'Monday'    THEN 1
-                WHEN 'Tuesday'   THEN 2
-                WHEN 'Wednesday' THEN 3
-                WHEN 'Thursday'  THEN 4
-                WHEN 'Friday'    THEN 5
-                WHEN 'Saturday'  THEN 6
-                WHEN 'Sunday'    THEN 7
-            END
-    """)
+    store = column_store()
+    if store is not None:
+        return jsonify(store.trips_by_day())
+    source, where, params = filtered(ZONE_HOUR_SOURCES)
+    rows = query(f"""
+        SELECT {day_name("pickup_dow")} AS day, SUM(trip_count) AS trip_count
+        FROM {source}
+        {where}
+        GROUP BY pickup_dow
+        ORDER BY pickup_dow
+    """, params)
     return jsonify(rows)
 
 
 @app.route("/api/peak-hours")
 def peak_hours():
-    rows = query("""
+    store = column_store()
+    if store is not None:
+        return jsonify(store.peak_hours())
+    source, where, params = filtered(ZONE_HOUR_SOURCES)
+    rows = query(f"""
         SELECT
             pickup_hour              AS hour,
-            COUNT(*)                 AS trip_count,
-            ROUND(AVG(fare_amount), 2) AS avg_fare,
-            ROUND(SUM(total_amount), 2) AS total_revenue
-        FROM trips
+            SUM(trip_count)          AS trip_count,
+            ROUND(SUM(fare_amount_sum) / SUM(fare_amount_n), 2) AS avg_fare,
+            ROUND(SUM(total_amount_sum), 2) AS total_revenue
+        FROM {source}
+        {where}
         GROUP BY pickup_hour
-        ORDER BY trip_count DESC
+        ORDER BY trip_count DESC, pickup_hour
         LIMIT 5
-    """)
+    """, params)
     return jsonify(rows)
 
 
 @app.route("/api/weekday-vs-weekend")
 def weekday_vs_weekend():
     """Compare weekday vs weekend: trips, avg fare, avg duration."""
-    rows = query("""
+    store = column_store()
+    if store is not None:
+        return jsonify(store.weekday_vs_weekend())
+    source, where, params = filtered(ZONE_HOUR_SOURCES)
+    rows = query(f"""
         SELECT
             CASE
-                WHEN pickup_day_of_week IN ('Saturday', 'Sunday')
+                WHEN pickup_dow IN {WEEKEND_DAYS}
                 THEN 'Weekend'
                 ELSE 'Weekday'
             END AS period,
-            COUNT(*)                          AS trip_count,
-            ROUND(AVG(fare_amount), 2)        AS avg_fare,
-            ROUND(AVG(trip_duration_min), 2)  AS avg_duration_min,
-            ROUND(AVG(trip_distance), 2)      AS avg_distance
-        FROM trips
+            SUM(trip_count)                   AS trip_count,
+            ROUND(SUM(fare_amount_sum) / SUM(fare_amount_n), 2)              AS avg_fare,
+            ROUND(SUM(trip_duration_min_sum) / SUM(trip_duration_min_n), 2)  AS avg_duration_min,
+            ROUND(SUM(trip_distance_sum) / SUM(trip_distance_n), 2)          AS avg_distance
+        FROM {source}
+        {where}
         GROUP BY period
-    """)
+    """, params)
     return jsonify(rows)
 
 
 
 @app.route("/api/zone-stats")
 def zone_stats():
-    rows = query("""
+    store = column_store()
+    if store is not None:
+        return jsonify(store.zone_stats())
+    shared = shared_scan("pickup_zone")
+    return jsonify(zone_stats_rows() if shared is None else shared)
+
+
+def zone_stats_rows():
+    #pickups and averages per pickup zone, most pickups first
+    source, where, params = filtered(ZONE_HOUR_SOURCES, "r")
+    return query(f"""
         SELECT
             z.zone_id,
             z.zone_name,
             z.borough,
-            COUNT(*)                          AS pickup_count,
-            ROUND(AVG(t.fare_amount), 2)      AS avg_fare,
-            ROUND(AVG(t.trip_distance), 2)    AS avg_distance,
-            ROUND(AVG(t.trip_duration_min), 2) AS avg_duration_min
-        FROM trips t
-        JOIN zones z ON t.pickup_zone_id = z.zone_id
+            SUM(r.trip_count)                 AS pickup_count,
+            ROUND(SUM(r.fare_amount_sum) / SUM(r.fare_amount_n), 2)              AS avg_fare,
+            ROUND(SUM(r.trip_distance_sum) / SUM(r.trip_distance_n), 2)          AS avg_distance,
+            ROUND(SUM(r.trip_duration_min_sum) / SUM(r.trip_duration_min_n), 2)  AS avg_duration_min
+        FROM {source} r
+        JOIN zones z ON r.pickup_zone_id = z.zone_id
+        {where}
         GROUP BY z.zone_id
-        ORDER BY pickup_count DESC
-    """)
-    return jsonify(rows)
+        ORDER BY pickup_count DESC, z.zone_id
+    """, params)
 
 
 @app.route("/api/top-pickup-zones")
 def top_pickup_zones():
     """Top 10 zones by pickup count. → ranked list / bar chart."""
     limit = request.args.get("limit", 10, type=int)
-    rows = query("""
+    store = column_store()
+    if store is not None:
+        return jsonify(store.top_pickup_zones(limit))
+    shared = shared_scan("pickup_zone")
+    if shared is not None:
+        #a negative LIMIT is no limit in SQLite
+        top = shared if limit < 0 else shared[:limit]
+        return jsonify([
+            {"zone_name": row["zone_name"], "borough": row["borough"], "pickup_count": row["pickup_count"]}
+            for row in top
+        ])
+    source, where, params = filtered(ZONE_HOUR_SOURCES, "r")
+    rows = query(f"""
         SELECT
             z.zone_name,
             z.borough,
-            COUNT(*) AS pickup_count
-        FROM trips t
-        JOIN zones z ON t.pickup_zone_id = z.zone_id
+            SUM(r.trip_count) AS pickup_count
+        FROM {source} r
+        JOIN zones z ON r.pickup_zone_id = z.zone_id
+        {where}
         GROUP BY z.zone_id
-        ORDER BY pickup_count DESC
+        ORDER BY pickup_count DESC, z.zone_id
         LIMIT ?
-    """, (limit,))
+    """, (*params, limit))
     return jsonify(rows)
 
 
@@ -171,87 +515,207 @@ def top_pickup_zones():
 def top_dropoff_zones():
     #top ten
     limit = request.args.get("limit", 10, type=int)
-    rows = query("""
+    store = column_store()
+    if store is not None:
+        return jsonify(store.top_dropoff_zones(limit))
+    source, where, params = filtered(ROUTE_SOURCES, "r")
+    rows = query(f"""
         SELECT
             z.zone_name,
             z.borough,
-            COUNT(*) AS dropoff_count
-        FROM trips t
-        JOIN zones z ON t.dropoff_zone_id = z.zone_id
+            SUM(r.trip_count) AS dropoff_count
+        FROM {source} r
+        JOIN zones z ON r.dropoff_zone_id = z.zone_id
+        {where}
         GROUP BY z.zone_id
-        ORDER BY dropoff_count DESC
+        ORDER BY dropoff_count DESC, z.zone_id
         LIMIT ?
-    """, (limit,))
+    """, (*params, limit))
     return jsonify(rows)
 
 
 @app.route("/api/borough-stats")
 def borough_stats():
-    rows = query("""
+    store = column_store()
+    if store is not None:
+        return jsonify(store.borough_stats())
+    source, where, params = filtered(ZONE_HOUR_SOURCES, "r")
+    rows = query(f"""
         SELECT
             z.borough,
-            COUNT(*)                          AS trip_count,
-            ROUND(AVG(t.fare_amount), 2)      AS avg_fare,
-            ROUND(AVG(t.trip_distance), 2)    AS avg_distance,
-            ROUND(AVG(t.trip_duration_min), 2) AS avg_duration_min,
-            ROUND(AVG(t.speed_mph), 2)        AS avg_speed_mph
-        FROM trips t
-        JOIN zones z ON t.pickup_zone_id = z.zone_id
+            SUM(r.trip_count)                 AS trip_count,
+            ROUND(SUM(r.fare_amount_sum) / SUM(r.fare_amount_n), 2)              AS avg_fare,
+            ROUND(SUM(r.trip_distance_sum) / SUM(r.trip_distance_n), 2)          AS avg_distance,
+            ROUND(SUM(r.trip_duration_min_sum) / SUM(r.trip_duration_min_n), 2)  AS avg_duration_min,
+            ROUND(SUM(r.speed_mph_sum) / SUM(r.speed_mph_n), 2)                  AS avg_speed_mph
+        FROM {source} r
+        JOIN zones z ON r.pickup_zone_id = z.zone_id
+        {where}
         GROUP BY z.borough
-        ORDER BY trip_count DESC
-    """)
+        ORDER BY trip_count DESC, z.borough
+    """, params)
     return jsonify(rows)
 
 
 @app.route("/api/avg-fare-by-borough")
 def avg_fare_by_borough():
     #Average fare per borough. → bar chart.
-    rows = query("""
+    store = column_store()
+    if store is not None:
+        return jsonify(store.avg_fare_by_borough())
+    source, where, params = filtered(ZONE_HOUR_SOURCES, "r")
+    rows = query(f"""
         SELECT
             z.borough,
-            ROUND(AVG(t.fare_amount), 2)    AS avg_fare,
-            ROUND(AVG(t.total_amount), 2)   AS avg_total,
-            ROUND(AVG(t.cost_per_mile), 2)  AS avg_cost_per_mile,
-            ROUND(AVG(t.tip_percentage), 2) AS avg_tip_pct
-        FROM trips t
-        JOIN zones z ON t.pickup_zone_id = z.zone_id
+            ROUND(SUM(r.fare_amount_sum) / SUM(r.fare_amount_n), 2)        AS avg_fare,
+            ROUND(SUM(r.total_amount_sum) / SUM(r.total_amount_n), 2)      AS avg_total,
+            ROUND(SUM(r.cost_per_mile_sum) / SUM(r.cost_per_mile_n), 2)    AS avg_cost_per_mile,
+            ROUND(SUM(r.tip_percentage_sum) / SUM(r.tip_percentage_n), 2)  AS avg_tip_pct
+        FROM {source} r
+        JOIN zones z ON r.pickup_zone_id = z.zone_id
+        {where}
         GROUP BY z.borough
-        ORDER BY avg_fare DESC
-    """)
+        ORDER BY avg_fare DESC, z.borough
+    """, params)
     return jsonify(rows)
 
 
+def split_proportionally(total, weights):
+    #total split into integers in proportion to weights (largest remainder)
+    whole = sum(weights)
+    if not whole:
+        return [0] * len(weights)
+    quotas = [total * w / whole for w in weights]
+    shares = [int(q) for q in quotas]
+    by_remainder = sorted(range(len(weights)), key=lambda i: shares[i] - quotas[i])
+    for i in by_remainder[:total - sum(shares)]:
+        shares[i] += 1
+    return shares
+
+
+_sample_rotation = itertools.count()
+
+
 @app.route("/api/fare-vs-distance")
 def fare_vs_distance():
-    #Sample of fare vs distance for scatter plot (random 2000 rows)
-    rows = query("""
-        SELECT
-            trip_distance,
-            fare_amount,
-            total_amount,
-            tip_amount
-        FROM trips
-        WHERE trip_distance > 0 AND fare_amount > 0
-        ORDER BY RANDOM()
-        LIMIT 2000
-    """)
+    """
+    Sample of fare vs distance for the scatter plot. ?size= points (default
+    2000, at most 5000) from one of the stratified samples drawn at load time
+    (trip_samples), each month contributing in proportion to its trips.
+    ?seed= picks the sample; without it, successive requests rotate through them.
+    A filter finer than whole months keeps the sampled trips that match it
+    (filtered_sample), or samples the matching trips on databases whose
+    samples lack the filter columns.
+    """
+    size = min(max(request.args.get("size", SAMPLE_POINTS, type=int), 0), MAX_SAMPLE_POINTS)
+    seed = request.args.get("seed", type=int)
+    trip_filter = request_filter()
+    source = "trips"
+    if _schema_version() >= FILTERED_SAMPLES_SCHEMA_VERSION:
+        source = _trip_filters.choose_source(trip_filter, ("trip_sample_months", "trip_samples"))
+    elif _schema_version() >= SAMPLES_SCHEMA_VERSION:
+        source = _trip_filters.choose_source(trip_filter, ("trip_sample_months",))
+    if source == "trips":
+        #no samples in this database or for this filter: draw one (the seed cannot apply)
+        skip_response_cache()
+        start, end = trip_filter.start, trip_filter.end_exclusive
+        where, params = _trip_filters.where(trip_filter, "trips", compact=_compact())
+        rows = query(f"""
+            SELECT
+                trip_distance,
+                fare_amount,
+                total_amount,
+                tip_amount
+            FROM {trips_source(start and start.isoformat(), end and end.isoformat())}
+            {where + " AND" if where else "WHERE"} trip_distance > 0 AND fare_amount > 0
+            ORDER BY RANDOM()
+            LIMIT ?
+        """, (*params, size))
+        return jsonify(rows)
+
+    if seed is None:
+        skip_response_cache()
+    sample_id = (next(_sample_rotation) if seed is None else seed) % SAMPLE_COUNT
+    if source == "trip_samples":
+        return jsonify(filtered_sample(trip_filter, sample_id, size))
+    where, params = _trip_filters.where(trip_filter, "trip_sample_months")
+    months = query(f"SELECT pickup_month, trip_count FROM trip_sample_months {where} ORDER BY pickup_month", params)
+    shares = split_proportionally(size, [m["trip_count"] for m in months])
+    parts = [(m["pickup_month"], share) for m, share in zip(months, shares) if share]
+    if not parts:
+        return jsonify([])
+    #every prefix of a sample in sample_rank order is stratified (see schema.sql)
+    rows = query("\nUNION ALL\n".join("""
+        SELECT trip_distance, fare_amount, total_amount, tip_amount
+        FROM trip_samples
+        WHERE sample_id = ? AND pickup_month = ? AND sample_rank < ?
+    """ for _ in parts), [arg for month, share in parts for arg in (sample_id, month, share)])
     return jsonify(rows)
 
 
+def filtered_sample(trip_filter, first_sample, size):
+    """
+    Up to ``size`` fare-vs-distance points of the sampled trips that match
+    ``trip_filter``.  A month's samples are read as one sequence, starting
+    with ``first_sample`` and each in sample_rank order, and every month reads
+    the same fraction of its trips (the most the month with the fewest sampled
+    rows per trip allows), so months keep contributing in proportion to their
+    matching trips.  Small filters get fewer points than ``size``: at most the
+    filter's share of SAMPLE_COUNT samples.
+    """
+    first, last = trip_filter.months()
+    months = query("""
+        SELECT pickup_month, trip_count FROM trip_sample_months
+        WHERE (? IS NULL OR pickup_month >= ?) AND (? IS NULL OR pickup_month <= ?) AND trip_count > 0
+        ORDER BY pickup_month
+    """, (first, first, last, last))
+    if not months:
+        return []
+    per_sample = {m["pickup_month"]: min(m["trip_count"], MAX_SAMPLE_POINTS) for m in months}
+    fraction = min(SAMPLE_COUNT * per_sample[m["pickup_month"]] / m["trip_count"] for m in months)
+    #(sample_id, month, rows of it) in reading order
+    parts = []
+    for m in months:
+        month, rows_per_sample = m["pickup_month"], per_sample[m["pickup_month"]]
+        remaining = int(fraction * m["trip_count"])
+        for k in range(SAMPLE_COUNT):
+            take = min(remaining, rows_per_sample)
+            if take <= 0:
+                break
+            parts.append(((first_sample + k) % SAMPLE_COUNT, month, take))
+            remaining -= take
+    where, params = _trip_filters.where(trip_filter, "trip_samples")
+    rows = query("\nUNION ALL\n".join(f"""
+        SELECT pickup_month, trip_distance, fare_amount, total_amount, tip_amount
+        FROM trip_samples
+        {where} AND sample_id = ? AND pickup_month = ? AND sample_rank < ?
+    """ for _ in parts), [arg for part in parts for arg in (*params, *part)])
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(row.pop("pickup_month"), []).append(row)
+    shares = split_proportionally(size, [len(points) for points in by_month.values()])
+    return [point for points, share in zip(by_month.values(), shares) for point in points[:share]]
+
+
 @app.route("/api/tolls-and-fees")
 def tolls_and_fees():
     #Hours with the highest tolls, extras, and surcharges
-    rows = query("""
+    store = column_store()
+    if store is not None:
+        return jsonify(store.tolls_and_fees())
+    source, where, params = filtered(ZONE_HOUR_SOURCES)
+    rows = query(f"""
         SELECT
             pickup_hour               AS hour,
-            ROUND(AVG(tolls_amount), 2)          AS avg_tolls,
-            ROUND(AVG(extra), 2)                 AS avg_extra,
-            ROUND(AVG(congestion_surcharge), 2)  AS avg_congestion,
-            ROUND(SUM(tolls_amount), 2)          AS total_tolls
-        FROM trips
+            ROUND(SUM(tolls_amount_sum) / SUM(tolls_amount_n), 2)                  AS avg_tolls,
+            ROUND(SUM(extra_sum) / SUM(extra_n), 2)                                AS avg_extra,
+            ROUND(SUM(congestion_surcharge_sum) / SUM(congestion_surcharge_n), 2)  AS avg_congestion,
+            ROUND(SUM(tolls_amount_sum), 2)      AS total_tolls
+        FROM {source}
+        {where}
         GROUP BY pickup_hour
-        ORDER BY total_tolls DESC
-    """)
+        ORDER BY total_tolls DESC, pickup_hour
+    """, params)
     return jsonify(rows)
 
 
@@ -259,83 +723,147 @@ def tolls_and_fees():
 @app.route("/api/top-routes")
 def top_routes():
     limit = request.args.get("limit", 15, type=int)
-    rows = query("""
+    store = column_store()
+    if store is not None:
+        return jsonify(store.top_routes(limit))
+    source, where, params = filtered(ROUTE_SOURCES, "r")
+    rows = query(f"""
         SELECT
             pz.zone_name  AS pickup_zone,
             pz.borough    AS pickup_borough,
             dz.zone_name  AS dropoff_zone,
             dz.borough    AS dropoff_borough,
-            COUNT(*)      AS trip_count
-        FROM trips t
-        JOIN zones pz ON t.pickup_zone_id  = pz.zone_id
-        JOIN zones dz ON t.dropoff_zone_id = dz.zone_id
-        GROUP BY t.pickup_zone_id, t.dropoff_zone_id
-        ORDER BY trip_count DESC
+            SUM(r.trip_count) AS trip_count
+        FROM {source} r
+        JOIN zones pz ON r.pickup_zone_id  = pz.zone_id
+        JOIN zones dz ON r.dropoff_zone_id = dz.zone_id
+        {where}
+        GROUP BY r.pickup_zone_id, r.dropoff_zone_id
+        ORDER BY trip_count DESC, r.pickup_zone_id, r.dropoff_zone_id
         LIMIT ?
-    """, (limit,))
+    """, (*params, limit))
     return jsonify(rows)
 
 
 @app.route("/api/demand-by-hour-borough")
 def demand_by_hour_borough():
-    rows = query("""
+    store = column_store()
+    if store is not None:
+        return jsonify(store.demand_by_hour_borough())
+    source, where, params = filtered(ZONE_HOUR_SOURCES, "r")
+    rows = query(f"""
         SELECT
             z.borough,
-            t.pickup_hour  AS hour,
-            COUNT(*)       AS trip_count
-        FROM trips t
-        JOIN zones z ON t.pickup_zone_id = z.zone_id
-        GROUP BY z.borough, t.pickup_hour
-        ORDER BY z.borough, t.pickup_hour
-    """)
+            r.pickup_hour  AS hour,
+            SUM(r.trip_count) AS trip_count
+        FROM {source} r
+        JOIN zones z ON r.pickup_zone_id = z.zone_id
+        {where}
+        GROUP BY z.borough, r.pickup_hour
+        ORDER BY z.borough, r.pickup_hour
+    """, params)
     return jsonify(rows)
 
 
 @app.route("/api/demand-weekday-weekend-by-zone")
 def demand_weekday_weekend_by_zone():
     limit = request.args.get("limit", 20, type=int)
-    rows = query("""
+    store = column_store()
+    if store is not None:
+        return jsonify(store.demand_weekday_weekend_by_zone(limit))
+    source, where, params = filtered(ZONE_HOUR_SOURCES, "r")
+    rows = query(f"""
         SELECT
             z.zone_name,
             z.borough,
-            SUM(CASE WHEN t.pickup_day_of_week NOT IN ('Saturday','Sunday')
-                     THEN 1 ELSE 0 END) AS weekday_trips,
-            SUM(CASE WHEN t.pickup_day_of_week IN ('Saturday','Sunday')
-                     THEN 1 ELSE 0 END) AS weekend_trips,
-            COUNT(*) AS total_trips
-        FROM trips t
-        JOIN zones z ON t.pickup_zone_id = z.zone_id
+            SUM(CASE WHEN r.pickup_dow NOT IN {WEEKEND_DAYS}
+                     THEN r.trip_count ELSE 0 END) AS weekday_trips,
+            SUM(CASE WHEN r.pickup_dow IN {WEEKEND_DAYS}
+                     THEN r.trip_count ELSE 0 END) AS weekend_trips,
+            SUM(r.trip_count) AS total_trips
+        FROM {source} r
+        JOIN zones z ON r.pickup_zone_id = z.zone_id
+        {where}
         GROUP BY z.zone_id
-        ORDER BY total_trips DESC
+        ORDER BY total_trips DESC, z.zone_id
         LIMIT ?
-    """, (limit,))
+    """, (*params, limit))
     return jsonify(rows)
 
 
 
+def zone_geometry_path(level, fmt):
+    #the full-resolution file only exists as GeoJSON; output from before the
+    #simplified levels existed only has that one
+    full = PIPELINE_OUTPUT_DIR / "processed_zones.geojson"
+    if level == "full":
+        return full
+    path = PIPELINE_OUTPUT_DIR / f"processed_zones.{level}.{fmt}"
+    return path if path.exists() else full
+
+
 @app.route("/api/geojson")
 def geojson():
-    geojson_path = Path(__file__).resolve().parents[1] / "data_pipeline" / "output" / "processed_zones.geojson"
+    """
+    Zone shapes with trip stats → choropleth map.
+    ?level=full|high|medium|low picks the geometry detail (default full) and
+    ?format=geojson|topojson the encoding (default geojson).
+    """
+    level = request.args.get("level", "full")
+    fmt = request.args.get("format", "geojson")
+    if level not in GEOMETRY_LEVELS:
+        return jsonify({"error": f"level must be one of {', '.join(GEOMETRY_LEVELS)}"}), 400
+    if fmt not in GEOMETRY_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(GEOMETRY_FORMATS)}"}), 400
+
+    geojson_path = zone_geometry_path(level, fmt)
     if not geojson_path.exists():
         return jsonify({"error": "GeoJSON file not found"}), 404
-
+    if request_filter().active:
+        #stats of a filter: built for this request (the response cache keeps it)
+        return jsonify(zone_geometry_with_stats(geojson_path))
+
+    #sent from its own files below, not kept by the response cache
+    skip_response_cache()
+    version = (data_version(), _response_cache.file_identity(geojson_path))
+    payload = zone_payloads.get(
+        f"zones.{level}.{fmt}", version, lambda: app.json.response(zone_geometry_with_stats(geojson_path)).get_data(),
+    )
+    encoding = payload.encoding_for(request.accept_encodings)
+    etag = payload.etag if encoding == "identity" else f"{payload.etag}-{encoding}"
+    response = send_file(payload.files[encoding], mimetype="application/json", etag=etag, conditional=True)
+    del response.headers["Content-Disposition"]
+    if encoding != "identity":
+        response.content_encoding = encoding
+    response.vary.add("Accept-Encoding")
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def zone_geometry_with_stats(geojson_path):
+    #the zone geometry file with each zone's trip stats added to its properties
     # Build a lookup of zone stats from the database
-    stats = query("""
+    store = column_store()
+    pickups, pickup_where, pickup_params = filtered(ZONE_HOUR_SOURCES)
+    dropoffs, dropoff_where, dropoff_params = filtered(ROUTE_SOURCES)
+    stats = store.geojson_stats() if store is not None else query(f"""
         WITH pickup AS (
             SELECT
                 pickup_zone_id AS zone_id,
-                COUNT(*) AS pickup_count,
-                AVG(fare_amount) AS avg_fare,
-                AVG(trip_distance) AS avg_distance,
-                AVG(trip_duration_min) AS avg_duration_min
-            FROM trips
+                SUM(trip_count) AS pickup_count,
+                SUM(fare_amount_sum) / SUM(fare_amount_n) AS avg_fare,
+                SUM(trip_distance_sum) / SUM(trip_distance_n) AS avg_distance,
+                SUM(trip_duration_min_sum) / SUM(trip_duration_min_n) AS avg_duration_min
+            FROM {pickups}
+            {pickup_where}
             GROUP BY pickup_zone_id
         ),
         dropoff AS (
             SELECT
                 dropoff_zone_id AS zone_id,
-                COUNT(*) AS dropoff_count
-            FROM trips
+                SUM(trip_count) AS dropoff_count
+            FROM {dropoffs}
+            {dropoff_where}
             GROUP BY dropoff_zone_id
         )
         SELECT
@@ -350,7 +878,7 @@ def geojson():
         FROM zones z
         LEFT JOIN pickup p ON p.zone_id = z.zone_id
         LEFT JOIN dropoff d ON d.zone_id = z.zone_id
-    """)
+    """, pickup_params + dropoff_params)
     stats_by_id = {row["zone_id"]: row for row in stats}
 
     import json
@@ -358,7 +886,11 @@ def geojson():
         data = json.load(f)
 
     # Attach stats + ensure we expose zone_id in each feature
-    for feature in data.get("features", []):
+    if data.get("type") == "Topology":
+        features = [g for obj in data["objects"].values() for g in obj.get("geometries", [])]
+    else:
+        features = data.get("features", [])
+    for feature in features:
         props = feature.get("properties", {})
         zone_id = props.get("LocationID") or props.get("zone_id")
         if zone_id is not None:
@@ -367,7 +899,104 @@ def geojson():
             props.update(stats_by_id.get(zone_id, {}))
         feature["properties"] = props
 
-    return jsonify(data)
+    return data
+
+
+#groupings /api/dashboard datasets can share → the query returning their rows
+SHARED_SCANS = {
+    "pickup_zone": zone_stats_rows,
+}
+
+
+def run_datasets(datasets):
+    """
+    Answer [(name, params), ...] of DASHBOARD_DATASETS one after another, each
+    as a request of its own (own connection, response cache and all).
+    Datasets of one grouping share its scan (shared_scan).
+    Returns [(name, response, seconds, cacheable), ...].
+    """
+    results = []
+    #only a group of several datasets shares its scan
+    _dashboard_group.scans = {} if len(datasets) > 1 else None
+    try:
+        for name, params in datasets:
+            start = time.perf_counter()
+            with app.test_request_context(f"/api/{name}", query_string=params):
+                response = app.full_dispatch_request()
+                cacheable = not g.get("_skip_response_cache")
+            #a send_file response (geojson) still has its body in a file
+            response.direct_passthrough = False
+            response.get_data()
+            results.append((name, response, time.perf_counter() - start, cacheable))
+    finally:
+        _dashboard_group.scans = None
+    return results
+
+
+@app.route("/api/dashboard")
+def dashboard():
+    """
+    Several datasets in one response.  ?datasets=summary,trips-by-hour,...
+    names routes of DASHBOARD_DATASETS; <name>.<param>=value passes a
+    parameter to one of them (?top-routes.limit=10), and the filter
+    parameters (trip_filters.py) apply to all of them.  Returns
+    {"datasets": {name: the route's JSON}}, "errors": {name: {"status", ...}}
+    for routes that failed, and with ?debug=1 "debug": per-dataset timings.
+    """
+    names = [name for name in request.args.get("datasets", "").split(",") if name]
+    unknown = [name for name in names if name not in DASHBOARD_DATASETS]
+    if not names or unknown:
+        return jsonify({
+            "error": f"datasets must be a comma-separated list of {', '.join(DASHBOARD_DATASETS)}",
+            "unknown": unknown,
+        }), 400
+    debug = request.args.get("debug", type=int) == 1
+    names = list(dict.fromkeys(names))
+    #rejects a bad filter once, rather than in every dataset
+    request_filter()
+    params = {name: [] for name in names}
+    for key, value in request.args.items(multi=True):
+        name, _, param = key.partition(".")
+        if param and name in params:
+            params[name].append((param, value))
+    shared = [(key, value) for key, value in request.args.items(multi=True) if key in _trip_filters.FILTER_PARAMS]
+    for name in names:
+        own = {param for param, _ in params[name]}
+        params[name] = [(key, value) for key, value in shared if key not in own] + params[name]
+
+    start = time.perf_counter()
+    groups = {}
+    for name in names:
+        groups.setdefault(DASHBOARD_DATASETS[name] or name, []).append((name, params[name]))
+    results = {
+        name: result
+        for batch in dashboard_workers.map(run_datasets, groups.values())
+        for name, *result in batch
+    }
+
+    datasets, errors, timings = [], {}, {}
+    for name in names:
+        response, seconds, cacheable = results[name]
+        timings[name] = round(seconds * 1000, 2)
+        if not cacheable:
+            skip_response_cache()
+        if response.status_code == 200:
+            #the route's JSON as it is, without parsing it again
+            datasets.append(f"{app.json.dumps(name)}:{response.get_data(as_text=True).rstrip()}")
+        else:
+            errors[name] = {"status": response.status_code, **(response.get_json(silent=True) or {})}
+    body = '{"datasets":{' + ",".join(datasets) + "}"
+    if errors:
+        body += ',"errors":' + app.json.dumps(errors)
+    if debug:
+        #timings are of this request only
+        skip_response_cache()
+        body += ',"debug":' + app.json.dumps({
+            "timings_ms": timings,
+            "total_ms": round((time.perf_counter() - start) * 1000, 2),
+            "shared_scans": {scan: [name for name, _ in group] for scan, group in groups.items() if len(group) > 1},
+        })
+    return app.response_class(body + "}\n", mimetype="application/json")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,429 @@
+"""
+column_store.py – NumPy engine for the aggregate endpoints
+----------------------------------------------------------
+Loads the rollup tables (database/rollups.sql) into NumPy arrays once per
+database file and answers the aggregate /api/ routes with ``np.bincount``
+instead of SQL.  API.py uses it when started with API_ENGINE=numpy.
+
+The answers are the same JSON, byte for byte, as the SQLite queries:
+
+- a float sum adds the same rollup rows in the same order as SQLite walks
+  them for that query (rowid order, or one of the rollup indexes), so every
+  partial sum is the same double.  bincount adds its weights one by one in
+  array order, like SQLite's SUM();
+- ROUND(x, 2) is left to SQLite, whose rounding of halfway values differs
+  from Python's round() (and between SQLite versions).
+
+Databases without the rollup tables (PRAGMA user_version < 1) are not
+loaded; API.py answers them from SQLite.
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import closing
+
+import numpy as np
+
+
+#the measures of rollup_zone_hour, as in API.ROLLUP_MEASURES
+MEASURES = (
+    "fare_amount", "total_amount", "trip_distance", "trip_duration_min", "speed_mph",
+    "cost_per_mile", "tip_percentage", "tolls_amount", "extra", "congestion_surcharge",
+)
+DAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+WEEKEND_DAYS = (5, 6)
+
+#NULL keys are stored as -1, which also sorts them first, as SQLite does
+NULL_KEY = -1
+
+#most ROUND() calls SQLite is asked for in one statement
+_ROUND_BATCH = 500
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(db_path):
+    """The ColumnStore of ``db_path``, loaded on first use and again whenever the file changes."""
+    st = os.stat(db_path)
+    version = (st.st_ino, st.st_mtime_ns, st.st_size)
+    with _stores_lock:
+        cached = _stores.get(str(db_path))
+        if cached is None or cached[0] != version:
+            with closing(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)) as conn:
+                cached = _stores[str(db_path)] = (version, ColumnStore(conn))
+    return cached[1]
+
+
+def sqlite_round(values, digits=2):
+    #ROUND(value, digits) as SQLite computes it, for a list of floats or None
+    values = [None if v is None else float(v) for v in values]
+    rounded = []
+    with closing(sqlite3.connect(":memory:")) as conn:
+        for start in range(0, len(values), _ROUND_BATCH):
+            batch = values[start:start + _ROUND_BATCH]
+            sql = "SELECT " + ", ".join(f"ROUND(?, {digits})" for _ in batch)
+            rounded.extend(conn.execute(sql, batch).fetchone())
+    return rounded
+
+
+def _fetch_columns(conn, sql, names):
+    #query result as {name: float64 array}; NULL becomes NaN
+    rows = conn.execute(sql).fetchall()
+    table = np.array(rows, dtype=np.float64).reshape(len(rows), len(names))
+    return {name: table[:, i] for i, name in enumerate(names)}
+
+
+def _keys(values):
+    #float column of integer keys → int64, NULL → NULL_KEY
+    return np.where(np.isnan(values), NULL_KEY, values).astype(np.int64)
+
+
+def _null_first(value):
+    #sort key that orders None before everything else, as SQLite orders NULL
+    return (value is not None, value)
+
+
+def _limit(rows, limit):
+    #LIMIT ?: a negative limit means no limit in SQLite
+    return rows if limit < 0 else rows[:limit]
+
+
+class ColumnStore:
+    """
+    rollup_zone_hour and rollup_routes as NumPy columns, plus the zones
+    table.  Methods are named after the API routes they answer and return
+    what ``query()`` would: a list of dicts (or one dict).
+    """
+
+    def __init__(self, conn):
+        zones = conn.execute("SELECT zone_id, zone_name, borough FROM zones ORDER BY zone_id").fetchall()
+        self.zone_ids = np.array([z[0] for z in zones], dtype=np.int64)
+        self.zone_names = [z[1] for z in zones]
+        self.zone_boroughs = [z[2] for z in zones]
+
+        #zones are JOINed by position: zone id → index into the zones lists
+        #(-1 for ids that are not in zones, whose rows the JOIN drops)
+        self._zone_index = np.full(int(self.zone_ids.max(initial=0)) + 2, -1, dtype=np.int64)
+        self._zone_index[self.zone_ids] = np.arange(len(zones))
+
+        #boroughs in the order of idx_zones_borough, NULL first
+        self.boroughs = sorted(set(self.zone_boroughs), key=_null_first)
+        rank = {borough: i for i, borough in enumerate(self.boroughs)}
+        self._zone_borough = np.array([rank[b] for b in self.zone_boroughs], dtype=np.int64)
+
+        measure_columns = [f"{m}_{part}" for m in MEASURES for part in ("n", "sum")]
+        names = ["pickup_dow", "pickup_hour", "pickup_zone_id", "trip_count", *measure_columns]
+        zh = _fetch_columns(conn, f"SELECT {', '.join(names)} FROM rollup_zone_hour ORDER BY rowid", names)
+        self.dow = _keys(zh["pickup_dow"])
+        self.hour = _keys(zh["pickup_hour"])
+        self.zone = self._zone_of(_keys(zh["pickup_zone_id"]))
+        self.trip_count = zh["trip_count"]
+        #SUM() skips NULL sums; adding 0.0 instead leaves every partial sum as it is
+        self.n = {m: zh[f"{m}_n"] for m in MEASURES}
+        self.sum = {m: np.nan_to_num(zh[f"{m}_sum"], nan=0.0) for m in MEASURES}
+
+        #row orders in which SQLite sums rollup_zone_hour (np.lexsort is
+        #stable, so rows with equal index keys stay in rowid order):
+        #  idx_rollup_zone_hour_hour(pickup_hour, trip_count)
+        self.by_hour = np.lexsort((self.trip_count, self.hour))
+        #  idx_rollup_zone_hour_zone(pickup_zone_id, pickup_dow, pickup_hour, trip_count)
+        self.by_zone = np.lexsort((self.trip_count, self.hour, self.dow, _keys(zh["pickup_zone_id"])))
+        #  zones in idx_zones_borough order, each with its rows as above
+        joined = self.by_zone[self.zone[self.by_zone] >= 0]
+        self.by_borough = joined[np.argsort(self._zone_borough[self.zone[joined]], kind="stable")]
+
+        routes = _fetch_columns(
+            conn, "SELECT pickup_zone_id, dropoff_zone_id, trip_count FROM rollup_routes",
+            ["pickup_zone_id", "dropoff_zone_id", "trip_count"],
+        )
+        self.route_pickup = self._zone_of(_keys(routes["pickup_zone_id"]))
+        self.route_dropoff = self._zone_of(_keys(routes["dropoff_zone_id"]))
+        self.route_count = routes["trip_count"]
+
+    def _zone_of(self, zone_ids):
+        #index into the zones lists for each zone id, -1 if not in zones
+        known = (zone_ids >= 0) & (zone_ids < len(self._zone_index))
+        return np.where(known, self._zone_index[np.where(known, zone_ids, 0)], -1)
+
+    def _aggregate(self, order, keys, size, measures=()):
+        """
+        Group the rollup_zone_hour rows ``order`` by ``keys`` (0 .. size-1, in
+        the order's row order).  Returns the rows per group, SUM(trip_count)
+        and SUM(<m>_sum) / SUM(<m>_n) per measure (None where the SQL gives
+        NULL).  Also returns the raw sums as ``total_<m>``.
+        """
+        keys = keys[order]
+        result = {
+            "rows": np.bincount(keys, minlength=size),
+            "trip_count": np.bincount(keys, weights=self.trip_count[order], minlength=size).astype(np.int64),
+        }
+        for m in measures:
+            n = np.bincount(keys, weights=self.n[m][order], minlength=size)
+            total = np.bincount(keys, weights=self.sum[m][order], minlength=size)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                avg = total / n
+            result[m] = [v if count else None for v, count in zip(avg.tolist(), n.tolist())]
+            result[f"total_{m}"] = [v if count else None for v, count in zip(total.tolist(), n.tolist())]
+        return result
+
+    def _rounded(self, groups, names, indices):
+        #ROUND(.., 2) of groups[name][i] for every name, one SQLite call
+        values = [groups[name][i] for i in indices for name in names]
+        rounded = iter(sqlite_round(values))
+        return [{name: next(rounded) for name in names} for _ in indices]
+
+    def _by_zone(self, measures=()):
+        #aggregates of the rows whose zone is in zones, per zone index
+        order = self.by_zone[self.zone[self.by_zone] >= 0]
+        return self._aggregate(order, self.zone, len(self.zone_ids), measures)
+
+    def _by_hour(self, measures=()):
+        #aggregates per hour; key 0 is NULL, key h + 1 is hour h
+        return self._aggregate(self.by_hour, self.hour + 1, int(self.hour.max(initial=0)) + 2, measures)
+
+    def summary(self):
+        order = np.arange(len(self.trip_count))
+        groups = self._aggregate(order, np.zeros_like(self.hour), 1, ("fare_amount", "trip_distance", "trip_duration_min", "speed_mph"))
+        rounded = self._rounded(groups, ["fare_amount", "trip_distance", "trip_duration_min", "speed_mph"], [0])[0]
+        return {
+            "total_trips": int(groups["trip_count"][0]),
+            "avg_fare": rounded["fare_amount"],
+            "avg_distance": rounded["trip_distance"],
+            "avg_duration_min": rounded["trip_duration_min"],
+            "avg_speed_mph": rounded["speed_mph"],
+        }
+
+    def trips_by_hour(self):
+        groups = self._by_hour()
+        return [
+            {"hour": key - 1 if key else None, "trip_count": int(groups["trip_count"][key])}
+            for key in np.flatnonzero(groups["rows"]).tolist()
+        ]
+
+    def trips_by_day(self):
+        groups = self._aggregate(np.arange(len(self.dow)), self.dow + 1, len(DAY_NAMES) + 1)
+        return [
+            {"day": DAY_NAMES[key - 1] if key else None, "trip_count": int(groups["trip_count"][key])}
+            for key in np.flatnonzero(groups["rows"]).tolist()
+        ]
+
+    def peak_hours(self):
+        groups = self._by_hour(("fare_amount", "total_amount"))
+        keys = np.flatnonzero(groups["rows"]).tolist()
+        groups["total_revenue"] = groups["total_total_amount"]
+        rounded = self._rounded(groups, ["fare_amount", "total_revenue"], keys)
+        rows = [
+            {
+                "hour": key - 1 if key else None,
+                "trip_count": int(groups["trip_count"][key]),
+                "avg_fare": r["fare_amount"],
+                "total_revenue": r["total_revenue"],
+            }
+            for key, r in zip(keys, rounded)
+        ]
+        rows.sort(key=lambda row: _null_first(row["hour"]))
+        rows.sort(key=lambda row: row["trip_count"], reverse=True)
+        return rows[:5]
+
+    def weekday_vs_weekend(self):
+        weekend = np.isin(self.dow, WEEKEND_DAYS).astype(np.int64)
+        measures = ("fare_amount", "trip_duration_min", "trip_distance")
+        groups = self._aggregate(np.arange(len(weekend)), weekend, 2, measures)
+        keys = np.flatnonzero(groups["rows"]).tolist()
+        rounded = self._rounded(groups, list(measures), keys)
+        return [
+            {
+                "period": ("Weekday", "Weekend")[key],
+                "trip_count": int(groups["trip_count"][key]),
+                "avg_fare": r["fare_amount"],
+                "avg_duration_min": r["trip_duration_min"],
+                "avg_distance": r["trip_distance"],
+            }
+            for key, r in zip(keys, rounded)
+        ]
+
+    def _zone_rows(self, groups, present):
+        #(zone index, pickup count) of the zones with rows, count desc then zone id
+        zones = np.flatnonzero(present)
+        counts = groups["trip_count"][zones]
+        ordered = np.lexsort((self.zone_ids[zones], -counts))
+        return zones[ordered].tolist()
+
+    def zone_stats(self):
+        measures = ("fare_amount", "trip_distance", "trip_duration_min")
+        groups = self._by_zone(measures)
+        zones = self._zone_rows(groups, groups["rows"])
+        rounded = self._rounded(groups, list(measures), zones)
+        return [
+            {
+                "zone_id": int(self.zone_ids[z]),
+                "zone_name": self.zone_names[z],
+                "borough": self.zone_boroughs[z],
+                "pickup_count": int(groups["trip_count"][z]),
+                "avg_fare": r["fare_amount"],
+                "avg_distance": r["trip_distance"],
+                "avg_duration_min": r["trip_duration_min"],
+            }
+            for z, r in zip(zones, rounded)
+        ]
+
+    def top_pickup_zones(self, limit):
+        groups = self._by_zone()
+        return [
+            {
+                "zone_name": self.zone_names[z],
+                "borough": self.zone_boroughs[z],
+                "pickup_count": int(groups["trip_count"][z]),
+            }
+            for z in _limit(self._zone_rows(groups, groups["rows"]), limit)
+        ]
+
+    def _dropoffs(self):
+        #rollup_routes rows and trips per dropoff zone index
+        joined = self.route_dropoff >= 0
+        size = len(self.zone_ids)
+        return {
+            "rows": np.bincount(self.route_dropoff[joined], minlength=size),
+            "trip_count": np.bincount(
+                self.route_dropoff[joined], weights=self.route_count[joined], minlength=size
+            ).astype(np.int64),
+        }
+
+    def top_dropoff_zones(self, limit):
+        groups = self._dropoffs()
+        return [
+            {
+                "zone_name": self.zone_names[z],
+                "borough": self.zone_boroughs[z],
+                "dropoff_count": int(groups["trip_count"][z]),
+            }
+            for z in _limit(self._zone_rows(groups, groups["rows"]), limit)
+        ]
+
+    def _borough_rows(self, measures, names):
+        groups = self._aggregate(self.by_borough, self._zone_borough[self.zone], len(self.boroughs), measures)
+        keys = np.flatnonzero(groups["rows"]).tolist()
+        rows = []
+        for key, r in zip(keys, self._rounded(groups, list(measures), keys)):
+            row = {"borough": self.boroughs[key], "trip_count": int(groups["trip_count"][key])}
+            row.update((name, r[m]) for name, m in zip(names, measures))
+            rows.append(row)
+        return rows
+
+    def borough_stats(self):
+        rows = self._borough_rows(
+            ("fare_amount", "trip_distance", "trip_duration_min", "speed_mph"),
+            ("avg_fare", "avg_distance", "avg_duration_min", "avg_speed_mph"),
+        )
+        rows.sort(key=lambda row: row["trip_count"], reverse=True)
+        return rows
+
+    def avg_fare_by_borough(self):
+        rows = self._borough_rows(
+            ("fare_amount", "total_amount", "cost_per_mile", "tip_percentage"),
+            ("avg_fare", "avg_total", "avg_cost_per_mile", "avg_tip_pct"),
+        )
+        for row in rows:
+            del row["trip_count"]
+        rows.sort(key=lambda row: _null_first(row["avg_fare"]), reverse=True)
+        return rows
+
+    def tolls_and_fees(self):
+        measures = ("tolls_amount", "extra", "congestion_surcharge")
+        groups = self._by_hour(measures)
+        keys = np.flatnonzero(groups["rows"]).tolist()
+        rounded = self._rounded(groups, [*measures, "total_tolls_amount"], keys)
+        rows = [
+            {
+                "hour": key - 1 if key else None,
+                "avg_tolls": r["tolls_amount"],
+                "avg_extra": r["extra"],
+                "avg_congestion": r["congestion_surcharge"],
+                "total_tolls": r["total_tolls_amount"],
+            }
+            for key, r in zip(keys, rounded)
+        ]
+        rows.sort(key=lambda row: _null_first(row["total_tolls"]), reverse=True)
+        return rows
+
+    def top_routes(self, limit):
+        joined = (self.route_pickup >= 0) & (self.route_dropoff >= 0)
+        size = len(self.zone_ids)
+        routes = self.route_pickup[joined] * size + self.route_dropoff[joined]
+        present = np.bincount(routes, minlength=size * size)
+        counts = np.bincount(routes, weights=self.route_count[joined], minlength=size * size).astype(np.int64)
+        keys = np.flatnonzero(present)
+        #zone indices follow zone id order, so key order is (pickup id, dropoff id) order
+        keys = keys[np.argsort(-counts[keys], kind="stable")]
+        rows = []
+        for key in _limit(keys.tolist(), limit):
+            pickup, dropoff = divmod(key, size)
+            rows.append({
+                "pickup_zone": self.zone_names[pickup],
+                "pickup_borough": self.zone_boroughs[pickup],
+                "dropoff_zone": self.zone_names[dropoff],
+                "dropoff_borough": self.zone_boroughs[dropoff],
+                "trip_count": int(counts[key]),
+            })
+        return rows
+
+    def demand_by_hour_borough(self):
+        joined = self.zone >= 0
+        hours = int(self.hour.max(initial=0)) + 2
+        keys = self._zone_borough[self.zone[joined]] * hours + self.hour[joined] + 1
+        present = np.bincount(keys, minlength=len(self.boroughs) * hours)
+        counts = np.bincount(keys, weights=self.trip_count[joined], minlength=len(present)).astype(np.int64)
+        rows = []
+        for key in np.flatnonzero(present).tolist():
+            borough, hour = divmod(key, hours)
+            rows.append({
+                "borough": self.boroughs[borough],
+                "hour": hour - 1 if hour else None,
+                "trip_count": int(counts[key]),
+            })
+        return rows
+
+    def demand_weekday_weekend_by_zone(self, limit):
+        groups = self._by_zone()
+        #NULL days count in neither column, as the CASE in the SQL
+        weekend = np.isin(self.dow, WEEKEND_DAYS)
+        weekday = (self.dow != NULL_KEY) & ~weekend
+        joined = self.zone >= 0
+        size = len(self.zone_ids)
+        weekday_trips = np.bincount(self.zone[joined & weekday], weights=self.trip_count[joined & weekday], minlength=size)
+        weekend_trips = np.bincount(self.zone[joined & weekend], weights=self.trip_count[joined & weekend], minlength=size)
+        return [
+            {
+                "zone_name": self.zone_names[z],
+                "borough": self.zone_boroughs[z],
+                "weekday_trips": int(weekday_trips[z]),
+                "weekend_trips": int(weekend_trips[z]),
+                "total_trips": int(groups["trip_count"][z]),
+            }
+            for z in _limit(self._zone_rows(groups, groups["rows"]), limit)
+        ]
+
+    def geojson_stats(self):
+        """The per-zone stats /api/geojson attaches to the map features, for every zone."""
+        measures = ("fare_amount", "trip_distance", "trip_duration_min")
+        groups = self._by_zone(measures)
+        dropoffs = self._dropoffs()
+        for m in measures:
+            groups[m] = [0 if v is None else v for v in groups[m]]
+        zones = list(range(len(self.zone_ids)))
+        rounded = self._rounded(groups, list(measures), zones)
+        return [
+            {
+                "zone_id": int(self.zone_ids[z]),
+                "zone_name": self.zone_names[z],
+                "borough": self.zone_boroughs[z],
+                "pickup_count": int(groups["trip_count"][z]),
+                "avg_fare": r["fare_amount"],
+                "avg_distance": r["trip_distance"],
+                "avg_duration_min": r["trip_duration_min"],
+                "dropoff_count": int(dropoffs["trip_count"][z]),
+            }
+            for z, r in zip(zones, rounded)
+        ]
@@ -0,0 +1,107 @@
+"""
+db_pool.py – Read-only SQLite connections kept between requests
+---------------------------------------------------------------
+API.py used to open a connection per request and close it at the end, which
+threw away SQLite's page cache and parsed schema every time.  The pool keeps
+idle connections instead and hands one to each request (so to each thread
+serving one); the next request on it starts with a warm cache.
+
+Connections are opened read-only (``mode=ro``) and tuned with ``pragmas``
+(mmap, page cache size, temp tables in memory).  They are not opened
+``immutable``: load_data.py --month / --drop-month write the database in
+place, and SQLite only notices those writes on connections that are not.
+
+Health checks:
+
+- on ``acquire``, a database file with another identity (device and inode;
+  load_data.py builds a new file and renames it over the old one) or another
+  path retires every connection opened on the old one;
+- on ``release``, a connection whose request failed with a database error,
+  or that belongs to a retired file, is closed instead of kept.
+"""
+
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+
+class PooledConnection(sqlite3.Connection):
+    """A connection that knows which database file it was opened on."""
+
+    generation = None
+
+
+def database_identity(path):
+    #the file behind path: changes when another file is renamed over it
+    st = os.stat(path)
+    return (os.path.realpath(path), st.st_dev, st.st_ino)
+
+
+class ConnectionPool:
+    """Idle read-only connections to one database file, at most ``max_idle`` of them."""
+
+    def __init__(self, max_idle=8, pragmas=None):
+        self.max_idle = max_idle
+        self.pragmas = dict(pragmas or {})
+        self.generation = 0
+        self.opened = 0
+        self._identity = None
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self, path):
+        """A connection to the database at ``path``; give it back with ``release``."""
+        #raises FileNotFoundError without a database, as mode=ro would
+        identity = database_identity(path)
+        with self._lock:
+            if identity != self._identity:
+                self._retire()
+                self._identity = identity
+            conn = self._idle.pop() if self._idle else None
+            generation = self.generation
+        if conn is None:
+            conn = self._open(path, generation)
+        return conn
+
+    def release(self, conn, healthy=True):
+        """Return ``conn`` to the pool, or close it if it failed or its file was replaced."""
+        if healthy and conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                healthy = False
+        with self._lock:
+            if healthy and conn.generation == self.generation and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def clear(self):
+        """Close every idle connection; connections in use are closed when released."""
+        with self._lock:
+            self._retire()
+            self._identity = None
+
+    def __len__(self):
+        return len(self._idle)
+
+    def _retire(self):
+        #called with the lock held
+        self.generation += 1
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _open(self, path, generation):
+        #check_same_thread=False: a connection serves whichever thread acquires it next
+        conn = sqlite3.connect(
+            Path(path).resolve().as_uri() + "?mode=ro", uri=True, factory=PooledConnection, check_same_thread=False,
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        conn.row_factory = sqlite3.Row
+        conn.generation = generation
+        with self._lock:
+            self.opened += 1
+        return conn
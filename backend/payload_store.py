@@ -0,0 +1,110 @@
+"""
+payload_store.py – Pre-compressed response bodies on disk
+---------------------------------------------------------
+For responses too big to build per request (the enriched zone geometry of
+/api/geojson), API.py builds the body once per data version and keeps it
+here as files: the body itself, gzip and, when the brotli package is
+installed, brotli.  Requests are then answered with send_file in the
+encoding the client accepts, without serializing or compressing anything.
+
+Files are named after the body's hash, so processes sharing the directory
+write the same file for the same body, and a rebuilt body never overwrites
+one still being sent.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import NamedTuple
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+
+#preferred first
+ENCODINGS = ("br", "gzip", "identity")
+SUFFIXES = {"br": ".br", "gzip": ".gz", "identity": ""}
+#brotli's 10 and 11 are several times slower than 9 for a few percent, too
+#slow for a body built on the request that needs it
+BROTLI_QUALITY = 9
+
+
+class Payload(NamedTuple):
+    version: object
+    etag: str  # of the uncompressed body
+    files: dict  # {encoding: path}
+
+    def encoding_for(self, accept_encodings):
+        """The best encoding in ``files`` that a request's Accept-Encoding allows."""
+        for encoding in ENCODINGS:
+            if encoding in self.files and (encoding == "identity" or accept_encodings[encoding] > 0):
+                return encoding
+        return "identity"
+
+
+def compress(body, encoding):
+    if encoding == "gzip":
+        #mtime=0: the same body always gives the same bytes
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return body
+
+
+def _write(path, data):
+    #written next to its final name and renamed, so a reader never sees half a file
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class PayloadStore:
+    """Bodies by key, each valid for one version; ``get`` rebuilds them when the version changes."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.builds = 0
+        self._payloads = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, version, build):
+        """
+        The payload called ``name`` (also its file name prefix) for ``version``.
+        ``build()`` returns the uncompressed body and is only called when
+        there is none for this version yet or its files have gone.
+        """
+        with self._lock:
+            payload = self._payloads.get(name)
+            if payload is not None and payload.version == version and all(
+                os.path.exists(path) for path in payload.files.values()
+            ):
+                return payload
+            payload = self._build(name, version, build())
+            self._payloads[name] = payload
+            return payload
+
+    def _build(self, name, version, body):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        etag = hashlib.sha1(body).hexdigest()
+        files = {}
+        for encoding in ENCODINGS:
+            if encoding == "br" and brotli is None:
+                continue
+            path = self.directory / f"{name}.{etag[:16]}.json{SUFFIXES[encoding]}"
+            if not path.exists():
+                _write(path, compress(body, encoding))
+            files[encoding] = path
+        self.builds += 1
+        #earlier bodies of the same payload
+        for path in self.directory.glob(f"{name}.*"):
+            if path not in files.values() and not path.name.endswith(".tmp"):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+        return Payload(version, etag, files)
@@ -0,0 +1,95 @@
+"""
+response_cache.py – Cache of API responses
+------------------------------------------
+The dashboard's data only changes when database/load_data.py runs, so API.py
+keeps finished /api/ responses here and answers repeat requests without
+running their SQL.
+
+Entries are keyed by route plus query parameters and stamped with the data
+version they were computed from (API.data_version()); a request for another
+version clears the cache.  Least recently used entries are evicted once the
+cache holds more than ``max_entries`` responses or ``max_bytes`` of bodies.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    mimetype: str
+    etag: str
+
+
+def file_identity(path):
+    #changes whenever the file is replaced or written to; None if it is missing
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def normalized_args(args):
+    #query parameters in a canonical order, so ?a=1&b=2 and ?b=2&a=1 share an entry
+    return tuple(sorted(args.items(multi=True)))
+
+
+class ResponseCache:
+    """LRU cache of response bodies, bounded by entry count and total body size."""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """The entry for ``key`` computed from data ``version``, or None."""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, version, entry):
+        with self._lock:
+            #computed from data that has been replaced since
+            if version != self.version:
+                return
+            if len(entry.body) > self.max_bytes or self.max_entries <= 0:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += len(entry.body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_version(self, version):
+        #entries of another data version are stale
+        if version != self.version:
+            self._entries.clear()
+            self._bytes = 0
+            self.version = version
+
+    def _remove(self, key):
+        self._bytes -= len(self._entries.pop(key).body)
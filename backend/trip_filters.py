@@ -0,0 +1,214 @@
+"""
+trip_filters.py – Filters shared by the aggregate endpoints
+-----------------------------------------------------------
+Every aggregate /api/ route accepts the same filter parameters:
+
+    start=YYYY-MM-DD, end=YYYY-MM-DD   pickup date range, both days included
+    borough=Manhattan,Brooklyn         pickup borough(s)
+    hour_from=7, hour_to=10            pickup hour window, both hours included;
+                                       wraps past midnight when hour_from > hour_to
+    payment_type=1,2                   payment type code(s)
+
+``parse_filter`` reads them once per request into a TripFilter.
+``choose_source`` picks the coarsest table that still has every column the
+filter needs: a rollup when it can, otherwise the trips themselves.
+``where`` compiles the filter into a parameterized WHERE clause for that table.
+
+The predicates are written so SQLite can use the indexes: ranges and IN
+lists on the stored columns, never a function of a column.  Dates become
+pickup_month ranges where whole months are selected, since every rollup is
+indexed by month.
+"""
+
+import calendar
+from datetime import date, timedelta
+from typing import NamedTuple
+
+
+FILTER_PARAMS = ("start", "end", "borough", "hour_from", "hour_to", "payment_type")
+
+#the filterable columns of each table the API aggregates; "trips" is one row
+#per trip (the compact partitions, or the trips table of older databases)
+SOURCE_COLUMNS = {
+    "rollup_zone_hour": {"pickup_month", "pickup_hour", "pickup_zone_id"},
+    "rollup_trips": {"pickup_month", "pickup_date", "pickup_hour", "pickup_zone_id", "payment_type"},
+    "rollup_routes": {"pickup_month", "pickup_zone_id"},
+    "trip_sample_months": {"pickup_month"},
+    "trip_samples": {"pickup_month", "pickup_date", "pickup_hour", "pickup_zone_id", "payment_type"},
+    "trips": {"pickup_month", "pickup_date", "pickup_hour", "pickup_zone_id", "payment_type"},
+}
+#sources that store the pickup time (pickup_ts epoch seconds, or the
+#pickup_datetime text of older trips tables) rather than month and date
+TIMESTAMP_SOURCES = ("trips", "trip_samples")
+
+
+class FilterError(ValueError):
+    """A filter parameter that cannot be parsed; the API answers 400."""
+
+
+class TripFilter(NamedTuple):
+    start: date = None
+    end: date = None  # included
+    boroughs: tuple = ()
+    hours: tuple = ()  # the pickup hours in the window
+    payment_types: tuple = ()
+
+    @property
+    def active(self):
+        return bool(self.start or self.end or self.boroughs or self.hours or self.payment_types)
+
+    @property
+    def whole_months(self):
+        #True if the date range starts and ends on month boundaries
+        return (self.start is None or self.start.day == 1) and (
+            self.end is None or self.end.day == calendar.monthrange(self.end.year, self.end.month)[1]
+        )
+
+    @property
+    def end_exclusive(self):
+        return None if self.end is None else self.end + timedelta(days=1)
+
+    def columns(self):
+        """The columns a table needs for this filter to apply to it."""
+        needed = set()
+        if self.start or self.end:
+            needed.add("pickup_month" if self.whole_months else "pickup_date")
+        if self.boroughs:
+            needed.add("pickup_zone_id")
+        if self.hours:
+            needed.add("pickup_hour")
+        if self.payment_types:
+            needed.add("payment_type")
+        return needed
+
+    def months(self):
+        """First and last pickup month (YYYY-MM) of the date range; None where open."""
+        return (
+            None if self.start is None else self.start.strftime("%Y-%m"),
+            None if self.end is None else self.end.strftime("%Y-%m"),
+        )
+
+
+def _date(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise FilterError(f"{name} must be a date (YYYY-MM-DD), not {value!r}") from None
+
+
+def _list(args, name, cast=str):
+    #comma-separated and/or repeated: ?borough=Queens,Bronx&borough=Manhattan
+    values = []
+    for value in args.getlist(name):
+        for item in value.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            try:
+                values.append(cast(item))
+            except ValueError:
+                raise FilterError(f"{name} must be a list of integers, not {value!r}") from None
+    return tuple(dict.fromkeys(values))
+
+
+def _hour(args, name):
+    value = args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        hour = int(value)
+    except ValueError:
+        hour = -1
+    if not 0 <= hour <= 23:
+        raise FilterError(f"{name} must be an hour from 0 to 23, not {value!r}")
+    return hour
+
+
+def parse_filter(args):
+    """The TripFilter of a request's query parameters; raises FilterError."""
+    start, end = _date(args, "start"), _date(args, "end")
+    if start and end and start > end:
+        raise FilterError("start must not be after end")
+    hour_from, hour_to = _hour(args, "hour_from"), _hour(args, "hour_to")
+    hours = ()
+    if hour_from is not None or hour_to is not None:
+        hour_from = 0 if hour_from is None else hour_from
+        hour_to = 23 if hour_to is None else hour_to
+        if hour_from <= hour_to:
+            hours = tuple(range(hour_from, hour_to + 1))
+        else:
+            hours = tuple(range(hour_from, 24)) + tuple(range(0, hour_to + 1))
+        if len(hours) == 24:
+            hours = ()
+    return TripFilter(start, end, _list(args, "borough"), hours, _list(args, "payment_type", int))
+
+
+def choose_source(trip_filter, candidates):
+    """The first of ``candidates`` (SOURCE_COLUMNS names) with every column the filter needs."""
+    needed = trip_filter.columns()
+    for name in candidates:
+        if needed <= SOURCE_COLUMNS[name]:
+            return name
+    return "trips"
+
+
+def _placeholders(values):
+    return ", ".join("?" * len(values))
+
+
+def where(trip_filter, source, alias=None, compact=True):
+    """
+    WHERE clause and its parameters for ``trip_filter`` on ``source`` (a
+    SOURCE_COLUMNS name, queried as ``alias``); ("", []) without a filter.
+    For "trips", ``compact`` says whether they are the compact partitions
+    (pickup_ts epoch seconds) or the trips table of older databases
+    (pickup_datetime text); trip_samples always have pickup_ts.
+    """
+    if not trip_filter.active:
+        return "", []
+    column = f"{alias}.{{}}".format if alias else "{}".format
+    clauses, params = [], []
+    start, end = trip_filter.start, trip_filter.end_exclusive
+    if start or end:
+        if source in TIMESTAMP_SOURCES:
+            #half-open range on the stored time, as the pickup time index is ordered
+            compact = compact or source == "trip_samples"
+            name = column("pickup_ts" if compact else "pickup_datetime")
+            bound = (lambda d: calendar.timegm(d.timetuple())) if compact else date.isoformat
+            if start:
+                clauses.append(f"{name} >= ?")
+                params.append(bound(start))
+            if end:
+                clauses.append(f"{name} < ?")
+                params.append(bound(end))
+        else:
+            first, last = trip_filter.months()
+            if first:
+                clauses.append(f"{column('pickup_month')} >= ?")
+                params.append(first)
+            if last:
+                clauses.append(f"{column('pickup_month')} <= ?")
+                params.append(last)
+            if not trip_filter.whole_months:
+                if start:
+                    clauses.append(f"{column('pickup_date')} >= ?")
+                    params.append(start.isoformat())
+                if end:
+                    clauses.append(f"{column('pickup_date')} < ?")
+                    params.append(end.isoformat())
+    if trip_filter.boroughs:
+        clauses.append(
+            f"{column('pickup_zone_id')} IN (SELECT zone_id FROM zones WHERE borough IN "
+            f"({_placeholders(trip_filter.boroughs)}))"
+        )
+        params.extend(trip_filter.boroughs)
+    if trip_filter.hours:
+        clauses.append(f"{column('pickup_hour')} IN ({_placeholders(trip_filter.hours)})")
+        params.extend(trip_filter.hours)
+    if trip_filter.payment_types:
+        clauses.append(f"{column('payment_type')} IN ({_placeholders(trip_filter.payment_types)})")
+        params.extend(trip_filter.payment_types)
+    return "WHERE " + " AND ".join(clauses), params
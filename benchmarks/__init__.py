@@ -0,0 +1 @@
+"""Synthetic data and throughput benchmarks for the pipeline and database loader."""
@@ -0,0 +1,220 @@
+"""
+bench_pipeline.py – Pipeline and loader throughput
+--------------------------------------------------
+Times the data pipeline stage by stage and the ``database/load_data.py``
+import on synthetic trip files (see synthetic_data.py), and reports rows per
+second and peak memory for each.  Every case runs in a fresh process, so peak
+RSS is that case's own.
+
+Datasets are generated once per size and seed and reused from
+benchmarks/data/<rows>-seed<seed>/ on later runs.
+
+Usage:
+    python -m benchmarks.bench_pipeline                          # 100k rows
+    python -m benchmarks.bench_pipeline --rows 100000 1000000 10000000 --chunksize 250000
+    python -m benchmarks.bench_pipeline --save before.json
+    python -m benchmarks.bench_pipeline --format database        # pipeline straight into SQLite
+    python -m benchmarks.bench_pipeline --compare before.json    # after a change
+"""
+
+import argparse
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.synthetic_data import DEFAULT_OUTPUT_DIR, trip_file_name, write_dataset
+
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_SIZES = [100_000]
+
+#runs load_data.py in a scratch copy of the project and reports time, rows and peak RSS
+_LOAD_DATA_RUNNER = """
+import json, runpy, sqlite3, sys, time
+result_path = sys.argv[1]
+sys.argv = ["load_data.py"]
+start = time.perf_counter()
+runpy.run_path("load_data.py", run_name="__main__")
+wall = time.perf_counter() - start
+rows = sqlite3.connect("taxi_data.db").execute("SELECT COUNT(*) FROM trips").fetchone()[0]
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+except ImportError:
+    rss = None
+with open(result_path, "w") as f:
+    json.dump({"wall_s": wall, "rows": rows, "max_rss_kb": rss}, f)
+"""
+
+
+def dataset(rows: int, seed: int = 0, data_dir: Path = DEFAULT_OUTPUT_DIR) -> Path:
+    """Directory holding the synthetic trip file and zone lookup for ``rows``; generated on first use."""
+    directory = Path(data_dir) / f"{rows}-seed{seed}"
+    if not (directory / trip_file_name()).exists():
+        print(f"[bench] Generating {rows:,} synthetic trips → {directory}")
+        write_dataset(directory, rows, seed=seed)
+    return directory
+
+
+def bench_pipeline(directory: Path, rows: int, chunksize=None, trips_format="parquet", trace_memory=False) -> dict:
+    """Run the pipeline over one dataset of ``rows`` trips in a fresh process; returns its per-stage records."""
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(_pipeline_case, directory, rows, chunksize, trips_format, trace_memory).result()
+
+
+def _pipeline_case(directory, rows, chunksize, trips_format, trace_memory):
+    import tracemalloc
+
+    from data_pipeline.cleaner import exclusion_reasons
+    from data_pipeline.exclusion_log import ExclusionLog
+    from data_pipeline.export import trips_output_path
+    from data_pipeline.loader import load_zone_lookup, month_window
+    from data_pipeline.pipeline import process_trip_file
+    from data_pipeline.profiling import Profiler, max_rss_mb
+
+    path = directory / trip_file_name()
+    output_dir = directory / "output"
+    output_dir.mkdir(exist_ok=True)
+    #"database": the pipeline's database sink instead of a file for load_data.py
+    if trips_format == "database":
+        trips_path, db_path = None, output_dir / "taxi_data.db"
+    else:
+        trips_path, db_path = trips_output_path(output_dir, trips_format), None
+
+    profiler = Profiler(trace_memory=trace_memory)
+    if trace_memory:
+        tracemalloc.start()
+    with profiler.stage("pipeline", rows_in=rows) as run:
+        zones = load_zone_lookup(directory / "taxi_zone_lookup.csv")
+        log = ExclusionLog(reason_order=exclusion_reasons(month_window(path)))
+        run.rows_out = process_trip_file(
+            path, zones, trips_path, log, chunksize=chunksize, verbose=False, profiler=profiler,
+            db_path=db_path, zone_lookup_path=directory / "taxi_zone_lookup.csv",
+        )
+        with profiler.stage("export.exclusion_log"):
+            log.save(output_dir / "exclusion_log.csv")
+    return {"stages": profiler.records(), "max_rss_mb": max_rss_mb(), "trips_path": str(trips_path or db_path)}
+
+
+def bench_load_data(directory: Path, trips_path: Path) -> dict:
+    """Import ``trips_path`` with database/load_data.py into a throwaway database."""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        shutil.copytree(ROOT / "database", tmp / "database", ignore=shutil.ignore_patterns("*.db", "__pycache__"))
+        (tmp / "data_pipeline" / "output").mkdir(parents=True)
+        shutil.copy(trips_path, tmp / "data_pipeline" / "output" / Path(trips_path).name)
+        shutil.copy(directory / "taxi_zone_lookup.csv", tmp / "taxi_zone_lookup.csv")
+
+        result_path = tmp / "result.json"
+        subprocess.run(
+            [sys.executable, "-c", _LOAD_DATA_RUNNER, str(result_path)],
+            cwd=tmp / "database", check=True, stdout=subprocess.DEVNULL,
+        )
+        with open(result_path) as f:
+            result = json.load(f)
+
+    rss = result.pop("max_rss_kb")
+    #Linux reports kilobytes, macOS bytes
+    result["max_rss_mb"] = rss / (1024 * 1024 if sys.platform == "darwin" else 1024) if rss else None
+    result["rows_per_s"] = round(result["rows"] / result["wall_s"]) if result["wall_s"] else None
+    return result
+
+
+def run_benchmarks(sizes, chunksize=None, trips_format="parquet", trace_memory=False, seed=0, load_data=True) -> dict:
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "chunksize": chunksize,
+        "format": trips_format,
+        "cases": [],
+    }
+    for rows in sizes:
+        directory = dataset(rows, seed)
+        print(f"[bench] Pipeline on {rows:,} rows...")
+        start = time.perf_counter()
+        case = {"rows": rows, "pipeline": bench_pipeline(directory, rows, chunksize, trips_format, trace_memory)}
+        print(f"[bench]   {time.perf_counter() - start:.1f}s")
+        #the database sink already built the database
+        if load_data and trips_format != "database":
+            print(f"[bench] load_data.py on {rows:,} rows...")
+            case["load_data"] = bench_load_data(directory, Path(case["pipeline"]["trips_path"]))
+            print(f"[bench]   {case['load_data']['wall_s']:.1f}s")
+        results["cases"].append(case)
+    return results
+
+
+def print_results(results: dict, baseline: dict = None) -> None:
+    """Table of wall time, rows/s and memory per stage; with ``baseline``, the change in wall time."""
+    before = {}
+    for case in (baseline or {}).get("cases", []):
+        for stage in _stage_rows(case):
+            before[(case["rows"], stage["name"])] = stage["wall_s"]
+
+    header = f"{'rows':>11}  {'stage':<28}{'wall s':>9}{'rows/s':>12}{'peak MB':>9}"
+    if baseline:
+        header += f"{'vs base':>9}"
+    print(header)
+    print("-" * len(header))
+    for case in results["cases"]:
+        for stage in _stage_rows(case):
+            rate = f"{stage['rows_per_s']:,}" if stage.get("rows_per_s") else ""
+            peak = stage.get("peak_mb", stage.get("max_rss_mb"))
+            line = f"{case['rows']:>11,}  {stage['name']:<28}{stage['wall_s']:>9.3f}{rate:>12}{peak or 0:>9.1f}"
+            old = before.get((case["rows"], stage["name"]))
+            if old:
+                line += f"{(stage['wall_s'] - old) / old:>+9.0%}"
+            print(line)
+    print("peak MB is the traced allocation peak with --trace-memory, otherwise the process' max RSS")
+
+
+def _stage_rows(case):
+    stages = list(case["pipeline"]["stages"])
+    if "load_data" in case:
+        stages.append({"name": "load_data.py", **case["load_data"]})
+    return stages
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline and database loader on synthetic data.")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_SIZES, help="dataset sizes (default: 100000)")
+    parser.add_argument("--chunksize", type=int, default=None, help="stream the trip file in chunks of this many rows")
+    parser.add_argument("--format", dest="trips_format", choices=("parquet", "csv", "database"), default="parquet",
+                        help="processed trips format; database writes through the pipeline's database sink")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic datasets")
+    parser.add_argument("--trace-memory", action="store_true", help="record per-stage allocation peaks (slower)")
+    parser.add_argument("--skip-load-data", action="store_true", help="only benchmark the pipeline")
+    parser.add_argument("--save", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--compare", type=Path, help="JSON results of an earlier run to compare against")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    results = run_benchmarks(
+        args.rows,
+        chunksize=args.chunksize,
+        trips_format=args.trips_format,
+        trace_memory=args.trace_memory,
+        seed=args.seed,
+        load_data=not args.skip_load_data,
+    )
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print()
+    print_results(results, baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"[bench] Results → {args.save}")
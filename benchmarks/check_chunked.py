@@ -0,0 +1,73 @@
+"""
+check_chunked.py – Chunked pipeline against a whole-file run
+------------------------------------------------------------
+Runs data_pipeline.pipeline.process_trip_file over one synthetic trip file
+twice, once whole and once in chunks (``chunksize``), both without a
+profiler (so with the NULL_PROFILER the CLI default uses), and checks that
+the two runs write the same trips and exclude the same number of rows for
+each reason.
+
+Usage:
+    python -m benchmarks.check_chunked                       # 20k trips, 3k-row chunks
+    python -m benchmarks.check_chunked --rows 200000 --chunksize 50000
+"""
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.bench_pipeline import dataset
+from benchmarks.synthetic_data import trip_file_name
+from data_pipeline.cleaner import exclusion_reasons
+from data_pipeline.exclusion_log import ExclusionLog
+from data_pipeline.export import trips_output_path
+from data_pipeline.loader import load_zone_lookup, month_window
+from data_pipeline.pipeline import process_trip_file
+
+
+DEFAULT_ROWS = 20_000
+DEFAULT_CHUNKSIZE = 3_000
+
+
+def run(directory: Path, output_dir: Path, chunksize=None):
+    """(trips written, exclusion summary) of one process_trip_file run."""
+    path = directory / trip_file_name()
+    trips_path = trips_output_path(output_dir)
+    log = ExclusionLog(reason_order=exclusion_reasons(month_window(path)))
+    written = process_trip_file(
+        path, load_zone_lookup(directory / "taxi_zone_lookup.csv"), trips_path, log,
+        chunksize=chunksize, verbose=False,
+    )
+    trips = pd.read_parquet(trips_path)
+    print(f"[chunked] {'chunks of ' + format(chunksize, ',') if chunksize else 'whole file':<16} "
+          f"{written:,} trips written, {log.total_excluded:,} excluded")
+    return trips, log.summary().sort_values("reason").reset_index(drop=True)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Compare a chunked pipeline run with a whole-file run.")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="synthetic trips to run on")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="rows per chunk")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic trips")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    directory = dataset(args.rows, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        (tmp / "whole").mkdir()
+        (tmp / "chunked").mkdir()
+        whole_trips, whole_log = run(directory, tmp / "whole")
+        chunked_trips, chunked_log = run(directory, tmp / "chunked", args.chunksize)
+    failures = []
+    if not whole_trips.reset_index(drop=True).equals(chunked_trips.reset_index(drop=True)):
+        failures.append("trips")
+    if not whole_log.equals(chunked_log):
+        failures.append("exclusions per reason")
+    print(f"[chunked] differ: {', '.join(failures)}" if failures else "[chunked] Chunked run matches the whole-file run")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,91 @@
+"""
+check_features.py – engineer_features against a plain pandas reference
+----------------------------------------------------------------------
+Runs data_pipeline.feature_engineering.engineer_features on synthetic trips
+plus a few hand-made edge rows (missing pickup or drop-off, zero distance,
+zero fare, zero duration) and compares every derived column with the
+straightforward pandas version of it: the same values, NaN/NA in the same
+places, and the same day names.
+
+Usage:
+    python -m benchmarks.check_features                  # 20k synthetic trips
+    python -m benchmarks.check_features --rows 200000
+"""
+
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import generate_trips
+from data_pipeline.feature_engineering import engineer_features
+
+
+DEFAULT_ROWS = 20_000
+
+#(pickup, dropoff, trip_distance, fare_amount, tip_amount, total_amount)
+EDGE_ROWS = [
+    (None, "2019-01-01 00:20:00", 1.5, 8.0, 1.0, 10.3),
+    ("2019-01-01 23:50:00", None, 1.5, 8.0, 1.0, 10.3),
+    (None, None, 1.5, 8.0, 1.0, 10.3),
+    ("2019-01-06 12:00:00", "2019-01-06 12:10:00", 0.0, 8.0, 1.0, 10.3),
+    ("2019-01-06 12:00:00", "2019-01-06 12:10:00", 2.0, 0.0, 1.0, 1.3),
+    ("2019-01-07 00:00:00", "2019-01-07 00:00:00", 2.0, 8.0, 0.0, 8.8),
+]
+
+
+def edge_trips() -> pd.DataFrame:
+    return pd.DataFrame(EDGE_ROWS, columns=[
+        "tpep_pickup_datetime", "tpep_dropoff_datetime", "trip_distance", "fare_amount", "tip_amount", "total_amount",
+    ])
+
+
+def reference_features(df: pd.DataFrame) -> dict:
+    """The derived columns computed the obvious way, one pandas operation each."""
+    pu = pd.to_datetime(df["tpep_pickup_datetime"], errors="coerce")
+    do = pd.to_datetime(df["tpep_dropoff_datetime"], errors="coerce")
+    distance = pd.to_numeric(df["trip_distance"], errors="coerce")
+    duration = (do - pu).dt.total_seconds() / 60.0
+    return {
+        "trip_duration_min": duration,
+        "speed_mph": distance / (duration / 60.0).replace(0, np.nan),
+        "cost_per_mile": pd.to_numeric(df["total_amount"], errors="coerce") / distance.replace(0, np.nan),
+        "tip_percentage": pd.to_numeric(df["tip_amount"], errors="coerce")
+        / pd.to_numeric(df["fare_amount"], errors="coerce").replace(0, np.nan) * 100.0,
+        "pickup_hour": pu.dt.hour,
+        "pickup_day_of_week": pu.dt.day_name(),
+    }
+
+
+def compare(df: pd.DataFrame, label: str) -> int:
+    """Print the columns that differ from the reference; returns how many do."""
+    features = engineer_features(df, verbose=False)
+    failures = 0
+    for col, expected in reference_features(df).items():
+        actual = features[col]
+        if col == "pickup_day_of_week":
+            same = [v if isinstance(v, str) else None for v in actual.astype(object)] == [
+                v if isinstance(v, str) else None for v in expected.astype(object)
+            ]
+        else:
+            got = actual.astype("float64").to_numpy(na_value=np.nan)
+            same = np.allclose(got, expected.to_numpy(dtype="float64"), equal_nan=True)
+        if not same:
+            failures += 1
+        print(f"[features] {'ok  ' if same else 'FAIL'}  {label:<10} {col:<20} {actual.dtype}")
+    return failures
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Compare engineer_features with a pandas reference.")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="synthetic trips to compare on")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic trips")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    failures = compare(edge_trips(), "edge rows") + compare(generate_trips(args.rows, seed=args.seed), "synthetic")
+    print(f"[features] {failures} column(s) differ" if failures else "[features] All derived columns match")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,229 @@
+"""
+check_query_plans.py – EXPLAIN QUERY PLAN check for the API
+-----------------------------------------------------------
+Calls every /api/ route of backend/API.py against a database built from
+synthetic data, unfiltered and under each kind of filter in FILTERS, records
+each SQL statement the route runs, and fails if its plan contains
+
+    a SCAN of a trips partition or a rollup table, bare or walking a
+    whole index
+    a temp B-tree for GROUP BY or DISTINCT
+    a temp B-tree for ORDER BY in a statement that does not GROUP BY
+    (sorting grouped rows is bounded by the number of groups; sorting trips
+    is not)
+
+unless the route lists that plan step in ALLOWED, or the filter in
+FILTER_ALLOWED, with the reason.  Scans of the zones dimension (265 rows)
+are fine.
+
+Usage:
+    python -m benchmarks.check_query_plans                  # 50k synthetic trips
+    python -m benchmarks.check_query_plans --db database/taxi_data.db
+"""
+
+import argparse
+import importlib.util
+import json
+import re
+import runpy
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.bench_pipeline import ROOT, bench_pipeline, dataset
+
+
+DEFAULT_ROWS = 50_000
+
+#route → {regex matching a plan step: why that step is expected}, under any filter
+ALLOWED = {
+    "/api/summary": {
+        r"^SCAN rollup_zone_hour$": "sums every rollup row",
+    },
+    "/api/weekday-vs-weekend": {
+        r"^SCAN rollup_zone_hour$": "sums every rollup row",
+        r"^USE TEMP B-TREE FOR GROUP BY$": "groups by a CASE expression (two groups)",
+    },
+    "/api/demand-by-hour-borough": {
+        r"^USE TEMP B-TREE FOR GROUP BY$": "borough x hour: zones come in borough order, hours do not",
+    },
+    "/api/trips-by-hour": {
+        r"^SCAN rollup_zone_hour USING COVERING INDEX idx_rollup_zone_hour_hour$":
+            "sums every rollup row, in hour order from the covering index",
+    },
+    "/api/trips-by-day": {
+        r"^SCAN rollup_zone_hour USING COVERING INDEX idx_rollup_zone_hour_dow$":
+            "sums every rollup row, in day order from the covering index",
+    },
+    "/api/peak-hours": {
+        r"^SCAN rollup_zone_hour USING INDEX idx_rollup_zone_hour_hour$":
+            "reads every rollup row (of the borough) in hour order: as fast as a scan and a 24-group sort",
+    },
+    "/api/tolls-and-fees": {
+        r"^SCAN rollup_zone_hour USING INDEX idx_rollup_zone_hour_hour$":
+            "reads every rollup row (of the borough) in hour order: as fast as a scan and a 24-group sort",
+    },
+    "/api/top-routes": {
+        r"^SCAN r USING COVERING INDEX idx_rollup_routes_route$": "counts every route from the covering index",
+    },
+    "/api/geojson": {
+        r"^SCAN rollup_zone_hour USING INDEX idx_rollup_zone_hour_zone$":
+            "reads every rollup row in zone order; an hour filter is tested in the index first",
+        r"^SCAN rollup_routes USING COVERING INDEX idx_rollup_routes_dropoff$":
+            "counts every drop-off zone from the covering index",
+    },
+}
+
+#filter → {regex matching a plan step: why that step is expected}, on any route
+FILTER_ALLOWED = {
+    "days": {
+        r"^USE TEMP B-TREE FOR GROUP BY$": "groups only the rows of the range, found through the month or pickup time index",
+    },
+    "month": {
+        r"^USE TEMP B-TREE FOR GROUP BY$": "groups only the rows of the month, found through the month index",
+    },
+    "borough": {
+        r"^USE TEMP B-TREE FOR GROUP BY$": "groups only the borough's rows, found through a zone index",
+    },
+    "hours": {
+        r"^USE TEMP B-TREE FOR GROUP BY$": "groups only the trips of the hour window, found through idx_<table>_payment_hour",
+    },
+    "payment": {
+        r"^SCAN (rollup_trips|r)$": "rollup_trips is the only rollup with payment_type; an index on it measured "
+                                    "about 2x slower than this scan for card and cash (97% of trips)",
+        r"^USE TEMP B-TREE FOR GROUP BY$": "groups only the rows of the payment type",
+    },
+}
+
+#query strings each route is called with: unfiltered, and under each kind of
+#filter backend/trip_filters.py routes to a different table or predicate
+FILTERS = {
+    "unfiltered": {},
+    "days": {"start": "2019-01-05", "end": "2019-01-20"},
+    "month": {"start": "2019-01-01", "end": "2019-01-31"},
+    "borough": {"borough": "Manhattan"},
+    "hours": {"hour_from": "7", "hour_to": "9"},
+    "payment": {"payment_type": "1"},
+}
+
+#routes with no SQL of their own: /api/dashboard runs the other routes
+BATCH_ROUTES = {"/api/dashboard"}
+
+#tables too big to scan without an index, by name or alias
+_LARGE_TABLE = re.compile(r"^(trips(_\d{4}_\d{2})?|rollup_\w+)$")
+_TABLE_ALIAS = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|GROUP\b|JOIN\b|ORDER\b|LEFT\b|LIMIT\b|UNION\b)(\w+))?", re.I)
+
+
+def load_api(db_path: Path, output_dir: Path):
+    """backend/API.py as a fresh module, pointed at ``db_path``."""
+    spec = importlib.util.spec_from_file_location("_api_under_check", ROOT / "backend" / "API.py")
+    api = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(api)
+    api.DB_PATH = Path(db_path)
+    api.PIPELINE_OUTPUT_DIR = Path(output_dir)
+    #payloads built from this database stay out of the real database/payloads/
+    api.PAYLOAD_DIR = Path(output_dir) / "payloads"
+    api.zone_payloads = type(api.zone_payloads)(api.PAYLOAD_DIR)
+    return api
+
+
+def collect_statements(api) -> dict:
+    """Call every /api/ route under each of FILTERS; returns {(route, filter): [(sql, args), ...]}."""
+    statements = {}
+    run_query = api.query
+
+    def recording_query(sql, args=(), one=False):
+        statements.setdefault(key, []).append((sql, args))
+        return run_query(sql, args, one)
+
+    api.query = recording_query
+    client = api.app.test_client()
+    try:
+        for rule in api.app.url_map.iter_rules():
+            route = rule.rule
+            if not route.startswith("/api/") or route in BATCH_ROUTES:
+                continue
+            for name, params in FILTERS.items():
+                key = (route, name)
+                response = client.get(route, query_string=params)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{route} {name} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+                statements.setdefault(key, [])
+    finally:
+        api.query = run_query
+    return statements
+
+
+def plan_problems(conn, sql, args) -> list:
+    """Plan steps of one statement that break the rules in the module docstring."""
+    aliases = {alias or table: table for table, alias in _TABLE_ALIAS.findall(sql)}
+    grouped = re.search(r"\bGROUP\s+BY\b", sql, re.I) is not None
+    problems = []
+    for row in conn.execute("EXPLAIN QUERY PLAN " + sql, args):
+        detail = row[3]
+        scan = re.match(r"^SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?$", detail)
+        if scan and _LARGE_TABLE.match(aliases.get(scan.group(1), scan.group(1))):
+            problems.append(detail)
+        elif re.match(r"^USE TEMP B-TREE FOR (GROUP BY|DISTINCT)", detail):
+            problems.append(detail)
+        elif detail.startswith("USE TEMP B-TREE FOR") and not grouped:
+            problems.append(detail)
+    return problems
+
+
+def check(db_path: Path, output_dir: Path) -> int:
+    """Print the plan problems per route; returns how many are not allowed."""
+    api = load_api(db_path, output_dir)
+    conn = sqlite3.connect(db_path)
+    failures = 0
+    for (route, name), statements in collect_statements(api).items():
+        allowed = {**FILTER_ALLOWED.get(name, {}), **ALLOWED.get(route, {})}
+        label = route if name == "unfiltered" else f"{route} [{name}]"
+        for sql, args in statements:
+            failed = False
+            for detail in plan_problems(conn, sql, args):
+                reason = next((why for pattern, why in allowed.items() if re.match(pattern, detail)), None)
+                if reason:
+                    print(f"[plans] ok    {label:<50} {detail}  ({reason})")
+                else:
+                    failures += 1
+                    failed = True
+                    print(f"[plans] FAIL  {label:<50} {detail}")
+            if failed:
+                print("        " + " ".join(sql.split()))
+        if not statements:
+            print(f"[plans] ok    {label:<50} (no SQL)")
+    conn.close()
+    return failures
+
+
+def build_database(rows: int, seed: int, workdir: Path) -> Path:
+    """Synthetic trips → pipeline → load_data.build_database, all under ``workdir``."""
+    directory = dataset(rows, seed)
+    trips_path = Path(bench_pipeline(directory, rows)["trips_path"])
+    load_data = runpy.run_path(str(ROOT / "database" / "load_data.py"))
+    db_path = workdir / "taxi_data.db"
+    load_data["build_database"](db_path, trips_path.parent, directory / "taxi_zone_lookup.csv")
+    return db_path
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Check the query plans of every API statement.")
+    parser.add_argument("--db", type=Path, help="check this database instead of building one from synthetic data")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="synthetic trips to build the database from")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic dataset")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        db_path = args.db or build_database(args.rows, args.seed, tmp)
+        #/api/geojson only queries the database once it has zone shapes to attach stats to
+        with open(tmp / "processed_zones.geojson", "w") as f:
+            json.dump({"type": "FeatureCollection", "features": []}, f)
+        failures = check(db_path, tmp)
+    print(f"[plans] {failures} plan regression(s)" if failures else "[plans] All query plans OK")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,247 @@
+"""
+synthetic_data.py – Synthetic TLC trip files
+--------------------------------------------
+Generates yellow-taxi trip CSVs in the TLC 2019 layout, plus a matching zone
+lookup, so the pipeline can be run and timed without downloading the real
+data.  Output is deterministic: the same rows, month, seed and rates always
+give the same file.
+
+Clean rows follow rough TLC distributions (busier evenings, mostly short
+Manhattan trips, fares from distance and time, tips on card payments).  A
+controlled share of rows is then damaged so every cleaning rule has work to
+do:
+
+    duplicates  exact copies of other rows, inserted at random positions
+    nulls       a blank value in one column (critical or not)
+    outliers    distance, fare, duration or passenger count out of range
+    bad_dates   pickup in another month or a nonsense year (2008, 2088, ...)
+
+Usage:
+    python -m benchmarks.synthetic_data 1000000
+    python -m benchmarks.synthetic_data 10000000 --month 2019-02 --out data/synthetic
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_pipeline.schema import DATETIME_FORMAT
+
+
+#column order of the 2019 TLC yellow taxi files
+TLC_COLUMNS = [
+    "VendorID", "tpep_pickup_datetime", "tpep_dropoff_datetime", "passenger_count",
+    "trip_distance", "RatecodeID", "store_and_fwd_flag", "PULocationID", "DOLocationID",
+    "payment_type", "fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount",
+    "improvement_surcharge", "total_amount", "congestion_surcharge",
+]
+
+DEFAULT_RATES = {
+    "duplicates": 0.01,
+    "nulls": 0.005,
+    "outliers": 0.01,
+    "bad_dates": 0.002,
+}
+
+#rows generated at once when writing a file; bounds memory for 10M-row files
+BLOCK_ROWS = 1_000_000
+
+DEFAULT_OUTPUT_DIR = Path(__file__).resolve().parent / "data"
+
+#(borough, number of zones, relative pickup weight per zone), in LocationID order
+_BOROUGHS = [
+    ("EWR", 1, 0.2),
+    ("Queens", 69, 0.6),
+    ("Bronx", 43, 0.1),
+    ("Manhattan", 69, 10.0),
+    ("Staten Island", 20, 0.02),
+    ("Brooklyn", 61, 0.5),
+    ("Unknown", 2, 0.3),
+]
+
+_SERVICE_ZONES = {"EWR": "EWR", "Manhattan": "Yellow Zone", "Unknown": None}
+
+#share of pickups per hour of day, midnight first
+_HOUR_WEIGHTS = np.array([
+    3.0, 2.2, 1.6, 1.1, 0.9, 0.9, 1.9, 3.4, 4.3, 4.4, 4.4, 4.6,
+    4.9, 5.0, 5.2, 5.3, 5.0, 5.6, 6.6, 6.8, 6.1, 5.8, 5.4, 4.2,
+])
+
+#columns that may be blanked by the "nulls" damage
+_NULLABLE_COLUMNS = [
+    "VendorID", "passenger_count", "RatecodeID", "store_and_fwd_flag", "payment_type",
+    "trip_distance", "fare_amount", "PULocationID", "DOLocationID", "tpep_dropoff_datetime",
+]
+
+_INT_COLUMNS = ["VendorID", "passenger_count", "RatecodeID", "PULocationID", "DOLocationID", "payment_type"]
+
+
+def generate_zone_lookup() -> pd.DataFrame:
+    """A 265-zone lookup with the columns and borough mix of taxi_zone_lookup.csv."""
+    boroughs = np.repeat([b for b, _, _ in _BOROUGHS], [n for _, n, _ in _BOROUGHS])
+    ids = np.arange(1, len(boroughs) + 1)
+    return pd.DataFrame({
+        "LocationID": ids,
+        "Borough": boroughs,
+        "Zone": [f"Zone {i}" if b != "Unknown" else None for i, b in zip(ids, boroughs)],
+        "service_zone": [_SERVICE_ZONES.get(b, "Boro Zone") for b in boroughs],
+    })
+
+
+def generate_trips(rows: int, month: str = "2019-01", seed=0, rates: dict = None) -> pd.DataFrame:
+    """``rows`` synthetic trips for ``month`` ("YYYY-MM"), raw TLC columns and text timestamps."""
+    rates = {**DEFAULT_RATES, **(rates or {})}
+    rng = np.random.default_rng(seed)
+    n_duplicates = int(round(rows * rates["duplicates"]))
+    n = rows - n_duplicates
+
+    start = pd.Timestamp(f"{month}-01")
+    days = (start + pd.offsets.MonthBegin(1) - start).days
+    pickup = (
+        start.value // 1_000_000_000
+        + rng.integers(0, days, n) * 86_400
+        + rng.choice(24, n, p=_HOUR_WEIGHTS / _HOUR_WEIGHTS.sum()) * 3_600
+        + rng.integers(0, 3_600, n)
+    )
+    distance = np.round(np.clip(rng.lognormal(0.55, 0.8, n), 0.1, 60.0), 2)
+    speed_mph = np.clip(rng.normal(12.0, 4.0, n), 3.0, 40.0)
+    duration = (distance / speed_mph * 3_600 + rng.integers(60, 300, n)).astype(np.int64)
+    payment = rng.choice([1, 2, 3, 4], n, p=[0.71, 0.27, 0.01, 0.01])
+
+    fare = np.ceil((2.5 + 2.0 * distance + 0.35 * duration / 60) * 2) / 2
+    extra = rng.choice([0.0, 0.5, 1.0], n, p=[0.45, 0.35, 0.2])
+    tolls = np.where(rng.random(n) < 0.05, 5.76, 0.0)
+    congestion = rng.choice([0.0, 2.5], n, p=[0.3, 0.7])
+    tip = np.where(payment == 1, np.round(fare * rng.uniform(0.1, 0.25, n), 2), 0.0)
+    total = np.round(fare + extra + 0.5 + tip + tolls + 0.3 + congestion, 2)
+
+    zones = generate_zone_lookup()
+    weights = np.repeat([w for _, _, w in _BOROUGHS], [k for _, k, _ in _BOROUGHS])
+    weights = weights / weights.sum()
+
+    cols = {
+        "VendorID": rng.choice([1, 2], n, p=[0.45, 0.55]).astype(float),
+        "pickup": pickup,
+        "duration": duration,
+        "passenger_count": rng.choice([1, 2, 3, 4, 5, 6], n, p=[0.7, 0.14, 0.04, 0.02, 0.06, 0.04]).astype(float),
+        "trip_distance": distance,
+        "RatecodeID": rng.choice([1, 2, 5], n, p=[0.97, 0.02, 0.01]).astype(float),
+        "store_and_fwd_flag": rng.choice(np.array(["N", "Y"], dtype=object), n, p=[0.99, 0.01]),
+        "PULocationID": rng.choice(zones["LocationID"].to_numpy(), n, p=weights).astype(float),
+        "DOLocationID": rng.choice(zones["LocationID"].to_numpy(), n, p=weights).astype(float),
+        "payment_type": payment.astype(float),
+        "fare_amount": fare,
+        "extra": extra,
+        "mta_tax": np.full(n, 0.5),
+        "tip_amount": tip,
+        "tolls_amount": tolls,
+        "improvement_surcharge": np.full(n, 0.3),
+        "total_amount": total,
+        "congestion_surcharge": congestion,
+    }
+    _add_outliers(cols, rng, int(round(n * rates["outliers"])))
+    _add_bad_dates(cols, rng, int(round(n * rates["bad_dates"])))
+    dropoff_null = _add_nulls(cols, rng, int(round(n * rates["nulls"])))
+
+    trips = _to_frame(cols, dropoff_null)
+
+    #exact copies of earlier or later rows, slotted in at random positions
+    order = np.insert(np.arange(n), rng.integers(0, n + 1, n_duplicates), rng.choice(n, n_duplicates))
+    return trips.iloc[order].reset_index(drop=True)
+
+
+def _pick(rng, n, k):
+    return rng.choice(n, min(k, n), replace=False)
+
+
+def _add_outliers(cols, rng, k):
+    rows = _pick(rng, len(cols["pickup"]), k)
+    kinds = rng.integers(0, 4, len(rows))
+    distance, fare, duration, passengers = (rows[kinds == i] for i in range(4))
+    cols["trip_distance"][distance] = rng.choice([0.0, 250.0, 1_200.5], len(distance))
+    cols["fare_amount"][fare] = rng.choice([-52.0, -3.5, 6_500.0], len(fare))
+    cols["duration"][duration] = rng.choice([0, 12, 13 * 3_600, 3 * 86_400], len(duration))
+    cols["passenger_count"][passengers] = -1.0
+
+
+def _add_bad_dates(cols, rng, k):
+    rows = _pick(rng, len(cols["pickup"]), k)
+    #whole years back/forward (like the 2008 / 2088 rows in real files) or a month either side
+    shift_days = rng.choice([-11 * 365, -10 * 365, 69 * 365, -31, 31], len(rows))
+    cols["pickup"][rows] += shift_days * 86_400
+
+
+def _add_nulls(cols, rng, k):
+    rows = _pick(rng, len(cols["pickup"]), k)
+    targets = rng.choice(_NULLABLE_COLUMNS, len(rows))
+    dropoff_null = np.zeros(len(cols["pickup"]), dtype=bool)
+    for col in _NULLABLE_COLUMNS:
+        hit = rows[targets == col]
+        if col == "tpep_dropoff_datetime":
+            dropoff_null[hit] = True
+        elif col == "store_and_fwd_flag":
+            cols[col][hit] = None
+        else:
+            cols[col][hit] = np.nan
+    return dropoff_null
+
+
+def _to_frame(cols, dropoff_null):
+    pickup = pd.to_datetime(cols.pop("pickup"), unit="s")
+    dropoff = pickup + pd.to_timedelta(cols.pop("duration"), unit="s")
+    df = pd.DataFrame(cols)
+    df["tpep_pickup_datetime"] = pickup.strftime(DATETIME_FORMAT)
+    df["tpep_dropoff_datetime"] = dropoff.strftime(DATETIME_FORMAT)
+    df.loc[dropoff_null, "tpep_dropoff_datetime"] = None
+    #nullable ints so the CSV says "1", not "1.0", like the TLC files
+    for col in _INT_COLUMNS:
+        df[col] = df[col].astype("Int64")
+    return df[TLC_COLUMNS]
+
+
+def trip_file_name(month: str = "2019-01") -> str:
+    """TLC naming, so the pipeline picks the cleaning window up from the name."""
+    return f"yellow_tripdata_{month}.csv"
+
+
+def write_dataset(output_dir: Path, rows: int, month: str = "2019-01", seed: int = 0, rates: dict = None, block_rows: int = BLOCK_ROWS) -> Path:
+    """
+    Write ``rows`` trips to ``output_dir/yellow_tripdata_<month>.csv`` and the
+    zone lookup to ``output_dir/taxi_zone_lookup.csv``; returns the trip file.
+    Large files are generated ``block_rows`` at a time.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    generate_zone_lookup().to_csv(output_dir / "taxi_zone_lookup.csv", index=False)
+
+    path = output_dir / trip_file_name(month)
+    for block, first in enumerate(range(0, rows, block_rows)):
+        trips = generate_trips(min(block_rows, rows - first), month=month, seed=[seed, block], rates=rates)
+        trips.to_csv(path, mode="a" if block else "w", header=not block, index=False)
+    return path
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic TLC trip file and zone lookup.")
+    parser.add_argument("rows", type=int, help="number of trip rows, duplicates included")
+    parser.add_argument("--month", default="2019-01", help="pickup month, YYYY-MM (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: %(default)s)")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUTPUT_DIR, help="output directory (default: benchmarks/data)")
+    for name, rate in DEFAULT_RATES.items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            dest=name,
+            type=float,
+            default=rate,
+            help=f"share of rows with {name.replace('_', ' ')} (default: %(default)s)",
+        )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    rates = {name: getattr(args, name) for name in DEFAULT_RATES}
+    path = write_dataset(args.out, args.rows, month=args.month, seed=args.seed, rates=rates)
+    print(f"[synthetic] Wrote {args.rows:,} trips → {path}")
@@ -1,6 +1,8 @@
+import numpy as np
 import pandas as pd
 
 from data_pipeline.exclusion_log import ExclusionLog
+from data_pipeline.profiling import NULL_PROFILER, Profiler
 
 
 MIN_TRIP_DISTANCE_MI = 0.01          
@@ -21,109 +23,205 @@ CRITICAL_COLUMNS = [
     "tpep_dropoff_datetime",
 ]
 
+#exclusion reasons, in the order the cleaning steps run
+DUPLICATE_REASON = "Exact duplicate row"
+MISSING_CRITICAL_REASON = "Missing critical column value"
+DISTANCE_REASON = f"Distance outlier (<{MIN_TRIP_DISTANCE_MI} or >{MAX_TRIP_DISTANCE_MI} mi)"
+FARE_REASON = f"Fare outlier (<${MIN_FARE} or >${MAX_FARE})"
+DURATION_REASON = f"Duration outlier (<{MIN_TRIP_DURATION_SEC}s or >{MAX_TRIP_DURATION_SEC}s)"
+NEGATIVE_PASSENGERS_REASON = "Negative passenger count"
+
+
+def temporal_reason(window=None) -> str:
+    earliest, latest = window or (EARLIEST_DATE, LATEST_DATE)
+    return f"Pickup date outside {earliest} – {latest}"
+
+
+def exclusion_reasons(window=None) -> list[str]:
+    """Every exclusion reason for a given (earliest, latest) pickup window, in cleaning order."""
+    return [
+        DUPLICATE_REASON,
+        MISSING_CRITICAL_REASON,
+        DISTANCE_REASON,
+        FARE_REASON,
+        temporal_reason(window),
+        DURATION_REASON,
+        NEGATIVE_PASSENGERS_REASON,
+    ]
+
+
+TEMPORAL_REASON = temporal_reason()
+EXCLUSION_REASONS = exclusion_reasons()
+
+
+class DuplicateTracker:
+    """
+    Remembers a 64-bit fingerprint of every row kept so far, so exact
+    duplicates are caught even when the two copies land in different chunks.
+    Costs 8 bytes per distinct row instead of holding the rows themselves.
+    """
+
+    def __init__(self) -> None:
+        self._seen = np.empty(0, dtype=np.uint64)
+
+    def mark(self, df: pd.DataFrame) -> pd.Series:
+        """Flag rows already seen in this or an earlier chunk and remember the rest."""
+        hashes = _row_hashes(df)
+        mask = pd.Series(hashes).duplicated().to_numpy(copy=True)
+        if len(self._seen):
+            pos = np.searchsorted(self._seen, hashes).clip(max=len(self._seen) - 1)
+            mask |= self._seen[pos] == hashes
+        self._seen = np.union1d(self._seen, hashes[~mask])
+        return pd.Series(mask, index=df.index)
+
+
+def _row_hashes(df: pd.DataFrame) -> np.ndarray:
+    #chunks of one file can infer different dtypes (int vs float when a chunk has NaN),
+    #so hash numbers as float64 and everything else as plain objects
+    normalized = {}
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            normalized[col] = s.astype("float64") + 0.0
+        elif pd.api.types.is_datetime64_any_dtype(s):
+            normalized[col] = s.astype("datetime64[ns]").to_numpy().view("int64")
+        else:
+            normalized[col] = s.astype(object)
+    frame = pd.DataFrame(normalized, index=df.index)
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+#one bit per rule, lowest bit = first rule; a row's mask holds every rule it breaks
+RULE_DUPLICATE = 1 << 0
+RULE_MISSING_CRITICAL = 1 << 1
+RULE_DISTANCE = 1 << 2
+RULE_FARE = 1 << 3
+RULE_TEMPORAL = 1 << 4
+RULE_DURATION = 1 << 5
+RULE_NEGATIVE_PASSENGERS = 1 << 6
+
+#(bit, message printed when rows are removed) in cleaning order
+_RULE_MESSAGES = [
+    (RULE_DUPLICATE, "duplicate rows"),
+    (RULE_MISSING_CRITICAL, "rows with missing critical values"),
+    (RULE_DISTANCE, "distance outliers"),
+    (RULE_FARE, "fare outliers"),
+    (RULE_TEMPORAL, "temporal outliers"),
+    (RULE_DURATION, "duration outliers"),
+    (RULE_NEGATIVE_PASSENGERS, "rows with negative passenger count"),
+]
 
 
-def clean(df: pd.DataFrame, log: ExclusionLog) :
-    """Run all cleaning steps in sequence and return the cleaned DataFrame."""
-    df = _remove_duplicates(df, log)
-    df = _drop_missing_critical(df, log)
-    df = _remove_distance_outliers(df, log)
-    df = _remove_fare_outliers(df, log)
-    df = _remove_temporal_outliers(df, log)
-    df = _remove_duration_outliers(df, log)
-    df = _remove_negative_passengers(df, log)
-    print(f"[cleaner] {len(df):,} records remain after cleaning")
-    return df
-
-
-def _remove_duplicates(df: pd.DataFrame, log: ExclusionLog) -> pd.DataFrame:
-    mask = df.duplicated()
-    n = mask.sum()
-    if n:
-        log.record(df[mask], reason="Exact duplicate row")
-        df = df[~mask]
-        print(f"[cleaner] Removed {n:,} duplicate rows")
-    return df
-
-
-def _drop_missing_critical(df: pd.DataFrame, log: ExclusionLog):
-    present_cols = [c for c in CRITICAL_COLUMNS if c in df.columns]
-    mask = df[present_cols].isnull().any(axis=1)
-    n = mask.sum()
-    if n:
-        log.record(df[mask], reason="Missing critical column value")
-        df = df[~mask]
-        print(f"[cleaner] Removed {n:,} rows with missing critical values")
+def clean(df: pd.DataFrame, log: ExclusionLog, duplicates: DuplicateTracker = None, verbose: bool = True, window=None, all_reasons: bool = False, profiler: Profiler = None) :
+    """
+    Apply every cleaning rule in one pass and return the cleaned DataFrame.
+
+    Datetimes are parsed once, each rule becomes one vectorised mask, and the
+    masks are folded into a per-row bitmask (see the RULE_* bits).  Rows are
+    logged under the first rule they break, as if the rules had run one after
+    another, and the frame is filtered once at the end.  With
+    ``all_reasons=True`` the logged rows also carry an ``_all_reasons`` column
+    naming every rule they break.
+
+    When the input arrives in chunks, pass the same ``DuplicateTracker`` for
+    every chunk so duplicates across chunk boundaries are still removed.
+    ``window`` is the (earliest, latest) pickup date range of the file being
+    cleaned; it defaults to EARLIEST_DATE – LATEST_DATE.  ``profiler`` times
+    each rule as a ``clean.<rule>`` stage.
+    """
+    profiler = profiler or NULL_PROFILER
+    bits, parsed = reason_bits(df, duplicates, window, profiler)
+    reasons = dict(zip([bit for bit, _ in _RULE_MESSAGES], exclusion_reasons(window)))
+
+    excluded = bits != 0
+    if excluded.any():
+        with profiler.stage("clean.log_exclusions", rows_in=int(excluded.sum())):
+            #isolate the lowest set bit = the first rule the row breaks
+            first = bits & (~bits + 1)
+            all_labels = describe_reasons(bits, window) if all_reasons else None
+            for bit, message in _RULE_MESSAGES:
+                sel = first == bit
+                n = int(sel.sum())
+                if not n:
+                    continue
+                rows = df[sel]
+                if all_labels is not None:
+                    rows = rows.assign(_all_reasons=all_labels[sel])
+                log.record(rows, reason=reasons[bit])
+                if verbose:
+                    print(f"[cleaner] Removed {n:,} {message}")
+
+    with profiler.stage("clean.filter", rows_in=len(df)) as run:
+        if excluded.any():
+            df = df[~excluded]
+        #assign: a new frame, so the caller's keeps its unparsed columns
+        df = df.assign(**{col: values[~excluded] for col, values in parsed.items()})
+        run.rows_out = len(df)
+
+    if verbose:
+        print(f"[cleaner] {len(df):,} records remain after cleaning")
     return df
 
 
-def _remove_distance_outliers(df: pd.DataFrame, log: ExclusionLog):
-    if "trip_distance" not in df.columns:
-        return df
-    mask = (df["trip_distance"] < MIN_TRIP_DISTANCE_MI) | (df["trip_distance"] > MAX_TRIP_DISTANCE_MI)
-    n = mask.sum()
-    if n:
-        log.record(df[mask], reason=f"Distance outlier (<{MIN_TRIP_DISTANCE_MI} or >{MAX_TRIP_DISTANCE_MI} mi)")
-        df = df[~mask]
-        print(f"[cleaner] Removed {n:,} distance outliers")
-    return df
+def reason_bits(df: pd.DataFrame, duplicates: DuplicateTracker = None, window=None, profiler: Profiler = None):
+    """
+    Evaluate every rule on ``df`` and return ``(bits, parsed)``: a uint8
+    bitmask per row and the pickup/dropoff columns parsed as datetimes.
+    Rules whose columns are missing are skipped.
+    """
+    profiler = profiler or NULL_PROFILER
+    bits = np.zeros(len(df), dtype=np.uint8)
 
+    def flag(name, bit, compute_mask):
+        with profiler.stage(f"clean.{name}", rows_in=len(df)) as run:
+            mask = compute_mask()
+            #comparisons on nullable columns give <NA>; a missing value breaks no range rule
+            if isinstance(mask, pd.Series):
+                mask = mask.to_numpy(dtype=bool, na_value=False)
+            bits[mask] |= bit
+            run.rows_out = len(df) - int(mask.sum())
 
-def _remove_fare_outliers(df: pd.DataFrame, log: ExclusionLog) :
-    if "fare_amount" not in df.columns:
-        return df
-    mask = (df["fare_amount"] < MIN_FARE) | (df["fare_amount"] > MAX_FARE)
-    n = mask.sum()
-    if n:
-        log.record(df[mask], reason=f"Fare outlier (<${MIN_FARE} or >${MAX_FARE})")
-        df = df[~mask]
-        print(f"[cleaner] Removed {n:,} fare outliers")
-    return df
+    flag("duplicates", RULE_DUPLICATE, lambda: df.duplicated() if duplicates is None else duplicates.mark(df))
 
+    present_cols = [c for c in CRITICAL_COLUMNS if c in df.columns]
+    flag("missing_critical", RULE_MISSING_CRITICAL, lambda: df[present_cols].isnull().any(axis=1))
 
-def _remove_temporal_outliers(df: pd.DataFrame, log: ExclusionLog) :
-    """Remove trips with pickup dates outside the expected month."""
-    col = "tpep_pickup_datetime"
-    if col not in df.columns:
-        return df
-
-    # Ensure datetime
-    df[col] = pd.to_datetime(df[col], errors="coerce")
-    mask = (df[col] < pd.Timestamp(EARLIEST_DATE)) | (df[col] >= pd.Timestamp(LATEST_DATE)) | df[col].isna()
-    n = mask.sum()
-    if n:
-        log.record(df[mask], reason=f"Pickup date outside {EARLIEST_DATE} – {LATEST_DATE}")
-        df = df[~mask]
-        print(f"[cleaner] Removed {n:,} temporal outliers")
-    return df
+    if "trip_distance" in df.columns:
+        distance = df["trip_distance"]
+        flag("distance", RULE_DISTANCE, lambda: (distance < MIN_TRIP_DISTANCE_MI) | (distance > MAX_TRIP_DISTANCE_MI))
 
+    if "fare_amount" in df.columns:
+        fare = df["fare_amount"]
+        flag("fare", RULE_FARE, lambda: (fare < MIN_FARE) | (fare > MAX_FARE))
 
-def _remove_duration_outliers(df: pd.DataFrame, log: ExclusionLog) :
-    """Remove trips whose duration is implausibly short or long."""
+    #parse each timestamp column exactly once
     pu, do = "tpep_pickup_datetime", "tpep_dropoff_datetime"
-    if pu not in df.columns or do not in df.columns:
-        return df
-
-    df[pu] = pd.to_datetime(df[pu], errors="coerce")
-    df[do] = pd.to_datetime(df[do], errors="coerce")
-
-    duration_sec = (df[do] - df[pu]).dt.total_seconds()
-    mask = (duration_sec < MIN_TRIP_DURATION_SEC) | (duration_sec > MAX_TRIP_DURATION_SEC)
-    n = mask.sum()
-    if n:
-        log.record(df[mask], reason=f"Duration outlier (<{MIN_TRIP_DURATION_SEC}s or >{MAX_TRIP_DURATION_SEC}s)")
-        df = df[~mask]
-        print(f"[cleaner] Removed {n:,} duration outliers")
-    return df
-
-
-def _remove_negative_passengers(df: pd.DataFrame, log: ExclusionLog) :
-    if "passenger_count" not in df.columns:
-        return df
-    mask = df["passenger_count"] < 0
-    n = mask.sum()
-    if n:
-        log.record(df[mask], reason="Negative passenger count")
-        df = df[~mask]
-        print(f"[cleaner] Removed {n:,} rows with negative passenger count")
-    return df
+    with profiler.stage("clean.parse_datetimes", rows_in=len(df)):
+        parsed = {col: pd.to_datetime(df[col], errors="coerce") for col in (pu, do) if col in df.columns}
+
+    if pu in parsed:
+        earliest, latest = window or (EARLIEST_DATE, LATEST_DATE)
+        pickup = parsed[pu]
+        flag("temporal", RULE_TEMPORAL, lambda: (pickup < pd.Timestamp(earliest)) | (pickup >= pd.Timestamp(latest)) | pickup.isna())
+
+    if pu in parsed and do in parsed:
+        def duration_outliers():
+            duration_sec = (parsed[do] - parsed[pu]).dt.total_seconds()
+            return (duration_sec < MIN_TRIP_DURATION_SEC) | (duration_sec > MAX_TRIP_DURATION_SEC)
+        flag("duration", RULE_DURATION, duration_outliers)
+
+    if "passenger_count" in df.columns:
+        flag("negative_passengers", RULE_NEGATIVE_PASSENGERS, lambda: df["passenger_count"] < 0)
+
+    return bits, parsed
+
+
+def describe_reasons(bits: np.ndarray, window=None) -> np.ndarray:
+    """Turn reason bitmasks into "; "-joined reason strings (one lookup per distinct mask)."""
+    reasons = exclusion_reasons(window)
+    codes, inverse = np.unique(bits, return_inverse=True)
+    labels = np.array([
+        "; ".join(reason for (bit, _), reason in zip(_RULE_MESSAGES, reasons) if code & bit)
+        for code in codes
+    ], dtype=object)
+    return labels[inverse]
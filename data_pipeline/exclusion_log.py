@@ -5,17 +5,59 @@ Maintain a structured log of every record excluded or flagged as suspicious
 during cleaning.  The log can be exported to CSV for the technical report.
 """
 
+import shutil
 from pathlib import Path
 from typing import Optional
 
+import numpy as np
 import pandas as pd
 
 
+#what an ExclusionLog keeps: every row in memory, row IDs + reason codes only,
+#or row IDs + reason codes with the full rows streamed to disk
+LOG_MODES = ("full", "compact", "spill")
+
+
 class ExclusionLog:
-    """Accumulates excluded rows with the reason for exclusion."""
+    """
+    Accumulates excluded rows with the reason for exclusion.
+
+    ``reason_order`` lists reasons in the order the cleaning steps run.  When
+    data is cleaned chunk by chunk the batches arrive interleaved, and this
+    order lets ``to_dataframe`` group them exactly as a single-pass run would.
+
+    ``mode`` trades detail for memory:
+
+    * ``"full"`` keeps a copy of every excluded row (the default).
+    * ``"compact"`` keeps only each row's ID (its index label, i.e. its row
+      number in the raw file) and an integer reason code.  The exported log
+      has ``row_id`` and ``_exclusion_reason`` columns.
+    * ``"spill"`` keeps IDs and codes in memory like ``"compact"`` but also
+      appends the full rows to one CSV per reason under ``spill_dir`` as they
+      arrive.  ``save`` stitches those files together, so the exported log is
+      the same as in ``"full"`` mode.  ``spill_dir`` belongs to the log:
+      files left there by an earlier run that did not finish are deleted.
+
+    Per-reason counters are kept as rows come in, so ``summary`` and
+    ``total_excluded`` never touch the rows themselves.
+    """
 
-    def __init__(self) -> None:
+    def __init__(self, reason_order: Optional[list[str]] = None, mode: str = "full", spill_dir: Optional[Path] = None) -> None:
+        if mode not in LOG_MODES:
+            raise ValueError(f"Unknown exclusion log mode {mode!r}; expected one of {LOG_MODES}")
+        if mode == "spill" and spill_dir is None:
+            raise ValueError("spill mode needs a spill_dir")
+        self.mode = mode
         self._entries: list[pd.DataFrame] = []
+        self._reason_order = reason_order
+        #reason code = position in this list
+        self._reasons: list[str] = []
+        self._counts: list[int] = []
+        self._row_ids: list[np.ndarray] = []
+        self._codes: list[np.ndarray] = []
+        self._spill_dir = Path(spill_dir) if spill_dir is not None else None
+        #spill files are appended to, so leftovers of a crashed run would end up in this log
+        self.discard_spill()
 
     def record(self, rows: pd.DataFrame, reason: str) -> None:
         """
@@ -30,32 +72,62 @@ class ExclusionLog:
         """
         if rows.empty:
             return
-        chunk = rows.copy()
-        chunk["_exclusion_reason"] = reason
-        self._entries.append(chunk)
+        code = self._reason_code(reason)
+        self._counts[code] += len(rows)
+
+        if self.mode == "full":
+            chunk = rows.copy()
+            chunk["_exclusion_reason"] = reason
+            self._entries.append(chunk)
+            return
+
+        self._row_ids.append(rows.index.to_numpy(dtype=np.int64))
+        self._codes.append(np.full(len(rows), code, dtype=np.int16))
+        if self.mode == "spill":
+            path = self._spill_path(code)
+            rows.assign(_exclusion_reason=reason).to_csv(
+                path, mode="a", header=not path.exists(), index=False
+            )
 
     @property
     def total_excluded(self) -> int:
-        return sum(len(e) for e in self._entries)
+        return sum(self._counts)
 
     def summary(self) -> pd.DataFrame:
         """Return a DataFrame with count of exclusions per reason."""
-        if not self._entries:
+        if not self._reasons:
             return pd.DataFrame(columns=["reason", "count"])
-        combined = pd.concat(self._entries, ignore_index=True)
         return (
-            combined.groupby("_exclusion_reason")
-            .size()
-            .reset_index(name="count")
-            .rename(columns={"_exclusion_reason": "reason"})
+            pd.DataFrame({"reason": self._reasons, "count": self._counts})
+            .sort_values("reason")
+            .reset_index(drop=True)
             .sort_values("count", ascending=False)
         )
 
     def to_dataframe(self) -> pd.DataFrame:
-        """Return every excluded row (with reason column)."""
-        if not self._entries:
+        """
+        Return every excluded row (with reason column).  In compact mode this
+        is one ``row_id``/``_exclusion_reason`` pair per excluded row.
+        """
+        if not self._reasons:
             return pd.DataFrame()
-        return pd.concat(self._entries, ignore_index=True)
+        if self.mode == "spill":
+            return pd.concat(
+                (pd.read_csv(self._spill_path(code), low_memory=False) for code in self._ordered_codes()),
+                ignore_index=True,
+            )
+        if self.mode == "compact":
+            return self._compact_frame()
+
+        entries = self._entries
+        if self._reason_order is not None:
+            rank = {reason: i for i, reason in enumerate(self._reason_order)}
+            #sorted() is stable, so batches of one reason keep their arrival order
+            entries = sorted(
+                entries,
+                key=lambda e: rank.get(e["_exclusion_reason"].iat[0], len(rank)),
+            )
+        return pd.concat(entries, ignore_index=True)
 
     def save(self, path: Optional[Path] = None) -> Path:
         """
@@ -64,18 +136,95 @@ class ExclusionLog:
         """
         if path is None:
             path = Path(__file__).resolve().parent / "exclusion_log.csv"
+        if self.mode == "spill":
+            return merge_log_files([self._spill_path(code) for code in self._ordered_codes()], path)
         df = self.to_dataframe()
         df.to_csv(path, index=False)
         return path
 
+    def discard_spill(self) -> None:
+        """Delete the per-reason spill files (call after ``save``)."""
+        if self._spill_dir is not None and self._spill_dir.is_dir():
+            shutil.rmtree(self._spill_dir)
+
     def print_summary(self) -> None:
         """Pretty-print exclusion counts by reason."""
-        s = self.summary()
-        print("\n──── Exclusion summary ────")
-        if s.empty:
-            print("  No records excluded.")
-        else:
-            for _, row in s.iterrows():
-                print(f"  {row['reason']:<55} {row['count']:>8,}")
-            print(f"  {'TOTAL':<55} {self.total_excluded:>8,}")
-        print()
+        print_summary(self.summary())
+
+    def _reason_code(self, reason: str) -> int:
+        try:
+            return self._reasons.index(reason)
+        except ValueError:
+            self._reasons.append(reason)
+            self._counts.append(0)
+            return len(self._reasons) - 1
+
+    def _ordered_codes(self) -> list[int]:
+        codes = range(len(self._reasons))
+        if self._reason_order is None:
+            return list(codes)
+        rank = {reason: i for i, reason in enumerate(self._reason_order)}
+        return sorted(codes, key=lambda c: rank.get(self._reasons[c], len(rank)))
+
+    def _compact_frame(self) -> pd.DataFrame:
+        row_ids = np.concatenate(self._row_ids)
+        codes = np.concatenate(self._codes)
+        #stable sort by reason rank keeps arrival order within a reason
+        rank = np.empty(len(self._reasons), dtype=np.int64)
+        rank[self._ordered_codes()] = np.arange(len(self._reasons))
+        order = np.argsort(rank[codes], kind="stable")
+        return pd.DataFrame({
+            "row_id": row_ids[order],
+            "_exclusion_reason": pd.Categorical.from_codes(codes[order], categories=self._reasons),
+        })
+
+    def _spill_path(self, code: int) -> Path:
+        self._spill_dir.mkdir(parents=True, exist_ok=True)
+        return self._spill_dir / f"reason_{code:02d}.csv"
+
+
+def print_summary(summary: pd.DataFrame) -> None:
+    """Pretty-print a reason/count table as returned by ``ExclusionLog.summary``."""
+    print("\n──── Exclusion summary ────")
+    if summary.empty:
+        print("  No records excluded.")
+    else:
+        for _, row in summary.iterrows():
+            print(f"  {row['reason']:<55} {row['count']:>8,}")
+        print(f"  {'TOTAL':<55} {summary['count'].sum():>8,}")
+    print()
+
+
+def merge_summaries(summaries: list[pd.DataFrame]) -> pd.DataFrame:
+    """Add up the per-reason counts of several logs (e.g. one per worker)."""
+    summaries = [s for s in summaries if not s.empty]
+    if not summaries:
+        return pd.DataFrame(columns=["reason", "count"])
+    return (
+        pd.concat(summaries, ignore_index=True)
+        .groupby("reason", sort=False)["count"]
+        .sum()
+        .reset_index()
+        .sort_values("count", ascending=False)
+    )
+
+
+def merge_log_files(paths: list[Path], path: Path) -> Path:
+    """
+    Concatenate saved exclusion logs into one CSV.  Files are copied as bytes
+    (header kept once), so merging never loads a whole log into memory.
+    """
+    header = None
+    with open(path, "wb") as out:
+        for part in paths:
+            with open(part, "rb") as f:
+                first = f.readline()
+                if not first.strip():
+                    continue  # empty log: nothing was excluded
+                if header is None:
+                    header = first
+                    out.write(first)
+                elif first != header:
+                    raise ValueError(f"{part} has different columns than the other exclusion logs")
+                shutil.copyfileobj(f, out)
+    return path
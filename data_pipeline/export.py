@@ -0,0 +1,242 @@
+"""
+export.py – Writing processed trips
+-----------------------------------
+Writers that accept the processed trips one DataFrame at a time, so the same
+code serves a whole-file run and a chunked (streaming) run.
+
+Parquet is the default: columns keep their types, are zstd-compressed and are
+split into row groups that ``database/load_data.py`` can read one at a time.
+CSV is still available for people who want to open the output in a text editor.
+
+DatabaseTripWriter skips the files altogether and writes the batches straight
+into the SQLite database, through load_data.py's DatabaseBuild.
+"""
+
+import importlib.util
+from functools import lru_cache
+from pathlib import Path
+
+import pandas as pd
+
+from data_pipeline.schema import (
+    CATEGORICAL_ID_COLUMNS,
+    CATEGORICAL_TEXT_COLUMNS,
+    DATETIME_COLUMNS,
+    NUMERIC_COLUMNS,
+)
+
+
+TRIP_FORMATS = ("parquet", "csv")
+DEFAULT_TRIP_FORMAT = "parquet"
+
+#rows per parquet row group (also the unit load_data.py reads at once)
+ROW_GROUP_SIZE = 250_000
+PARQUET_COMPRESSION = "zstd"
+
+
+#multi-file runs write one file per input into this directory
+PARTITION_DIR_NAME = "processed_trips"
+
+#database/load_data.py is a script in a folder that is not a package
+LOAD_DATA_PATH = Path(__file__).resolve().parents[1] / "database" / "load_data.py"
+#what the database sink's output also depends on (the SQL defines its layout)
+DATABASE_SOURCES = (LOAD_DATA_PATH, *sorted(LOAD_DATA_PATH.parent.glob("*.sql")))
+
+
+def trips_output_path(output_dir: Path, fmt: str = DEFAULT_TRIP_FORMAT) -> Path:
+    _check_format(fmt)
+    return Path(output_dir) / f"processed_trips.{fmt}"
+
+
+def trips_partition_path(output_dir: Path, name: str, fmt: str = DEFAULT_TRIP_FORMAT) -> Path:
+    """Output file for one input file (e.g. ``processed_trips/yellow_tripdata_2019-01.parquet``)."""
+    _check_format(fmt)
+    return Path(output_dir) / PARTITION_DIR_NAME / f"{name}.{fmt}"
+
+
+def remove_trip_outputs(output_dir: Path, keep=()) -> None:
+    """
+    Remove processed trips from earlier runs, in either layout and format,
+    except the files in ``keep``.  load_data.py loads whatever it finds, so
+    outputs of inputs that are no longer part of the run must go.
+    """
+    output_dir = Path(output_dir)
+    keep = {Path(p) for p in keep}
+    candidates = [trips_output_path(output_dir, fmt) for fmt in TRIP_FORMATS]
+    partition_dir = output_dir / PARTITION_DIR_NAME
+    if partition_dir.is_dir():
+        for fmt in TRIP_FORMATS:
+            candidates.extend(partition_dir.glob(f"*.{fmt}"))
+    for path in candidates:
+        if path not in keep:
+            path.unlink(missing_ok=True)
+
+
+def _check_format(fmt: str) -> None:
+    if fmt not in TRIP_FORMATS:
+        raise ValueError(f"Unknown trip output format {fmt!r}; expected one of {TRIP_FORMATS}")
+
+
+def open_trip_writer(path: Path):
+    """Return a writer for ``path``, picking the format from its suffix."""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return ParquetTripWriter(path)
+    if path.suffix == ".csv":
+        return CsvTripWriter(path)
+    raise ValueError(f"Don't know how to write trips to {path.name}")
+
+
+def open_database_writer(path: Path, zone_lookup_path: Path, staging: bool = False, verbose: bool = True):
+    """Return a writer that builds the SQLite database at ``path`` (see DatabaseTripWriter)."""
+    return DatabaseTripWriter(path, zone_lookup_path, staging=staging, verbose=verbose)
+
+
+@lru_cache(maxsize=None)
+def load_data_module():
+    spec = importlib.util.spec_from_file_location("load_data", LOAD_DATA_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class CsvTripWriter:
+    """Appends DataFrames to one CSV file, writing the header once."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.rows_written = 0
+        self._started = False
+
+    def write(self, df: pd.DataFrame) -> None:
+        df.to_csv(self.path, mode="a" if self._started else "w", header=not self._started, index=False)
+        self._started = True
+        self.rows_written += len(df)
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ParquetTripWriter:
+    """
+    Appends DataFrames to one Parquet file as row groups.
+
+    The Arrow schema is fixed from the column lists in ``schema`` rather
+    than inferred per batch, so a chunk that happens to contain a NaN (and was
+    therefore read as float instead of int) still matches the file schema.
+    """
+
+    def __init__(self, path: Path, row_group_size: int = ROW_GROUP_SIZE) -> None:
+        import pyarrow.parquet  # imported here so CSV-only runs don't need pyarrow
+        self.path = Path(path)
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+        self._writer = None
+        self._schema = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            self._schema = _arrow_schema(df)
+            self._writer = pq.ParquetWriter(self.path, self._schema, compression=PARQUET_COMPRESSION)
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self.rows_written += len(df)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class DatabaseTripWriter:
+    """
+    Writes DataFrames straight into the monthly trip tables of a new SQLite
+    database, in load_data.py's layout.  The database is built in a scratch
+    file and swapped in for ``path`` on close(); if the block exits with an
+    exception the scratch file is thrown away and ``path`` is left alone.
+
+    A ``staging`` database only holds the trips; load_data.DatabaseBuild's
+    add_database() merges it into the real one.
+    """
+
+    def __init__(self, path: Path, zone_lookup_path: Path, staging: bool = False, verbose: bool = True) -> None:
+        self.path = Path(path)
+        self._build = load_data_module().DatabaseBuild(path, zone_lookup_path, staging=staging, verbose=verbose)
+
+    @property
+    def rows_written(self) -> int:
+        return self._build.rows_written
+
+    def write(self, df: pd.DataFrame) -> None:
+        self._build.write(df)
+
+    def close(self) -> None:
+        self._build.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._build.__exit__(*exc)
+
+
+class TripWriters:
+    """Passes every DataFrame on to several writers (e.g. Parquet and the database)."""
+
+    def __init__(self, writers) -> None:
+        self.writers = list(writers)
+
+    @property
+    def rows_written(self) -> int:
+        return self.writers[0].rows_written if self.writers else 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        for writer in self.writers:
+            writer.write(df)
+
+    def close(self) -> None:
+        for writer in self.writers:
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for writer in self.writers:
+            writer.__exit__(*exc)
+
+
+def _arrow_schema(df: pd.DataFrame):
+    import pyarrow as pa
+
+    fixed = {}
+    for col in DATETIME_COLUMNS:
+        fixed[col] = pa.timestamp("us", tz="UTC")
+    for col in NUMERIC_COLUMNS:
+        fixed[col] = pa.float64()
+    for col in CATEGORICAL_ID_COLUMNS:
+        fixed[col] = pa.int64()
+    for col in CATEGORICAL_TEXT_COLUMNS:
+        fixed[col] = pa.string()
+
+    inferred = pa.Schema.from_pandas(df, preserve_index=False)
+    fields = [
+        pa.field(f.name, fixed[f.name]) if f.name in fixed else f
+        for f in inferred
+    ]
+    return pa.schema(fields)
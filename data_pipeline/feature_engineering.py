@@ -1,52 +1,151 @@
+"""
+feature_engineering.py – Derived trip columns
+---------------------------------------------
+Every derived column is a small function registered with ``register_feature``
+together with the columns it needs.  ``engineer_features`` runs them in
+registration order over NumPy arrays: timestamps are turned into int64 epoch
+nanoseconds once and shared by all features, and divisions write straight
+into a NaN-filled output where the divisor is zero instead of building
+``.replace(0, nan)`` copies.
+
+Hour of day is stored as int8 and day of week as a categorical (int8 codes
+0 = Monday … 6 = Sunday, with DAY_OF_WEEK_LABELS as its only copy of the
+names), so neither costs a Python string per row.
+
+To add a feature::
+
+    @register_feature("fare_per_passenger", requires=("fare_amount", "passenger_count"))
+    def _fare_per_passenger(cols):
+        return guarded_divide(cols.floats("fare_amount"), cols.floats("passenger_count"))
+"""
+
+from typing import Callable, NamedTuple
+
+import numpy as np
 import pandas as pd
 
 
-def engineer_features(df):
+DAY_OF_WEEK_LABELS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+_NS_PER_SECOND = 1_000_000_000
+_NS_PER_HOUR = 3_600 * _NS_PER_SECOND
+_NS_PER_DAY = 24 * _NS_PER_HOUR
+#1970-01-01 was a Thursday (Monday = 0)
+_EPOCH_DAY_OF_WEEK = 3
+
+
+class Feature(NamedTuple):
+    name: str
+    requires: tuple
+    compute: Callable
+
+
+#registered features, run in this order
+FEATURES: list[Feature] = []
+
+
+def register_feature(name, requires=()):
+    """Decorator registering ``func(cols) -> array`` as the derived column ``name``."""
+    def decorator(func):
+        FEATURES[:] = [f for f in FEATURES if f.name != name]
+        FEATURES.append(Feature(name, tuple(requires), func))
+        return func
+    return decorator
+
+
+def engineer_features(df, verbose=True):
     """Add all derived features and return the enriched DataFrame."""
-    df = _add_trip_duration(df)
-    df = _add_speed(df)
-    df = _add_cost_per_mile(df)
-    df = _add_tip_percentage(df)
-    df = _add_temporal_features(df)
-    print(f"[features] Engineered 6 derived features on {len(df):,} records")
+    cols = FeatureColumns(df)
+    added = {}
+    for feature in FEATURES:
+        if all(c in df.columns or c in added for c in feature.requires):
+            added[feature.name] = feature.compute(cols)
+            cols.add(feature.name, added[feature.name])
+    df = df.assign(**added)
+    if verbose:
+        print(f"[features] Engineered {len(added)} derived features on {len(df):,} records")
     return df
 
 
+class FeatureColumns:
+    """NumPy views of a frame's columns, converted once and shared by every feature."""
 
-def _add_trip_duration(df):
-    pu, do = "tpep_pickup_datetime", "tpep_dropoff_datetime"
-    if pu in df.columns and do in df.columns:
-        delta = pd.to_datetime(df[do]) - pd.to_datetime(df[pu])
-        df["trip_duration_min"] = delta.dt.total_seconds() / 60.0
-    return df
+    def __init__(self, df: pd.DataFrame) -> None:
+        self._df = df
+        self._cache: dict = {}
 
+    def floats(self, col) -> np.ndarray:
+        """``col`` as float64 with NaN for missing values."""
+        key = ("float", col)
+        if key not in self._cache:
+            values = self._cache.get(("raw", col))
+            if values is None:
+                values = pd.to_numeric(self._df[col], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+            self._cache[key] = np.asarray(values, dtype="float64")
+        return self._cache[key]
 
-def _add_speed(df):
-    if "trip_duration_min" in df.columns and "trip_distance" in df.columns:
-        hours = df["trip_duration_min"] / 60.0
-        # avoid division by zero
-        df["speed_mph"] = df["trip_distance"] / hours.replace(0, float("nan"))
-    return df
+    def epoch_ns(self, col) -> np.ndarray:
+        """``col`` as int64 nanoseconds since the epoch (NaT → int64 min)."""
+        key = ("epoch", col)
+        if key not in self._cache:
+            values = self._df[col]
+            if not pd.api.types.is_datetime64_any_dtype(values):
+                values = pd.to_datetime(values, errors="coerce")
+            self._cache[key] = pd.DatetimeIndex(values).as_unit("ns").asi8
+        return self._cache[key]
 
+    def add(self, col, values) -> None:
+        """Make a freshly computed feature available to the features after it."""
+        self._cache[("raw", col)] = values
 
-def _add_cost_per_mile(df):
-    if "total_amount" in df.columns and "trip_distance" in df.columns:
-        df["cost_per_mile"] = df["total_amount"] / df["trip_distance"].replace(0, float("nan"))
-    return df
 
+def guarded_divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """numerator / denominator, NaN where the denominator is zero."""
+    out = np.full(len(numerator), np.nan)
+    np.divide(numerator, denominator, out=out, where=denominator != 0)
+    return out
 
-def _add_tip_percentage(df):
-    if "tip_amount" in df.columns and "fare_amount" in df.columns:
-        df["tip_percentage"] = (
-            df["tip_amount"] / df["fare_amount"].replace(0, float("nan"))
-        ) * 100.0
-    return df
 
+@register_feature("trip_duration_min", requires=("tpep_pickup_datetime", "tpep_dropoff_datetime"))
+def _trip_duration(cols):
+    pu = cols.epoch_ns("tpep_pickup_datetime")
+    do = cols.epoch_ns("tpep_dropoff_datetime")
+    missing = (pu == np.iinfo(np.int64).min) | (do == np.iinfo(np.int64).min)
+    seconds = (do - pu) / _NS_PER_SECOND
+    seconds[missing] = np.nan
+    return seconds / 60.0
 
-def _add_temporal_features(df):
-    col = "tpep_pickup_datetime"
-    if col in df.columns:
-        dt = pd.to_datetime(df[col])
-        df["pickup_hour"] = dt.dt.hour
-        df["pickup_day_of_week"] = dt.dt.day_name()
-    return df
+
+@register_feature("speed_mph", requires=("trip_duration_min", "trip_distance"))
+def _speed(cols):
+    hours = cols.floats("trip_duration_min") / 60.0
+    return guarded_divide(cols.floats("trip_distance"), hours)
+
+
+@register_feature("cost_per_mile", requires=("total_amount", "trip_distance"))
+def _cost_per_mile(cols):
+    return guarded_divide(cols.floats("total_amount"), cols.floats("trip_distance"))
+
+
+@register_feature("tip_percentage", requires=("tip_amount", "fare_amount"))
+def _tip_percentage(cols):
+    return guarded_divide(cols.floats("tip_amount"), cols.floats("fare_amount")) * 100.0
+
+
+@register_feature("pickup_hour", requires=("tpep_pickup_datetime",))
+def _pickup_hour(cols):
+    ns = cols.epoch_ns("tpep_pickup_datetime")
+    hour = (ns // _NS_PER_HOUR % 24).astype(np.int8)
+    missing = ns == np.iinfo(np.int64).min
+    if missing.any():
+        #nullable, so a missing pickup has no hour rather than a made-up one
+        return pd.arrays.IntegerArray(hour, missing)
+    return hour
+
+
+@register_feature("pickup_day_of_week", requires=("tpep_pickup_datetime",))
+def _pickup_day_of_week(cols):
+    ns = cols.epoch_ns("tpep_pickup_datetime")
+    codes = ((ns // _NS_PER_DAY + _EPOCH_DAY_OF_WEEK) % 7).astype(np.int8)
+    codes[ns == np.iinfo(np.int64).min] = -1
+    return pd.Categorical.from_codes(codes, categories=DAY_OF_WEEK_LABELS, ordered=True)
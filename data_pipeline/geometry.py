@@ -0,0 +1,189 @@
+"""
+geometry.py – Map-sized zone geometry
+-------------------------------------
+The zone shapefile is far more detailed than a city-wide choropleth needs.
+For every level in GEOMETRY_LEVELS the pipeline writes a lighter copy of
+processed_zones.geojson next to it:
+
+1. Simplify.  The zones tile the city, so they are simplified as a coverage
+   (``shapely.coverage_simplify``): a border shared by two zones is simplified
+   once and stays shared, leaving no gaps or overlaps.  Older shapely versions
+   fall back to simplifying each zone on its own.
+2. Quantize.  Coordinates are rounded to the level's number of decimals
+   (5 decimals ≈ 1 m) and repeated points dropped.
+3. Encode, twice: as compact GeoJSON, and as TopoJSON, where each shared
+   border is stored once as an "arc" of delta-encoded integer coordinates
+   that both zones point to.
+
+Only the properties the map uses are kept; the API adds the trip stats.
+"""
+
+import json
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+
+#level name → (simplification tolerance in degrees, coordinate decimals)
+GEOMETRY_LEVELS = {
+    "high": (0.00002, 6),
+    "medium": (0.0001, 5),
+    "low": (0.0005, 4),
+}
+GEOMETRY_FORMATS = ("geojson", "topojson")
+
+ZONE_GEOJSON_NAME = "processed_zones.geojson"
+#name of the geometry collection inside the TopoJSON files
+TOPOLOGY_OBJECT = "zones"
+
+#zone properties the map needs
+MAP_PROPERTIES = ["LocationID", "Zone", "Borough", "service_zone"]
+
+
+def zone_geometry_path(output_dir: Path, level: str, fmt: str = "geojson") -> Path:
+    """processed_zones.<level>.<fmt> in ``output_dir``."""
+    if level not in GEOMETRY_LEVELS:
+        raise ValueError(f"Unknown geometry level {level!r}; expected one of {tuple(GEOMETRY_LEVELS)}")
+    if fmt not in GEOMETRY_FORMATS:
+        raise ValueError(f"Unknown geometry format {fmt!r}; expected one of {GEOMETRY_FORMATS}")
+    return Path(output_dir) / f"{Path(ZONE_GEOJSON_NAME).stem}.{level}.{fmt}"
+
+
+def simplify_zones(zones: gpd.GeoDataFrame, tolerance: float, decimals: int) -> gpd.GeoDataFrame:
+    """Coverage-simplified, quantized copy of ``zones`` with only MAP_PROPERTIES."""
+    columns = [c for c in MAP_PROPERTIES if c in zones.columns]
+    geoms = np.array(zones.geometry.tolist(), dtype=object)
+    present = ~shapely.is_missing(geoms) & ~shapely.is_empty(geoms)
+
+    if hasattr(shapely, "coverage_simplify"):
+        geoms[present] = shapely.coverage_simplify(geoms[present], tolerance)
+    else:
+        geoms[present] = shapely.simplify(geoms[present], tolerance, preserve_topology=True)
+    geoms[present] = shapely.transform(geoms[present], lambda coords: np.round(coords, decimals))
+    geoms[present] = shapely.remove_repeated_points(geoms[present])
+
+    return gpd.GeoDataFrame(zones[columns].copy(), geometry=geoms, crs=zones.crs)
+
+
+def write_geojson(zones: gpd.GeoDataFrame, path: Path) -> None:
+    """GeoJSON without whitespace or feature ids."""
+    with open(path, "w") as f:
+        f.write(zones.to_json(drop_id=True, separators=(",", ":")))
+
+
+def write_topojson(zones: gpd.GeoDataFrame, path: Path, decimals: int) -> None:
+    with open(path, "w") as f:
+        json.dump(to_topology(zones, decimals), f, separators=(",", ":"))
+
+
+def to_topology(zones: gpd.GeoDataFrame, decimals: int) -> dict:
+    """
+    Encode polygons as a TopoJSON Topology.  Coordinates are quantized to
+    ``decimals`` places; rings are cut into arcs at junctions (points where
+    the neighbouring zones change) and every arc is stored once, referenced
+    as ``~i`` by the zone that runs along it the other way.
+    """
+    scale = 10.0 ** -decimals
+    minx, miny = zones.total_bounds[:2] if len(zones) else (0.0, 0.0)
+    translate = [round(float(minx), decimals), round(float(miny), decimals)]
+
+    shapes = []  # per zone: list of polygons, each a list of rings of (x, y) ints
+    for geom in zones.geometry:
+        if geom is None or geom.is_empty:
+            shapes.append(None)
+            continue
+        polygons = geom.geoms if geom.geom_type == "MultiPolygon" else [geom]
+        shapes.append([
+            [_quantize(ring, translate, decimals) for ring in (p.exterior, *p.interiors)]
+            for p in polygons
+        ])
+
+    junctions = _junctions(ring for shape in shapes if shape for polygon in shape for ring in polygon)
+    arcs, arc_index = [], {}
+    geometries = []
+    properties = zones.drop(columns=zones.geometry.name).to_dict("records")
+    for shape, props in zip(shapes, properties):
+        props = {k: (None if isinstance(v, float) and np.isnan(v) else _plain(v)) for k, v in props.items()}
+        if shape is None:
+            geometries.append({"type": None, "properties": props})
+            continue
+        polygons = [[_ring_arcs(ring, junctions, arcs, arc_index) for ring in polygon] for polygon in shape]
+        if len(polygons) == 1:
+            geometries.append({"type": "Polygon", "arcs": polygons[0], "properties": props})
+        else:
+            geometries.append({"type": "MultiPolygon", "arcs": polygons, "properties": props})
+
+    return {
+        "type": "Topology",
+        "transform": {"scale": [scale, scale], "translate": translate},
+        "objects": {TOPOLOGY_OBJECT: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": [_delta_encode(arc) for arc in arcs],
+    }
+
+
+def _plain(value):
+    #numpy scalars → JSON-serialisable Python values
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _quantize(ring, translate, decimals) -> list:
+    """Ring as a list of integer (x, y) points, closing point dropped, repeats removed."""
+    coords = np.asarray(ring.coords)[:, :2]
+    ints = np.rint((coords - translate) * 10.0 ** decimals).astype(np.int64)
+    keep = np.ones(len(ints), dtype=bool)
+    keep[1:] = (ints[1:] != ints[:-1]).any(axis=1)
+    points = [tuple(p) for p in ints[keep].tolist()]
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def _junctions(rings) -> set:
+    """Points whose pair of neighbours is not the same in every ring that passes through them."""
+    neighbours = {}
+    junctions = set()
+    for ring in rings:
+        n = len(ring)
+        for i, point in enumerate(ring):
+            pair = frozenset((ring[i - 1], ring[(i + 1) % n]))
+            seen = neighbours.setdefault(point, pair)
+            if seen != pair:
+                junctions.add(point)
+    return junctions
+
+
+def _ring_arcs(ring, junctions, arcs, arc_index) -> list:
+    """Cut one ring into arcs at its junctions and return the arc references."""
+    cuts = [i for i, p in enumerate(ring) if p in junctions]
+    if not cuts:
+        #no junction: the whole ring is one closed arc, started at its smallest point so
+        #that a ring shared by two zones (an island and its hole) is found again
+        start = ring.index(min(ring))
+        rotated = ring[start:] + ring[:start]
+        return [_arc_ref(rotated + [rotated[0]], arcs, arc_index)]
+
+    rotated = ring[cuts[0]:] + ring[:cuts[0]]
+    cuts = [i - cuts[0] for i in cuts] + [len(ring)]
+    rotated.append(rotated[0])
+    return [_arc_ref(rotated[a:b + 1], arcs, arc_index) for a, b in zip(cuts, cuts[1:])]
+
+
+def _arc_ref(points, arcs, arc_index) -> int:
+    key = tuple(points)
+    if key in arc_index:
+        return arc_index[key]
+    reverse = key[::-1]
+    if reverse in arc_index:
+        return ~arc_index[reverse]
+    arc_index[key] = len(arcs)
+    arcs.append(points)
+    return arc_index[key]
+
+
+def _delta_encode(points) -> list:
+    encoded = [list(points[0])]
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        encoded.append([x1 - x0, y1 - y0])
+    return encoded
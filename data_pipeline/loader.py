@@ -2,10 +2,15 @@
 Load the csv files and the geojson together
 """
 
+import glob
+import re
 from pathlib import Path
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 
+from data_pipeline.schema import DATETIME_COLUMNS, DATETIME_FORMAT, RAW_TRIP_DTYPES
+
 
 ROOT = Path(__file__).resolve().parents[1]
 
@@ -13,14 +18,98 @@ TRIP_DATA_PATH = ROOT / "yellow_tripdata_2019-01.csv"
 ZONE_LOOKUP_PATH = ROOT / "taxi_zone_lookup.csv"
 ZONE_SHAPEFILE_PATH = ROOT / "taxi_zones" / "taxi_zones.shp"
 
+#rows per chunk when the trip file is streamed instead of loaded whole
+DEFAULT_CHUNKSIZE = 250_000
+
+
+#TLC monthly files are named like yellow_tripdata_2019-01.csv
+_MONTH_IN_NAME = re.compile(r"(\d{4})-(\d{2})")
+
+
+def resolve_trip_files(patterns=None):
+    """
+    Turn a glob pattern, a path, or a list of either into a sorted list of
+    trip files.  ``None`` means the single default TRIP_DATA_PATH.
+    """
+    if patterns is None:
+        return [TRIP_DATA_PATH]
+    if isinstance(patterns, (str, Path)):
+        patterns = [patterns]
+
+    paths = []
+    for pattern in patterns:
+        if glob.has_magic(str(pattern)):
+            matches = sorted(glob.glob(str(pattern)))
+            if not matches:
+                raise FileNotFoundError(f"No trip data files match {pattern}")
+            paths.extend(Path(m) for m in matches)
+        else:
+            paths.append(Path(pattern))
+    return sorted(set(paths))
+
+
+def month_window(path):
+    """
+    Return the valid pickup window (first day of the month, first day of the
+    next month) for a monthly trip file, based on the YYYY-MM in its name.
+    Returns None when the name has no month in it.
+    """
+    match = _MONTH_IN_NAME.search(Path(path).name)
+    if match is None:
+        return None
+    start = pd.Period(f"{match.group(1)}-{match.group(2)}", freq="M")
+    return (start.start_time.strftime("%Y-%m-%d"), (start + 1).start_time.strftime("%Y-%m-%d"))
+
 
 def load_trip_data(path= TRIP_DATA_PATH):
     try:
-        df = pd.read_csv(path)
+        df = pd.read_csv(path, **_TRIP_READ_OPTIONS)
     except FileNotFoundError: 
         raise FileNotFoundError(
             f"Trip data file not found at {path}. Please download it from the project README and place it there."
         )   
+    return _apply_schema(df)
+
+
+def iter_trip_data(path= TRIP_DATA_PATH, chunksize= DEFAULT_CHUNKSIZE):
+    """Yield the trip file as DataFrames of at most ``chunksize`` rows."""
+    try:
+        reader = pd.read_csv(path, chunksize=chunksize, **_TRIP_READ_OPTIONS)
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Trip data file not found at {path}. Please download it from the project README and place it there."
+        )
+    with reader:
+        for chunk in reader:
+            yield _apply_schema(chunk)
+
+
+#The C parser is slow at nullable ints, so those columns are read as float64
+#and cast to their small Int dtype afterwards (see _apply_schema).
+_NULLABLE_INT_COLUMNS = {
+    col: dtype for col, dtype in RAW_TRIP_DTYPES.items()
+    if isinstance(dtype, str) and dtype.startswith("Int")
+}
+
+#typed reads: only the schema's columns, each with its final dtype
+_TRIP_READ_OPTIONS = {
+    "usecols": lambda col: col in RAW_TRIP_DTYPES,
+    "dtype": {col: "float64" if col in _NULLABLE_INT_COLUMNS else dtype for col, dtype in RAW_TRIP_DTYPES.items()},
+}
+
+
+def _apply_schema(df):
+    for col, dtype in _NULLABLE_INT_COLUMNS.items():
+        if col in df.columns:
+            try:
+                df[col] = df[col].astype(dtype)
+            except (TypeError, ValueError):
+                #fractional or out-of-range codes: keep the floats, the normalizer copes
+                pass
+    #fixed-format parse; anything malformed becomes NaT and is dropped by the cleaner
+    for col in DATETIME_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], format=DATETIME_FORMAT, errors="coerce")
     return df
 
 
@@ -37,33 +126,63 @@ def load_zone_geodata(path= ZONE_SHAPEFILE_PATH):
 
 
 
+#(lookup column, pickup column, dropoff column) added by integrate_zones
+ZONE_COLUMNS = [
+    ("Borough", "PU_Borough", "DO_Borough"),
+    ("Zone", "PU_Zone", "DO_Zone"),
+    ("service_zone", "PU_ServiceZone", "DO_ServiceZone"),
+]
+
+
 def integrate_zones(trips: pd.DataFrame, zones: pd.DataFrame,):
-    # Pickup merge
-    trips = trips.merge(
-        zones,
-        left_on="PULocationID",
-        right_on="LocationID",
-        how="left",
-    )
-
-    #rename the Borough and zone so we know which is for pickup and for dropoff
-    trips = trips.rename(
-        columns={"Borough": "PU_Borough", "Zone": "PU_Zone", "service_zone": "PU_ServiceZone"}
-    ).drop(columns=["LocationID"], errors="ignore")
-
-    #drop-off merge
-    trips = trips.merge(
-        zones,
-        left_on="DOLocationID",
-        right_on="LocationID",
-        how="left",
-    )
-    #rename the Borough and zone so we know which is for pickup and for dropoff
-    trips = trips.rename(
-        columns={"Borough": "DO_Borough", "Zone": "DO_Zone", "service_zone": "DO_ServiceZone"}
-    ).drop(columns=["LocationID"], errors="ignore")
-
-    return trips
+    """
+    Add pickup and drop-off borough, zone and service zone to every trip.
+
+    Instead of joining, the location IDs index straight into a small per-ID
+    code table built from the 265-row lookup, so no trip column is copied.
+    The six new columns are categoricals sharing one dictionary.  IDs that are
+    blank or not in the lookup get NaN, just like the left join did.
+    """
+    dictionary, table = zone_code_table(zones)
+    dtype = pd.CategoricalDtype(dictionary)
+
+    new_columns = {}
+    for id_col, side in (("PULocationID", 1), ("DOLocationID", 2)):
+        codes = _gather_codes(trips[id_col], table)
+        for j, names in enumerate(ZONE_COLUMNS):
+            new_columns[names[side]] = pd.Categorical.from_codes(codes[:, j], dtype=dtype)
+
+    #same column order as the old pickup-then-dropoff merges
+    ordered = [names[side] for side in (1, 2) for names in ZONE_COLUMNS]
+    return trips.assign(**{name: new_columns[name] for name in ordered})
+
+
+def zone_code_table(zones: pd.DataFrame):
+    """
+    Return ``(dictionary, table)``: one Index holding every borough, zone and
+    service zone name, and an int16 array where ``table[location_id, j]`` is
+    the dictionary position of ZONE_COLUMNS[j] for that zone (-1 = unknown).
+    """
+    ids = pd.to_numeric(zones["LocationID"], errors="coerce")
+    zones = zones[ids.notna() & (ids >= 0)]
+    ids = ids[zones.index].astype("int64").to_numpy()
+
+    values = pd.concat([zones[col] for col, _, _ in ZONE_COLUMNS], ignore_index=True).dropna()
+    dictionary = pd.Index(values.unique())
+
+    table = np.full((ids.max() + 1 if len(ids) else 0, len(ZONE_COLUMNS)), -1, dtype=np.int16)
+    for j, (col, _, _) in enumerate(ZONE_COLUMNS):
+        table[ids, j] = dictionary.get_indexer(zones[col])
+    return dictionary, table
+
+
+def _gather_codes(location_ids: pd.Series, table: np.ndarray) -> np.ndarray:
+    #unknown IDs (blank, negative or beyond the lookup) explicitly map to code -1 = NaN
+    loc = pd.to_numeric(location_ids, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    known = (loc >= 0) & (loc < len(table)) & (loc == np.floor(loc))
+    codes = np.full((len(loc), table.shape[1]), -1, dtype=np.int16)
+    codes[known] = table[loc[known].astype(np.int64)]
+    return codes
 
 #function to build the geojson data with location ids
 def build_zone_geodataframe(zones: pd.DataFrame,zone_geo: gpd.GeoDataFrame,) -> gpd.GeoDataFrame:
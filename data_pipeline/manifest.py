@@ -0,0 +1,146 @@
+"""
+manifest.py – Incremental runs
+------------------------------
+Remembers what each pipeline stage was last built from, so a re-run can skip
+stages whose inputs, settings and code have not changed.
+
+The manifest is a JSON file in the output directory.  For every stage it
+stores the fingerprints of its input files (size, mtime and SHA-256), the
+parameters it ran with (including the pipeline code version) and the
+fingerprints of the files it wrote.  A stage is up to date when all of those
+still match.  Files whose size and mtime are unchanged are trusted without
+re-hashing; when only the mtime moved, the content hash decides.
+"""
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+
+MANIFEST_NAME = "manifest.json"
+
+#bump to force a full rebuild even when no pipeline source file changed
+PIPELINE_VERSION = "1"
+
+_HASH_BLOCK_SIZE = 1 << 20
+
+
+def code_version(extra_sources=()) -> str:
+    """PIPELINE_VERSION plus a hash of the pipeline's source files and of ``extra_sources``."""
+    digest = hashlib.sha256(PIPELINE_VERSION.encode())
+    for source in [*sorted(Path(__file__).resolve().parent.glob("*.py")), *map(Path, extra_sources)]:
+        digest.update(source.name.encode())
+        digest.update(source.read_bytes())
+    return f"{PIPELINE_VERSION}-{digest.hexdigest()[:16]}"
+
+
+def file_fingerprint(path: Path, with_hash: bool = True) -> dict:
+    path = Path(path)
+    stat = path.stat()
+    fingerprint = {"path": str(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        fingerprint["sha256"] = _sha256(path)
+    return fingerprint
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Per-stage record of inputs, parameters and outputs, persisted as JSON."""
+
+    def __init__(self, path: Path, stages: Optional[dict] = None) -> None:
+        self.path = Path(path)
+        self.stages: dict[str, dict] = stages or {}
+
+    @classmethod
+    def load(cls, path: Path) -> "Manifest":
+        """Read the manifest at ``path``; a missing or unreadable file gives an empty one."""
+        path = Path(path)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return cls(path)
+        return cls(path, data.get("stages", {}))
+
+    def save(self) -> Path:
+        data = {
+            "code_version": code_version(),
+            "updated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "stages": self.stages,
+        }
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=2)
+        tmp.replace(self.path)
+        return self.path
+
+    def is_current(self, stage: str, inputs: dict[str, Path], params: dict) -> bool:
+        """
+        True when ``stage`` last ran with the same parameters on unchanged
+        ``inputs`` and all of its outputs are still on disk untouched.
+        """
+        entry = self.stages.get(stage)
+        if entry is None or entry.get("params") != params:
+            return False
+        if set(entry.get("inputs", {})) != set(inputs):
+            return False
+        for name, path in inputs.items():
+            if not _still_matches(entry["inputs"][name], path, rehash=True):
+                return False
+        for recorded in entry.get("outputs", {}).values():
+            if not _still_matches(recorded, recorded["path"], rehash=False):
+                return False
+        return True
+
+    def record(self, stage: str, inputs: dict[str, Path], params: dict, outputs: dict[str, Path], **extra) -> None:
+        """Store the fingerprints of a stage that just finished."""
+        self.stages[stage] = {
+            "inputs": {name: self._input_fingerprint(stage, name, path) for name, path in inputs.items()},
+            "params": params,
+            "outputs": {name: file_fingerprint(path, with_hash=False) for name, path in outputs.items()},
+            "completed_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            **extra,
+        }
+
+    def forget(self, keep: set[str]) -> None:
+        """Drop every stage not named in ``keep``."""
+        self.stages = {name: entry for name, entry in self.stages.items() if name in keep}
+
+    def _input_fingerprint(self, stage: str, name: str, path: Path) -> dict:
+        #reuse the hash from the last run when the file is untouched
+        previous = self.stages.get(stage, {}).get("inputs", {}).get(name)
+        current = file_fingerprint(path, with_hash=False)
+        if previous and previous.get("sha256") and _same_stat(previous, current):
+            current["sha256"] = previous["sha256"]
+        else:
+            current["sha256"] = _sha256(Path(path))
+        return current
+
+
+def _same_stat(recorded: dict, current: dict) -> bool:
+    return recorded["size"] == current["size"] and recorded["mtime_ns"] == current["mtime_ns"]
+
+
+def _still_matches(recorded: dict, path, rehash: bool) -> bool:
+    path = Path(path)
+    if str(path) != recorded.get("path") or not path.exists():
+        return False
+    current = file_fingerprint(path, with_hash=False)
+    if _same_stat(recorded, current):
+        return True
+    #touched but maybe not changed: let the content decide
+    if not rehash or recorded["size"] != current["size"] or "sha256" not in recorded:
+        return False
+    if _sha256(path) != recorded["sha256"]:
+        return False
+    recorded["mtime_ns"] = current["mtime_ns"]
+    return True
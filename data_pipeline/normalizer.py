@@ -1,40 +1,12 @@
 import pandas as pd
 
-DATETIME_COLUMNS = [
-    "tpep_pickup_datetime",
-    "tpep_dropoff_datetime",
-]
-
-NUMERIC_COLUMNS = [
-    "trip_distance",
-    "fare_amount",
-    "extra",
-    "mta_tax",
-    "tip_amount",
-    "tolls_amount",
-    "improvement_surcharge",
-    "total_amount",
-    "congestion_surcharge",
-    "passenger_count",
-]
-
-CATEGORICAL_TEXT_COLUMNS = [
-    "PU_Borough",
-    "DO_Borough",
-    "PU_Zone",
-    "DO_Zone",
-    "PU_ServiceZone",
-    "DO_ServiceZone",
-    "store_and_fwd_flag",
-]
-
-CATEGORICAL_ID_COLUMNS = [
-    "VendorID",
-    "RatecodeID",
-    "PULocationID",
-    "DOLocationID",
-    "payment_type",
-]
+#the column groups live in schema.py; re-exported here for existing imports
+from data_pipeline.schema import (
+    CATEGORICAL_ID_COLUMNS,
+    CATEGORICAL_TEXT_COLUMNS,
+    DATETIME_COLUMNS,
+    NUMERIC_COLUMNS,
+)
 
 
 
@@ -46,29 +18,48 @@ def normalize(df: pd.DataFrame):
     return df
 
 
+#The loader already reads with the types from schema.py, so each step below only
+#does work for columns that did not arrive typed (e.g. frames built elsewhere).
+
 def _normalize_datetimes(df: pd.DataFrame):
     for col in DATETIME_COLUMNS:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors="coerce", utc=True)
+        if col not in df.columns:
+            continue
+        s = df[col]
+        if isinstance(s.dtype, pd.DatetimeTZDtype):
+            if str(s.dtype.tz) != "UTC":
+                df[col] = s.dt.tz_convert("UTC")
+        elif pd.api.types.is_datetime64_dtype(s):
+            df[col] = s.dt.tz_localize("UTC")
+        else:
+            df[col] = pd.to_datetime(s, errors="coerce", utc=True)
     return df
 
 
 def _normalize_numerics(df: pd.DataFrame):
     for col in NUMERIC_COLUMNS:
-        if col in df.columns:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
             df[col] = pd.to_numeric(df[col], errors="coerce")
     return df
 
 #Strip whitespace and title-case text categorical columns.
 def _normalize_text_categories(df: pd.DataFrame):
     for col in CATEGORICAL_TEXT_COLUMNS:
-        if col in df.columns:
-            df[col] = df[col].astype(str).str.strip().str.title()
+        if col not in df.columns:
+            continue
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            #clean the handful of categories instead of every row
+            cleaned = s.cat.categories.astype(str).str.strip().str.title()
+            if cleaned.is_unique:
+                df[col] = s.cat.rename_categories(cleaned)
+                continue
+        df[col] = s.astype(str).str.strip().str.title()
     return df
 
 
 def _normalize_id_categories(df: pd.DataFrame):
     for col in CATEGORICAL_ID_COLUMNS:
-        if col in df.columns:
+        if col in df.columns and not pd.api.types.is_integer_dtype(df[col]):
             df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
     return df
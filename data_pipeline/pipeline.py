@@ -5,67 +5,544 @@ In this file we now bring everything together
 3.clean the data - clear.py
 4.Normalize it - feature_engineering.py
 6.Export the data - Export the data in the output direcotry     
+
+With --chunksize the trip file is streamed: every chunk goes through steps
+2-5 on its own and is appended to the output, so memory stays flat however
+large the input is.
+
+Several monthly files (a list or a glob) are processed side by side in a
+process pool.  Each file is cleaned against its own month, gets its own
+exclusion log, and is written to processed_trips/<file name>.<format>; the
+logs are then merged into exclusion_log.csv.
+
+Runs are incremental: output/manifest.json records what every stage was
+built from (see manifest.py), and stages whose inputs and code are unchanged
+are skipped.  Use --force to rebuild everything.
+
+Every run writes output/run_report.json with the time, rows and memory of
+each stage (see profiling.py); --trace-memory adds allocation peaks and
+--profile a cProfile dump.
+
+--sink database writes the processed trips straight into
+database/taxi_data.db instead of the processed_trips files (--sink both
+writes both), so the database is ready without running load_data.py.  With
+several files each worker writes a staging database under
+output/database_staging/, and the main process merges them.
 """
 
+import argparse
+import os
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import NamedTuple
+
+import pandas as pd
 
 from data_pipeline.loader import (
+    ZONE_LOOKUP_PATH,
+    ZONE_SHAPEFILE_PATH,
     load_trip_data,
+    iter_trip_data,
     load_zone_geodata,
     load_zone_lookup,
     integrate_zones,
     build_zone_geodataframe,
+    month_window,
+    resolve_trip_files,
 )
-from data_pipeline.cleaner import clean
+from data_pipeline.cleaner import clean, DuplicateTracker, exclusion_reasons
 from data_pipeline.normalizer import normalize
 from data_pipeline.feature_engineering import engineer_features
-from data_pipeline.exclusion_log import ExclusionLog
+from data_pipeline.exclusion_log import (
+    ExclusionLog,
+    LOG_MODES,
+    merge_log_files,
+    merge_summaries,
+    print_summary,
+)
+from data_pipeline.export import (
+    DATABASE_SOURCES,
+    DEFAULT_TRIP_FORMAT,
+    TRIP_FORMATS,
+    TripWriters,
+    load_data_module,
+    open_database_writer,
+    open_trip_writer,
+    remove_trip_outputs,
+    trips_output_path,
+    trips_partition_path,
+)
+from data_pipeline.geometry import (
+    GEOMETRY_LEVELS,
+    ZONE_GEOJSON_NAME,
+    simplify_zones,
+    write_geojson,
+    write_topojson,
+    zone_geometry_path,
+)
+from data_pipeline.manifest import MANIFEST_NAME, Manifest, code_version
+from data_pipeline.profiling import NULL_PROFILER, PROFILE_NAME, Profiler, profile_calls
 
 
 ROOT = Path(__file__).resolve().parents[1]
 OUTPUT_DIR = ROOT / "data_pipeline" / "output"
+#per-file exclusion logs written by the workers of a multi-file run
+LOG_PARTITION_DIR_NAME = "exclusion_logs"
+#scratch space for exclusion logs in "spill" mode
+SPILL_DIR_NAME = ".exclusion_spill"
 
+#where the processed trips go: the processed_trips files, the database, or both
+SINKS = ("files", "database", "both")
+DEFAULT_DB_PATH = ROOT / "database" / "taxi_data.db"
+#per-file databases of a multi-file run with the database sink
+STAGING_DIR_NAME = "database_staging"
 
-def run_pipeline():
+
+class _Partition(NamedTuple):
+    """One input file of a multi-file run and the outputs it produces (trips_path / db_path None when not written)."""
+    stage: str
+    path: Path
+    inputs: dict
+    trips_path: Path
+    log_path: Path
+    db_path: Path
+
+    def outputs(self):
+        outputs = {"trips": self.trips_path, "database": self.db_path, "exclusion_log": self.log_path}
+        return {name: path for name, path in outputs.items() if path is not None}
+
+
+def run_pipeline(trip_files=None, chunksize=None, trips_format=DEFAULT_TRIP_FORMAT, workers=None, force=False, all_reasons=False, log_mode="full", profile=False, trace_memory=False, sink="files", db_path=DEFAULT_DB_PATH):
+    if sink not in SINKS:
+        raise ValueError(f"Unknown sink {sink!r}; expected one of {SINKS}")
 
     #ensure output directory exists
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    #load th edata
-    trips = load_trip_data()
-    zones = load_zone_lookup()
-    zone_geo = load_zone_geodata()
+    #the manifest says which outputs are still valid; force ignores it
+    manifest_path = OUTPUT_DIR / MANIFEST_NAME
+    manifest = Manifest(manifest_path) if force else Manifest.load(manifest_path)
+    params = {"code_version": code_version(), "format": trips_format, "all_reasons": all_reasons, "log_mode": log_mode, "sink": sink}
+    db_path = Path(db_path) if sink != "files" else None
+    if db_path:
+        params["db"] = str(db_path)
+        #a database written by an older loader or schema is stale too
+        params["code_version"] = code_version(DATABASE_SOURCES)
+
+    profiler = Profiler(trace_memory=trace_memory)
+    if trace_memory:
+        tracemalloc.start()
+    profile_path = OUTPUT_DIR / PROFILE_NAME if profile else None
+
+    with profile_calls(profile_path), profiler.stage("pipeline"):
+        #load th edata
+        paths = resolve_trip_files(trip_files)
+        with profiler.stage("load.zone_lookup"):
+            zones = load_zone_lookup()
+        log_path = OUTPUT_DIR / "exclusion_log.csv"
+
+        if len(paths) == 1:
+            stages = [_build_single(paths[0], zones, trips_format, chunksize, log_path, manifest, params, profiler, db_path)]
+        else:
+            stages = _build_partitions(paths, zones, trips_format, chunksize, workers, log_path, manifest, params, profiler, profile, db_path)
+
+        stages.append(_build_zone_geodata(manifest, {"code_version": code_version()}, profiler))
+        manifest.forget(keep=set(stages))
+        manifest.save()
+
+    if trace_memory:
+        tracemalloc.stop()
+    report_path = profiler.write_report(
+        OUTPUT_DIR,
+        code_version=params["code_version"],
+        trip_files=[str(p) for p in paths],
+        chunksize=chunksize,
+        format=trips_format,
+        workers=workers,
+        sink=sink,
+    )
+    print(f"[pipeline] Run report → {report_path.name}")
+    if profile_path:
+        print(f"[pipeline] cProfile stats → {profile_path.name} (python -m pstats {profile_path})")
+
+    print("Pipeline completed")
+
+
+def _build_single(path, zones, trips_format, chunksize, log_path, manifest, params, profiler, db_path=None):
+    """Trips (file and/or database) + exclusion log for a single input file.  Returns the stage name."""
+    stage = "trips"
+    trips_path = trips_output_path(OUTPUT_DIR, trips_format) if params["sink"] != "database" else None
+    inputs = {"trips": path, "zone_lookup": ZONE_LOOKUP_PATH}
+    outputs = {name: p for name, p in (("trips", trips_path), ("database", db_path)) if p is not None}
+
+    #load_data.py picks up whatever is in the output dir, so drop other layouts/formats
+    #(and, without a file sink, processed files that no longer match the database)
+    remove_trip_outputs(OUTPUT_DIR, keep=[trips_path] if trips_path else [])
+    _remove_log_partitions(keep=[])
+    _remove_staging_databases(keep=[])
+
+    if manifest.is_current(stage, inputs, params):
+        print(f"[pipeline] {Path(path).name} unchanged, keeping {', '.join(p.name for p in outputs.values())}")
+        print_summary(_recorded_summary(manifest.stages[stage]))
+        profiler.skip(stage)
+        return stage
+
+    log = _new_log(path, params["log_mode"], stage)
+    rows = process_trip_file(path, zones, trips_path, log, chunksize=chunksize, all_reasons=params["all_reasons"], profiler=profiler, db_path=db_path)
+    for output in outputs.values():
+        print(f"[pipeline] Saved processed trips → {output.name}")
+
+    #output the log file for errors
+    with profiler.stage("export.exclusion_log") as run:
+        log.save(log_path)
+        log.discard_spill()
+        run.rows_out = log.summary()["count"].sum()
+    log.print_summary()
+
+    manifest.record(
+        stage, inputs, params,
+        outputs={**outputs, "exclusion_log": log_path},
+        rows=rows, exclusions=_summary_records(log.summary()),
+    )
+    return stage
+
+
+def _build_partitions(paths, zones, trips_format, chunksize, workers, log_path, manifest, params, profiler, profile=False, db_path=None):
+    """
+    One trips + exclusion log partition per input file, only for new or
+    changed files.  With ``db_path``, the per-file staging databases are then
+    merged into the database.
+    """
+    names = [Path(p).stem for p in paths]
+    if len(set(names)) != len(names):
+        raise ValueError("Trip files must have distinct names, they are used as partition names")
+
+    parts = [
+        _Partition(
+            stage=f"trips/{name}",
+            path=path,
+            inputs={"trips": path, "zone_lookup": ZONE_LOOKUP_PATH},
+            trips_path=trips_partition_path(OUTPUT_DIR, name, trips_format) if params["sink"] != "database" else None,
+            log_path=OUTPUT_DIR / LOG_PARTITION_DIR_NAME / f"{name}.csv",
+            db_path=OUTPUT_DIR / STAGING_DIR_NAME / f"{name}.db" if db_path else None,
+        )
+        for path, name in zip(paths, names)
+    ]
+
+    remove_trip_outputs(OUTPUT_DIR, keep=[p.trips_path for p in parts if p.trips_path])
+    _remove_log_partitions(keep=[p.log_path for p in parts])
+    _remove_staging_databases(keep=[p.db_path for p in parts if p.db_path])
+
+    todo = [p for p in parts if not manifest.is_current(p.stage, p.inputs, params)]
+    if len(todo) < len(parts):
+        print(f"[pipeline] {len(parts) - len(todo)} of {len(parts)} files unchanged, skipping them")
+        for part in parts:
+            if part not in todo:
+                profiler.skip(part.stage)
+    if todo:
+        results = _run_parallel(todo, zones, chunksize, workers, params["all_reasons"], params["log_mode"], profiler.trace_memory, profile)
+        for part in todo:
+            rows, summary, records = results[part.stage]
+            profiler.merge(records, file_name=Path(part.path).name)
+            manifest.record(
+                part.stage, part.inputs, params,
+                outputs=part.outputs(),
+                rows=rows, exclusions=_summary_records(summary),
+            )
+
+    #the merged log only needs rebuilding when a partition changed
+    merge_inputs = {p.stage: p.log_path for p in parts}
+    if todo or not manifest.is_current("exclusion_log", merge_inputs, params):
+        with profiler.stage("export.exclusion_log"):
+            merge_log_files([p.log_path for p in parts], log_path)
+        manifest.record("exclusion_log", merge_inputs, params, outputs={"exclusion_log": log_path})
 
+    stages = [p.stage for p in parts] + ["exclusion_log"]
+    if db_path:
+        staging_inputs = {p.stage: p.db_path for p in parts}
+        if todo or not manifest.is_current("database", staging_inputs, params):
+            with profiler.stage("export.database") as run:
+                with load_data_module().DatabaseBuild(db_path, ZONE_LOOKUP_PATH, verbose=False) as build:
+                    for part in parts:
+                        build.add_database(part.db_path)
+                run.rows_out = build.rows_written
+            print(f"[pipeline] Saved processed trips → {db_path.name}")
+            manifest.record("database", staging_inputs, params, outputs={"database": db_path})
+        else:
+            print(f"[pipeline] Staging databases unchanged, keeping {db_path.name}")
+            profiler.skip("database")
+        stages.append("database")
+
+    print_summary(merge_summaries([_recorded_summary(manifest.stages[p.stage]) for p in parts]))
+    return stages
+
+
+def _build_zone_geodata(manifest, params, profiler):
+    stage = "zones"
+    geo_path = OUTPUT_DIR / ZONE_GEOJSON_NAME
+    inputs = {"zone_lookup": ZONE_LOOKUP_PATH}
+    for part in sorted(ZONE_SHAPEFILE_PATH.parent.glob(f"{ZONE_SHAPEFILE_PATH.stem}.*")):
+        inputs[f"zone_shapefile{part.suffix}"] = part
+
+    if manifest.is_current(stage, inputs, params):
+        print(f"[pipeline] Zone files unchanged, keeping {geo_path.name}")
+        profiler.skip(stage)
+        return stage
+
+    with profiler.stage("load.zone_geodata"):
+        zones = load_zone_lookup()
+        zone_geo = load_zone_geodata()
+    with profiler.stage("zones.build") as run:
+        zones_full = build_zone_geodataframe(zones, zone_geo)
+        run.rows_out = len(zones_full)
+    with profiler.stage("export.zones"):
+        zones_full.to_file(geo_path, driver="GeoJSON")
+    print(f"[pipeline] Saved zone geodata   → {geo_path.name}")
+
+    #lighter copies for the map, one per simplification level
+    outputs = {"geojson": geo_path}
+    for level, (tolerance, decimals) in GEOMETRY_LEVELS.items():
+        with profiler.stage(f"zones.simplify.{level}"):
+            simplified = simplify_zones(zones_full, tolerance, decimals)
+        with profiler.stage("export.zones"):
+            outputs[f"{level}.geojson"] = zone_geometry_path(OUTPUT_DIR, level, "geojson")
+            outputs[f"{level}.topojson"] = zone_geometry_path(OUTPUT_DIR, level, "topojson")
+            write_geojson(simplified, outputs[f"{level}.geojson"])
+            write_topojson(simplified, outputs[f"{level}.topojson"], decimals)
+    print(f"[pipeline] Saved simplified zones → {', '.join(GEOMETRY_LEVELS)} (GeoJSON + TopoJSON)")
+
+    manifest.record(stage, inputs, params, outputs=outputs)
+    return stage
+
+
+def _new_log(path, log_mode, stage):
+    spill_dir = OUTPUT_DIR / SPILL_DIR_NAME / stage if log_mode == "spill" else None
+    return ExclusionLog(reason_order=exclusion_reasons(month_window(path)), mode=log_mode, spill_dir=spill_dir)
+
+
+def _remove_log_partitions(keep):
+    keep = {Path(p) for p in keep}
+    log_dir = OUTPUT_DIR / LOG_PARTITION_DIR_NAME
+    if log_dir.is_dir():
+        for part in log_dir.glob("*.csv"):
+            if part not in keep:
+                part.unlink()
+
+
+def _remove_staging_databases(keep):
+    keep = {Path(p) for p in keep}
+    staging_dir = OUTPUT_DIR / STAGING_DIR_NAME
+    if staging_dir.is_dir():
+        for part in staging_dir.glob("*.db"):
+            if part not in keep:
+                part.unlink()
+
+
+def _summary_records(summary):
+    return [{"reason": r, "count": int(c)} for r, c in zip(summary["reason"], summary["count"])]
+
+
+def _recorded_summary(entry):
+    return pd.DataFrame(entry.get("exclusions", []), columns=["reason", "count"])
+
+
+def process_trip_file(path, zones, trips_path, log, chunksize=None, verbose=True, all_reasons=False, profiler=None, db_path=None, db_staging=False, zone_lookup_path=None):
+    """
+    Run integrate → clean → normalize → features over one trip file and write
+    the result to ``trips_path`` and/or straight into the SQLite database at
+    ``db_path`` (a staging database with ``db_staging``, see export.py).
+    Returns the number of trips written.  ``all_reasons`` is passed on to
+    ``cleaner.clean``; ``profiler`` times each step (see profiling.py).
+    """
+    profiler = profiler or NULL_PROFILER
+    window = month_window(path)
+    writers = []
+    if trips_path:
+        writers.append(open_trip_writer(trips_path))
+    if db_path:
+        writers.append(open_database_writer(db_path, zone_lookup_path or ZONE_LOOKUP_PATH, staging=db_staging, verbose=False))
+    with TripWriters(writers) as writer:
+        if chunksize:
+            _run_streaming(path, zones, log, writer, chunksize, window, verbose, all_reasons, profiler)
+        else:
+            with profiler.stage("load") as run:
+                trips = load_trip_data(path)
+                run.rows_out = len(trips)
+
+            _process_trips(trips, zones, log, writer, window, verbose, all_reasons, profiler)
+    return writer.rows_written
+
+
+def _process_trips(trips, zones, log, writer, window, verbose, all_reasons, profiler, duplicates=None):
+    """integrate → clean → normalize → features → write, for one frame (a whole file or a chunk)."""
     #integrating the data 
-    trips = integrate_zones(trips, zones)
-    zones_full = build_zone_geodataframe(zones, zone_geo)
+    with profiler.stage("integrate", rows_in=len(trips)) as run:
+        trips = integrate_zones(trips, zones)
+        run.rows_out = len(trips)
 
     #clean the data
-    log = ExclusionLog()
-    trips = clean(trips, log)
+    with profiler.stage("clean", rows_in=len(trips)) as run:
+        trips = clean(trips, log, duplicates=duplicates, verbose=verbose, window=window, all_reasons=all_reasons, profiler=profiler)
+        run.rows_out = len(trips)
 
     #normalization
-    trips = normalize(trips)
+    with profiler.stage("normalize", rows_in=len(trips)) as run:
+        trips = normalize(trips)
+        run.rows_out = len(trips)
 
     #feature engineering
-    trips = engineer_features(trips)
+    with profiler.stage("features", rows_in=len(trips)) as run:
+        trips = engineer_features(trips, verbose=verbose)
+        run.rows_out = len(trips)
 
     #export the data now 
-    trips_path = OUTPUT_DIR / "processed_trips.csv"
-    trips.to_csv(trips_path, index=False)
-    print(f"[pipeline] Saved processed trips → {trips_path.name}")
+    with profiler.stage("export.trips", rows_in=len(trips)) as run:
+        writer.write(trips)
+        run.rows_out = len(trips)
 
-    geo_path = OUTPUT_DIR / "processed_zones.geojson"
-    zones_full.to_file(geo_path, driver="GeoJSON")
-    print(f"[pipeline] Saved zone geodata   → {geo_path.name}")
 
-    #output the log file for errors
-    log_path = OUTPUT_DIR / "exclusion_log.csv"
-    log.save(log_path)
-    log.print_summary()
+def _run_streaming(path, zones, log, writer, chunksize, window, verbose, all_reasons, profiler):
+    """Run integrate → clean → normalize → features one chunk at a time, appending to ``writer``."""
+    duplicates = DuplicateTracker()
+    rows_in = 0
+    chunks = profiler.iterate("load", iter_trip_data(path, chunksize=chunksize))
+    for i, chunk in enumerate(chunks):
+        rows_in += len(chunk)
+        _process_trips(chunk, zones, log, writer, window, False, all_reasons, profiler, duplicates)
 
-    print("Pipeline completed")
+        if verbose:
+            print(f"[pipeline] Chunk {i + 1}: {rows_in:,} rows read, {writer.rows_written:,} kept")
+
+    if verbose:
+        print(f"[cleaner] {writer.rows_written:,} records remain after cleaning")
+
+
+def _run_parallel(parts, zones, chunksize, workers, all_reasons, log_mode, trace_memory=False, profile=False):
+    """
+    Process each partition's trip file in its own worker process.
+    Returns {stage: (rows, summary, profiler records)}.
+    """
+    workers = workers or min(len(parts), os.cpu_count() or 1)
+    print(f"[pipeline] Processing {len(parts)} files with {workers} workers")
+    for output in parts[0].outputs().values():
+        output.parent.mkdir(parents=True, exist_ok=True)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(
+                _process_partition, part, zones, chunksize, all_reasons, log_mode, trace_memory,
+                OUTPUT_DIR / f"{Path(PROFILE_NAME).stem}.{Path(part.path).stem}.prof" if profile else None,
+            ): part
+            for part in parts
+        }
+        for future in as_completed(futures):
+            part = futures[future]
+            results[part.stage] = future.result()
+            output = part.trips_path or part.db_path
+            print(f"[pipeline] Saved {results[part.stage][0]:,} processed trips → {output.parent.name}/{output.name}")
+    return results
+
+
+def _process_partition(part, zones, chunksize, all_reasons, log_mode, trace_memory=False, profile_path=None):
+    #runs inside a worker process: each worker keeps its own exclusion log and profiler
+    profiler = Profiler(trace_memory=trace_memory)
+    if trace_memory:
+        tracemalloc.start()
+    with profile_calls(profile_path):
+        log = _new_log(part.path, log_mode, part.stage)
+        rows = process_trip_file(part.path, zones, part.trips_path, log, chunksize=chunksize, verbose=False, all_reasons=all_reasons, profiler=profiler, db_path=part.db_path, db_staging=True)
+        with profiler.stage("export.exclusion_log") as run:
+            log.save(part.log_path)
+            log.discard_spill()
+            run.rows_out = log.summary()["count"].sum()
+    if trace_memory:
+        tracemalloc.stop()
+    return rows, log.summary(), profiler.records()
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Run the NYC taxi data pipeline.")
+    parser.add_argument(
+        "trip_files",
+        nargs="*",
+        help="monthly trip CSVs or glob patterns (default: yellow_tripdata_2019-01.csv in the project root)",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="stream the trip file in chunks of this many rows (default: load it whole)",
+    )
+    parser.add_argument(
+        "--format",
+        dest="trips_format",
+        choices=TRIP_FORMATS,
+        default=DEFAULT_TRIP_FORMAT,
+        help="file format for the processed trips (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--sink",
+        choices=SINKS,
+        default="files",
+        help="write the processed trips to files (for load_data.py), straight into the database, or both (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--db",
+        dest="db_path",
+        type=Path,
+        default=DEFAULT_DB_PATH,
+        help="database the database sink builds (default: database/taxi_data.db)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="worker processes when several files are given (default: one per CPU core)",
+    )
+    parser.add_argument(
+        "--all-reasons",
+        action="store_true",
+        help="list every rule an excluded row breaks in the exclusion log, not just the first",
+    )
+    parser.add_argument(
+        "--log-mode",
+        choices=LOG_MODES,
+        default="full",
+        help="exclusion log storage: full rows in memory, compact row IDs + reasons, "
+             "or row IDs in memory with full rows spilled to disk (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="run under cProfile and save the stats to output/run_profile.prof",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="record per-stage allocation peaks in the run report (slower)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="ignore the manifest and rebuild every output",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    run_pipeline()
+    args = _parse_args()
+    run_pipeline(
+        trip_files=args.trip_files or None,
+        chunksize=args.chunksize,
+        trips_format=args.trips_format,
+        workers=args.workers,
+        force=args.force,
+        all_reasons=args.all_reasons,
+        log_mode=args.log_mode,
+        profile=args.profile,
+        trace_memory=args.trace_memory,
+        sink=args.sink,
+        db_path=args.db_path,
+    )
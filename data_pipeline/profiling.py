@@ -0,0 +1,237 @@
+"""
+profiling.py – Run metrics
+--------------------------
+Times every pipeline stage and writes the numbers to ``run_report.json`` next
+to ``exclusion_log.csv``, so we can see which stage dominates a month and
+compare runs.
+
+Wrap a piece of work in ``profiler.stage(name)`` and set ``rows_in`` /
+``rows_out`` on the object it yields.  A stage that runs many times (once per
+chunk, or once per file in a multi-file run) is summed under its name:
+
+    with profiler.stage("clean", rows_in=len(trips)) as run:
+        trips = clean(trips, log)
+        run.rows_out = len(trips)
+
+Per stage the report holds call count, wall and CPU seconds, rows in / out
+and rows per second, and the process' peak RSS so far.  With
+``trace_memory=True`` (``--trace-memory``) it also holds the peak memory
+Python and NumPy had allocated during the stage and the net amount the stage
+left allocated; tracing makes the run noticeably slower, so it is off by
+default.
+
+Every run also appends a one-line summary to ``run_history.jsonl``, which is
+what to diff when looking for regressions.  For a function-level view use
+``--profile``: it runs cProfile and writes ``run_profile.prof`` (read it with
+``python -m pstats``).  Sampling profilers need no hook, e.g.
+``py-spy record -o profile.svg -- python -m data_pipeline.pipeline``.
+"""
+
+import cProfile
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+REPORT_NAME = "run_report.json"
+HISTORY_NAME = "run_history.jsonl"
+PROFILE_NAME = "run_profile.prof"
+
+_MB = 1024 * 1024
+
+#fields summed when a stage runs more than once; the peaks take the maximum
+_SUMMED = ("calls", "wall_s", "cpu_s", "rows_in", "rows_out", "allocated_mb")
+_PEAKS = ("peak_mb", "max_rss_mb")
+
+
+class StageRun:
+    """One execution of a stage.  Set ``rows_in`` / ``rows_out`` inside the block."""
+
+    def __init__(self, name: str, rows_in=None) -> None:
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.peak = 0
+        self.mem_start = None
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+
+
+class Profiler:
+    """
+    Collects per-stage metrics for one pipeline run (or one worker's share of
+    it).  ``Profiler(enabled=False)`` accepts the same calls and records
+    nothing, so instrumented code never has to check.
+    """
+
+    def __init__(self, trace_memory: bool = False, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.trace_memory = trace_memory and enabled
+        self.stats: dict[str, dict] = {}
+        self.files: dict[str, list] = {}
+        self.skipped: list[str] = []
+        self._active: list[StageRun] = []
+
+    @contextmanager
+    def stage(self, name: str, rows_in=None):
+        run = self._start(name, rows_in)
+        try:
+            yield run
+        finally:
+            self._finish(run)
+
+    def iterate(self, name: str, iterable):
+        """Yield from ``iterable``, timing each ``next()`` (e.g. reading a chunk) as stage ``name``."""
+        it = iter(iterable)
+        while True:
+            run = self._start(name, None)
+            try:
+                item = next(it)
+            except StopIteration:
+                #not a chunk: drop the run unrecorded (_start only tracks it when enabled)
+                if self.enabled:
+                    self._active.remove(run)
+                return
+            except BaseException:
+                self._finish(run)
+                raise
+            run.rows_out = len(item)
+            self._finish(run)
+            yield item
+
+    def skip(self, name: str) -> None:
+        """Note a stage that was not run because its outputs were up to date."""
+        if self.enabled:
+            self.skipped.append(name)
+
+    def merge(self, records: list[dict], file_name: str = None) -> None:
+        """Add the records of another profiler (e.g. from a worker process)."""
+        for record in records:
+            self._add(record["name"], record)
+        if file_name is not None:
+            self.files[file_name] = records
+
+    def records(self) -> list[dict]:
+        """One dict per stage, in the order the stages first started."""
+        records = []
+        for name, stat in self.stats.items():
+            if not stat:
+                continue
+            record = {"name": name}
+            for key, value in stat.items():
+                record[key] = round(value, 4) if isinstance(value, float) else value
+            if stat.get("rows_in") and stat["wall_s"] > 0:
+                record["rows_per_s"] = round(stat["rows_in"] / stat["wall_s"])
+            records.append(record)
+        return records
+
+    def write_report(self, output_dir: Path, **meta) -> Path:
+        """Write ``run_report.json`` and append the run to ``run_history.jsonl``."""
+        output_dir = Path(output_dir)
+        finished = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        records = self.records()
+        report = {
+            "finished_at": finished,
+            **meta,
+            "trace_memory": self.trace_memory,
+            "stages": records,
+            "skipped": self.skipped,
+            "files": self.files,
+        }
+        report_path = output_dir / REPORT_NAME
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+        history = {
+            "finished_at": finished,
+            **meta,
+            "wall_s": {r["name"]: r["wall_s"] for r in records},
+        }
+        with open(output_dir / HISTORY_NAME, "a") as f:
+            f.write(json.dumps(history) + "\n")
+        return report_path
+
+    def _start(self, name, rows_in) -> StageRun:
+        run = StageRun(name, rows_in)
+        if not self.enabled:
+            return run
+        self.stats.setdefault(name, {})
+        if self.trace_memory and tracemalloc.is_tracing():
+            self._flush_peak()
+            run.mem_start = tracemalloc.get_traced_memory()[0]
+        self._active.append(run)
+        return run
+
+    def _finish(self, run: StageRun) -> None:
+        if not self.enabled:
+            return
+        record = {
+            "calls": 1,
+            "wall_s": time.perf_counter() - run.wall_start,
+            "cpu_s": time.process_time() - run.cpu_start,
+        }
+        if run.rows_in is not None:
+            record["rows_in"] = int(run.rows_in)
+        if run.rows_out is not None:
+            record["rows_out"] = int(run.rows_out)
+        if run.mem_start is not None:
+            self._flush_peak()
+            record["peak_mb"] = run.peak / _MB
+            record["allocated_mb"] = (tracemalloc.get_traced_memory()[0] - run.mem_start) / _MB
+        rss = max_rss_mb()
+        if rss is not None:
+            record["max_rss_mb"] = rss
+        self._active.remove(run)
+        self._add(run.name, record)
+
+    def _flush_peak(self) -> None:
+        #tracemalloc has one peak counter: hand it to every open stage, then restart it
+        peak = tracemalloc.get_traced_memory()[1]
+        for run in self._active:
+            run.peak = max(run.peak, peak)
+        tracemalloc.reset_peak()
+
+    def _add(self, name, record) -> None:
+        stat = self.stats.setdefault(name, {})
+        for key in _SUMMED:
+            if key in record:
+                stat[key] = stat.get(key, 0) + record[key]
+        for key in _PEAKS:
+            if key in record:
+                stat[key] = max(stat.get(key, 0), record[key])
+
+
+def max_rss_mb():
+    """Peak resident memory of this process in MB (None where the OS doesn't say)."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #Linux reports kilobytes, macOS bytes
+    return rss / _MB if sys.platform == "darwin" else rss / 1024
+
+
+@contextmanager
+def profile_calls(path=None):
+    """Run the block under cProfile and save the stats to ``path``; does nothing when ``path`` is None."""
+    if path is None:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+
+
+NULL_PROFILER = Profiler(enabled=False)
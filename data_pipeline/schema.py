@@ -0,0 +1,69 @@
+"""
+schema.py – Trip column schema
+------------------------------
+One place that says what every trip column is.  The loader uses it to read
+the raw CSV with the right types straight away (so nothing downstream has to
+re-parse strings), the normalizer uses the same column groups, and the
+Parquet writer derives its Arrow schema from them.
+"""
+
+import pandas as pd
+
+
+DATETIME_COLUMNS = [
+    "tpep_pickup_datetime",
+    "tpep_dropoff_datetime",
+]
+
+#TLC files write timestamps as "2019-01-01 00:46:40"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+NUMERIC_COLUMNS = [
+    "trip_distance",
+    "fare_amount",
+    "extra",
+    "mta_tax",
+    "tip_amount",
+    "tolls_amount",
+    "improvement_surcharge",
+    "total_amount",
+    "congestion_surcharge",
+    "passenger_count",
+]
+
+CATEGORICAL_TEXT_COLUMNS = [
+    "PU_Borough",
+    "DO_Borough",
+    "PU_Zone",
+    "DO_Zone",
+    "PU_ServiceZone",
+    "DO_ServiceZone",
+    "store_and_fwd_flag",
+]
+
+CATEGORICAL_ID_COLUMNS = [
+    "VendorID",
+    "RatecodeID",
+    "PULocationID",
+    "DOLocationID",
+    "payment_type",
+]
+
+#Dtypes of the raw trip columns after loading.  Small nullable ints for the
+#codes and counts (they can be blank).  Money and distances stay float64: float32 cannot
+#hold values like 0.3 exactly, which would leak into the derived features and
+#the API averages.  Datetime columns are read as text and parsed with
+#DATETIME_FORMAT, which is much faster than pandas' format inference.
+RAW_TRIP_DTYPES = {
+    "VendorID": "Int8",
+    "RatecodeID": "Int8",
+    "payment_type": "Int8",
+    "PULocationID": "Int16",
+    "DOLocationID": "Int16",
+    "passenger_count": "Int8",
+    "store_and_fwd_flag": pd.CategoricalDtype(["N", "Y"]),
+    **{col: "float64" for col in NUMERIC_COLUMNS if col != "passenger_count"},
+    **{col: "object" for col in DATETIME_COLUMNS},
+}
+
+RAW_TRIP_COLUMNS = list(RAW_TRIP_DTYPES)
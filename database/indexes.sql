@@ -0,0 +1,16 @@
+-- Urban Mobility Data Explorer - SQLite Indexes
+-- Created per partition by load_data.py, with {table} filled in, once the
+-- month's trips are loaded (faster than updating them per insert).
+-- The API reads the rollup tables (indexed in schema.sql), so a partition
+-- only needs indexes for what they cannot answer: date-range pruning, zone /
+-- route lookups, and routes under a filter finer than rollup_routes (hour,
+-- payment type, days).  Those two indexes carry the route columns, so the
+-- filtered route queries read them without touching the table.
+
+-- Date ranges (trips_source() in the API), and routes within them
+CREATE INDEX IF NOT EXISTS idx_{table}_pickup_time ON {table}(pickup_ts, payment_type, pickup_hour, pickup_zone_id, dropoff_zone_id);
+-- Routes under a payment type and/or hour filter (hours alone skip-scan the few payment types)
+CREATE INDEX IF NOT EXISTS idx_{table}_payment_hour ON {table}(payment_type, pickup_hour, pickup_zone_id, dropoff_zone_id);
+-- Pickup zone and route lookups; also lets rollups.sql build rollup_routes without a sort
+CREATE INDEX IF NOT EXISTS idx_{table}_route ON {table}(pickup_zone_id, dropoff_zone_id);
+CREATE INDEX IF NOT EXISTS idx_{table}_dropoff_zone ON {table}(dropoff_zone_id);
@@ -1,4 +1,43 @@
+"""
+Builds taxi_data.db from the pipeline output.
+
+Trips are stored one table per pickup month (trips_YYYY_MM, listed in
+trip_partitions) behind a trips_compact view that UNIONs them, so a month can
+be reloaded or dropped without touching the others:
+
+    python load_data.py                       # full rebuild
+    python load_data.py --month 2019-02       # reload one month in place
+    python load_data.py --drop-month 2019-01  # delete one month
+
+A full rebuild (DatabaseBuild) happens from scratch in a temporary file next
+to taxi_data.db that is swapped in at the end, so re-running the loader
+replaces the data instead of appending duplicates, and the API never sees a
+half-loaded database.  Because the temporary file is thrown away if anything fails, that
+load can run with journaling and fsync off.  Trips go in through prepared
+executemany() inserts in a single transaction; each partition's indexes from
+indexes.sql are created only after the data is in, followed by its rows in
+the pre-aggregated tables (rollups.sql) that the API reads and its fare vs
+distance samples (TripSample, drawn while the trips go in), and ANALYZE runs
+last so the query planner has statistics.  --month and --drop-month work on
+the live database inside one ordinary transaction instead.
+
+The partitions are compact: pickup/dropoff times are stored as Unix epoch
+seconds, the day of week as 0-6 (Monday first), and the six borough / zone /
+service zone text columns as two ids into zone_labels.  The trips view in
+schema.sql joins them back into the readable columns.
+
+The data pipeline can also hand its batches to DatabaseBuild directly
+(``python -m data_pipeline.pipeline --sink database``), skipping the
+processed files and this script.
+"""
+
+import argparse
+import os
+import re
 import sqlite3
+import time
+import uuid
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
@@ -6,108 +45,803 @@ from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent
 ROOT_DIR = BASE_DIR.parent
 OUTPUT_DIR = ROOT_DIR / "data_pipeline" / "output"
+DB_PATH = BASE_DIR / 'taxi_data.db'
+ZONE_LOOKUP_PATH = ROOT_DIR / 'taxi_zone_lookup.csv'
 
-# Connect to SQLite database
-conn = sqlite3.connect(BASE_DIR / 'taxi_data.db')
-cursor = conn.cursor()
+# Layout written by schema.sql (PRAGMA user_version)
+SCHEMA_VERSION = 4
 
-print("Starting database population...")
+# Trips are stored one table per pickup month, trips_YYYY_MM
+MONTH_PATTERN = re.compile(r'\d{4}-\d{2}')
+ROLLUP_TABLES = ['rollup_trips', 'rollup_zone_hour', 'rollup_routes']
+SAMPLE_TABLES = ['trip_samples', 'trip_sample_months']
 
-# 1. Create tables
-print("\n[1/3] Creating tables...")
-with open(BASE_DIR / 'schema.sql', 'r') as f:
-    schema_sql = f.read()
-    cursor.executescript(schema_sql)
-conn.commit()
-print("Tables created successfully.")
+# Fare vs distance samples (trip_samples): SAMPLE_COUNT samples of up to
+# SAMPLE_SIZE trips per month, stratified by distance x fare bucket (the
+# buckets' upper edges, in miles and dollars), drawn reproducibly from SAMPLE_SEED
+SAMPLE_COUNT = 4
+SAMPLE_SIZE = 5_000
+SAMPLE_SEED = 0
+SAMPLE_DISTANCE_EDGES = [1, 2, 5, 10, 20]
+SAMPLE_FARE_EDGES = [10, 20, 40, 80]
+SAMPLE_STRATA = (len(SAMPLE_DISTANCE_EDGES) + 1) * (len(SAMPLE_FARE_EDGES) + 1)
+SAMPLE_COLUMNS = [
+    'trip_distance', 'fare_amount', 'total_amount', 'tip_amount',
+    # what the API filters the samples by (backend/trip_filters.py)
+    'pickup_ts', 'pickup_hour', 'pickup_zone_id', 'payment_type',
+]
 
-# 2. Load zones
-print("\n[2/3] Loading zones...")
+# rows per executemany() batch when reading CSV (Parquet goes by row group)
+CSV_CHUNK_ROWS = 250_000
 
-zones_df = pd.read_csv(ROOT_DIR / 'taxi_zone_lookup.csv')
-zones_df = zones_df.rename(columns={
-    'LocationID': 'zone_id',
-    'Borough': 'borough',
-    'Zone': 'zone_name',
-    'service_zone': 'service_zone'
-})
+# Only safe because the load writes to a scratch file that is discarded on failure
+LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA locking_mode = EXCLUSIVE",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",  # 256 MB, helps the index builds
+]
 
-zones_df = zones_df[['zone_id', 'borough', 'zone_name', 'service_zone']]
-zones_df = zones_df.dropna(subset=['zone_id', 'borough', 'zone_name'])
-zones_df.to_sql('zones', conn, if_exists='append', index=False)
-conn.commit()
-print(f"Zones loaded successfully. ({len(zones_df)} rows)")
 
+# Rename columns from pipeline output to match the database schema
+RENAME_COLUMNS = {
+    'VendorID': 'vendor_id',
+    'tpep_pickup_datetime': 'pickup_datetime',
+    'tpep_dropoff_datetime': 'dropoff_datetime',
+    'RatecodeID': 'ratecode_id',
+    'PULocationID': 'pickup_zone_id',
+    'DOLocationID': 'dropoff_zone_id',
+    'PU_Borough': 'pu_borough',
+    'PU_Zone': 'pu_zone',
+    'PU_ServiceZone': 'pu_service_zone',
+    'DO_Borough': 'do_borough',
+    'DO_Zone': 'do_zone',
+    'DO_ServiceZone': 'do_service_zone',
+}
 
-# 3. Load trip data from pipeline output
-trips_path = OUTPUT_DIR / "processed_trips.csv"
-print(f"\n[3/3] Loading cleaned trip data from {trips_path}...")
+# Select only the columns the schema expects
+TRIP_COLUMNS = [
+    'vendor_id', 'ratecode_id', 'store_and_fwd_flag', 'payment_type',
+    'pickup_datetime', 'dropoff_datetime',
+    'pickup_zone_id', 'dropoff_zone_id',
+    'pu_borough', 'do_borough', 'pu_zone', 'do_zone',
+    'pu_service_zone', 'do_service_zone',
+    'passenger_count', 'trip_distance',
+    'fare_amount', 'extra', 'mta_tax', 'tip_amount', 'tolls_amount',
+    'improvement_surcharge', 'congestion_surcharge', 'total_amount',
+    'trip_duration_min', 'speed_mph', 'cost_per_mile',
+    'tip_percentage', 'pickup_hour', 'pickup_day_of_week'
+]
 
-if not trips_path.exists():
-    print(f"Error: {trips_path} not found. Run the data pipeline first.")
-    conn.close()
-    exit(1)
-
-print("This may take a few minutes...")
-
-chunk_size = 10000
-chunks_loaded = 0
-total_rows = 0
-
-for chunk in pd.read_csv(trips_path, chunksize=chunk_size):
-
-    # Rename columns from pipeline output to match the database schema
-    chunk = chunk.rename(columns={
-        'VendorID': 'vendor_id',
-        'tpep_pickup_datetime': 'pickup_datetime',
-        'tpep_dropoff_datetime': 'dropoff_datetime',
-        'RatecodeID': 'ratecode_id',
-        'PULocationID': 'pickup_zone_id',
-        'DOLocationID': 'dropoff_zone_id',
-        'PU_Borough': 'pu_borough',
-        'PU_Zone': 'pu_zone',
-        'PU_ServiceZone': 'pu_service_zone',
-        'DO_Borough': 'do_borough',
-        'DO_Zone': 'do_zone',
-        'DO_ServiceZone': 'do_service_zone',
+DB_TO_SOURCE = {v: k for k, v in RENAME_COLUMNS.items()}
+
+# Compact partition columns: the time and day columns are converted, the zone
+# text is replaced by its zone_labels id
+TIME_COLUMNS = {'pickup_datetime': 'pickup_ts', 'dropoff_datetime': 'dropoff_ts'}
+LABEL_COLUMNS = {
+    'pu_label_id': ['pu_borough', 'pu_zone', 'pu_service_zone'],
+    'do_label_id': ['do_borough', 'do_zone', 'do_service_zone'],
+}
+DAY_CODES = {
+    'Monday': 0, 'Tuesday': 1, 'Wednesday': 2, 'Thursday': 3,
+    'Friday': 4, 'Saturday': 5, 'Sunday': 6,
+}
+
+
+def iter_parquet_chunks(path):
+    """Read the pipeline's Parquet output one row group at a time, only the columns we store."""
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    wanted = [DB_TO_SOURCE.get(c, c) for c in TRIP_COLUMNS]
+    columns = [c for c in wanted if c in parquet_file.schema_arrow.names]
+    for i in range(parquet_file.num_row_groups):
+        yield parquet_file.read_row_group(i, columns=columns).to_pandas()
+
+
+def epoch_seconds(values):
+    """
+    Timestamps as whole Unix epoch seconds (UTC), NaT → NA.  Takes datetime
+    columns (Parquet) or the "2019-01-01 00:46:40+00:00" text of the CSV
+    export; naive times are taken to be UTC.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        values = pd.to_datetime(values, utc=True, format='ISO8601')
+    elif values.dt.tz is not None:
+        values = values.dt.tz_convert('UTC')
+    seconds = values.dt.tz_localize(None).to_numpy().astype('datetime64[s]')
+    return pd.Series(pd.arrays.IntegerArray(seconds.astype(np.int64), np.isnat(seconds)), index=values.index)
+
+
+def month_names(epoch):
+    """"YYYY-MM" of each epoch-seconds value, formatted once per distinct month."""
+    months = epoch.to_numpy(dtype='int64', na_value=0).astype('datetime64[s]').astype('datetime64[M]')
+    codes, uniques = pd.factorize(months)
+    return pd.Series(np.datetime_as_string(uniques, unit='M')[codes], index=epoch.index)
+
+
+def iter_csv_chunks(path, chunk_size=CSV_CHUNK_ROWS):
+    yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def find_trip_files(output_dir):
+    """
+    Processed trip files written by the pipeline: one file per month under
+    processed_trips/ for multi-file runs, otherwise a single processed_trips
+    file.  Parquet is preferred over CSV.
+    """
+    partition_dir = output_dir / 'processed_trips'
+    for fmt in ('parquet', 'csv'):
+        parts = sorted(partition_dir.glob(f'*.{fmt}')) if partition_dir.is_dir() else []
+        if parts:
+            return parts
+    for fmt in ('parquet', 'csv'):
+        single = output_dir / f'processed_trips.{fmt}'
+        if single.exists():
+            return [single]
+    return []
+
+
+def iter_trip_chunks(paths):
+    for path in paths:
+        print(f"  Reading {path.name}...")
+        if path.suffix == '.parquet':
+            yield from iter_parquet_chunks(path)
+        else:
+            yield from iter_csv_chunks(path)
+
+
+def run_script(conn, name, **params):
+    """
+    Run a .sql file from this folder, statement by statement, with ``params``
+    filled into its {placeholders}.  (executescript() would commit an open
+    transaction first.)
+    """
+    with open(BASE_DIR / name, 'r') as f:
+        script = f.read()
+    if params:
+        script = script.format(**params)
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+
+
+def load_zones(conn, path=ZONE_LOOKUP_PATH):
+    zones_df = pd.read_csv(path)
+    zones_df = zones_df.rename(columns={
+        'LocationID': 'zone_id',
+        'Borough': 'borough',
+        'Zone': 'zone_name',
+        'service_zone': 'service_zone'
     })
 
-    # Select only the columns the schema expects
-    columns = [
-        'vendor_id', 'ratecode_id', 'store_and_fwd_flag', 'payment_type',
-        'pickup_datetime', 'dropoff_datetime',
-        'pickup_zone_id', 'dropoff_zone_id',
-        'pu_borough', 'do_borough', 'pu_zone', 'do_zone',
-        'pu_service_zone', 'do_service_zone',
-        'passenger_count', 'trip_distance',
-        'fare_amount', 'extra', 'mta_tax', 'tip_amount', 'tolls_amount',
-        'improvement_surcharge', 'congestion_surcharge', 'total_amount',
-        'trip_duration_min', 'speed_mph', 'cost_per_mile',
-        'tip_percentage', 'pickup_hour', 'pickup_day_of_week'
-    ]
+    zones_df = zones_df[['zone_id', 'borough', 'zone_name', 'service_zone']]
+    zones_df = zones_df.dropna(subset=['zone_id', 'borough', 'zone_name'])
+    insert_rows(conn, 'zones', zones_df)
+    return len(zones_df)
+
+
+def insert_rows(conn, table, df):
+    """executemany() one prepared INSERT for all rows of ``df`` (NaN/NA → NULL)."""
+    columns = list(df.columns)
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    # Column-wise conversion to Python objects is much faster than itertuples()
+    values = [df[col].to_numpy(dtype=object, na_value=None) for col in columns]
+    conn.executemany(sql, zip(*values))
+
+
+def load_label_ids(conn):
+    """{(borough, zone_name, service_zone): label_id} for the labels already in zone_labels."""
+    return {tuple(row[1:]): row[0] for row in conn.execute(
+        "SELECT label_id, borough, zone_name, service_zone FROM zone_labels"
+    )}
+
+
+def label_id(conn, label_ids, label):
+    """Id of a (borough, zone_name, service_zone) label, inserted into zone_labels if it is new."""
+    if label not in label_ids:
+        label_ids[label] = len(label_ids) + 1
+        conn.execute(
+            "INSERT INTO zone_labels (label_id, borough, zone_name, service_zone) VALUES (?, ?, ?, ?)",
+            (label_ids[label], *label),
+        )
+    return label_ids[label]
+
+
+def compact_chunk(conn, chunk, label_ids):
+    """
+    A chunk of renamed pipeline rows in the partition layout: epoch-second
+    times, day-of-week codes, and zone_labels ids in place of the zone text.
+    Labels not yet in ``label_ids`` are inserted into zone_labels (and added).
+    """
+    chunk = chunk.copy()
+    for text_col, ts_col in TIME_COLUMNS.items():
+        if text_col in chunk.columns:
+            chunk[ts_col] = epoch_seconds(chunk.pop(text_col))
+    if 'pickup_day_of_week' in chunk.columns:
+        chunk['pickup_dow'] = chunk.pop('pickup_day_of_week').map(DAY_CODES).astype('Int64')
+
+    for id_col, text_cols in LABEL_COLUMNS.items():
+        labels = chunk.reindex(columns=text_cols).astype(object)
+        labels = labels.where(labels.notna(), None)
+        labels.columns = ['borough', 'zone_name', 'service_zone']
+        distinct = labels.drop_duplicates()
+        ids = [label_id(conn, label_ids, key) for key in distinct.itertuples(index=False, name=None)]
+        distinct = distinct.assign(label_id=ids)
+        chunk[id_col] = labels.merge(distinct, how='left', on=list(labels.columns))['label_id'].to_numpy()
+        chunk = chunk.drop(columns=text_cols, errors='ignore')
+    return chunk
+
+
+def partition_table(month):
+    """Table holding the trips picked up in ``month`` ("YYYY-MM")."""
+    if not MONTH_PATTERN.fullmatch(month):
+        raise ValueError(f"month must look like YYYY-MM, got {month!r}")
+    return 'trips_' + month.replace('-', '_')
+
+
+def month_of(path):
+    """Month in a processed file's name (yellow_tripdata_2019-01.parquet), or None."""
+    match = MONTH_PATTERN.search(path.name)
+    return match.group() if match else None
+
+
+def create_partition(conn, month):
+    table = partition_table(month)
+    conn.execute(f"DROP TABLE IF EXISTS {table}")
+    run_script(conn, 'trips_partition.sql', table=table)
+    # Keep trip ids unique across the trips view: each month counts up from YYYYMM * 10^9
+    conn.execute(
+        "INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+        (table, int(month.replace('-', '')) * 10**9),
+    )
+
+
+def drop_partition(conn, month):
+    """Remove a month's table, rollup rows, samples and catalog entry (if there are any)."""
+    conn.execute(f"DROP TABLE IF EXISTS {partition_table(month)}")
+    for table in ROLLUP_TABLES + SAMPLE_TABLES:
+        conn.execute(f"DELETE FROM {table} WHERE pickup_month = ?", (month,))
+    conn.execute("DELETE FROM trip_partitions WHERE month = ?", (month,))
+
+
+def finish_partition(conn, month, sample):
+    """
+    Index a freshly loaded partition, add its rollup rows and its samples
+    (from ``sample``, the month's TripSample) and record it in trip_partitions.
+    """
+    table = partition_table(month)
+    run_script(conn, 'indexes.sql', table=table)
+    for derived in ROLLUP_TABLES + SAMPLE_TABLES:
+        conn.execute(f"DELETE FROM {derived} WHERE pickup_month = ?", (month,))
+    run_script(conn, 'rollups.sql', table=table, month=month)
+    insert_rows(conn, 'trip_samples', sample.samples())
+    conn.execute("INSERT INTO trip_sample_months VALUES (?, ?)", (month, int(sample.population.sum())))
+    record_partition(conn, month)
+
+
+def record_partition(conn, month):
+    """Add or update a partition's row in trip_partitions."""
+    table = partition_table(month)
+    conn.execute(f"""
+        INSERT OR REPLACE INTO trip_partitions
+        SELECT ?, ?, COUNT(*),
+               datetime(MIN(pickup_ts), 'unixepoch') || '+00:00',
+               datetime(MAX(pickup_ts), 'unixepoch') || '+00:00',
+               datetime('now')
+        FROM {table}
+    """, (month, table))
+
+
+def stamp_data_version(conn):
+    """Give the data a new meta.data_version (the API's response cache and ETags key on it)."""
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('data_version', ?)", (uuid.uuid4().hex,))
+
+
+def refresh_trips_view(conn):
+    """Point the trips_compact view (and so the trips view on top of it) at the current partitions."""
+    tables = [row[0] for row in conn.execute("SELECT table_name FROM trip_partitions ORDER BY month")]
+    if not tables:
+        raise ValueError("no trip partitions left; delete taxi_data.db and run a full load instead")
+    conn.execute("DROP VIEW IF EXISTS trips_compact")
+    conn.execute("CREATE VIEW trips_compact AS " + "\nUNION ALL ".join(f"SELECT * FROM {t}" for t in tables))
+
+
+def sample_strata(distance, fare):
+    """Stratum of each trip for the samples: its distance bucket x fare bucket."""
+    return (
+        np.searchsorted(SAMPLE_DISTANCE_EDGES, distance, side='right') * (len(SAMPLE_FARE_EDGES) + 1)
+        + np.searchsorted(SAMPLE_FARE_EDGES, fare, side='right')
+    )
+
+
+def largest_remainder(total, weights):
+    """Split ``total`` into integers in proportion to ``weights`` (largest remainder method)."""
+    weights = np.asarray(weights, dtype=np.int64)
+    if total == 0:
+        return np.zeros_like(weights)
+    quotas = total * weights / weights.sum()
+    shares = np.floor(quotas).astype(np.int64)
+    shares[np.argsort(shares - quotas, kind='stable')[:total - shares.sum()]] += 1
+    return shares
+
 
-    # Keep only columns that exist in the data
-    available_cols = [c for c in columns if c in chunk.columns]
-    chunk = chunk[available_cols]
+class TripSample:
+    """
+    Stratified reservoir sample of one month's trips, for trip_samples.
 
-    chunk.to_sql('trips', conn, if_exists='append', index=False)
+    Every trip gets a uniform random key.  Per stratum (sample_strata) the
+    reservoir keeps the trips with a positive distance and fare that have
+    the smallest keys, SAMPLE_COUNT * SAMPLE_SIZE at most: a uniform sample of
+    the stratum however the trips were split into chunks.  Two reservoirs of
+    the same month merge into the reservoir of all their trips (merge(), for
+    staging builds).  ``population`` counts each stratum's trips.
+    """
 
-    chunks_loaded += 1
-    total_rows += len(chunk)
-    print(f"  Processed {total_rows:,} rows...")
+    CAPACITY = SAMPLE_COUNT * SAMPLE_SIZE
 
-conn.commit()
-print(f"Trip data loaded successfully. ({total_rows:,} total rows)")
+    def __init__(self, month):
+        self.month = month
+        self.rng = np.random.default_rng([SAMPLE_SEED, *map(int, month.split('-'))])
+        self.population = np.zeros(SAMPLE_STRATA, dtype=np.int64)
+        self.rows = {'stratum': np.empty(0, dtype=np.int64), 'sample_key': np.empty(0)}
+        self.rows.update((col, np.empty(0)) for col in SAMPLE_COLUMNS)
+        # keys below which a trip still gets into its stratum
+        self._key_limit = np.full(SAMPLE_STRATA, np.inf)
 
-# 4. Verify
-print("\nVerifying database...")
+    def add(self, chunk):
+        """Offer a chunk of the month's trips (any columns, SAMPLE_COLUMNS among them)."""
+        keys = self.rng.random(len(chunk))
+        chunk = chunk.reindex(columns=SAMPLE_COLUMNS)
+        values = {col: chunk[col].to_numpy(dtype='float64', na_value=np.nan) for col in SAMPLE_COLUMNS}
+        eligible = (values['trip_distance'] > 0) & (values['fare_amount'] > 0)
+        strata = sample_strata(values['trip_distance'][eligible], values['fare_amount'][eligible])
+        rows = {'stratum': strata, 'sample_key': keys[eligible]}
+        rows.update((col, v[eligible]) for col, v in values.items())
+        self.merge(rows, np.bincount(strata, minlength=SAMPLE_STRATA))
 
-cursor.execute("SELECT COUNT(*) FROM trips")
-print(f"Total trips: {cursor.fetchone()[0]:,}")
+    def merge(self, rows, population):
+        """Add reservoir ``rows`` (columns as in self.rows) drawn from ``population`` trips per stratum."""
+        self.population += population
+        keep = rows['sample_key'] < self._key_limit[rows['stratum']]
+        rows = {col: np.concatenate([self.rows[col], rows[col][keep]]) for col in self.rows}
+        order = np.lexsort((rows['sample_key'], rows['stratum']))
+        strata = rows['stratum'][order]
+        rank = np.arange(len(order)) - np.searchsorted(strata, strata)
+        order = order[rank < self.CAPACITY]
+        self.rows = {col: v[order] for col, v in rows.items()}
 
-cursor.execute("SELECT COUNT(*) FROM zones")
-print(f"Total zones: {cursor.fetchone()[0]}")
+        counts = np.bincount(self.rows['stratum'], minlength=SAMPLE_STRATA)
+        full = counts == self.CAPACITY
+        if full.any():
+            # the last (largest) key of a full stratum
+            last = self.rows['sample_key'][np.cumsum(counts)[full] - 1]
+            self._key_limit[full] = last
+
+    def samples(self):
+        """
+        The month's SAMPLE_COUNT samples as trip_samples rows.  Each stratum
+        gets its share of SAMPLE_SIZE (of all trips, in a smaller month), and
+        sample i takes the i-th slice of that size from the stratum's
+        reservoir, wrapping around if it holds fewer than SAMPLE_COUNT slices.
+        Rows are ranked by their position within their stratum's slice, so any
+        prefix of a sample is stratified too.
+        """
+        shares = largest_remainder(min(int(self.population.sum()), SAMPLE_SIZE), self.population)
+        counts = np.bincount(self.rows['stratum'], minlength=SAMPLE_STRATA)
+        starts = np.cumsum(counts) - counts
+        strata = np.flatnonzero(shares)
+        frames = []
+        for sample_id in range(SAMPLE_COUNT):
+            picks, slots, picked_strata = [], [], []
+            for stratum in strata.tolist():
+                share, slot = shares[stratum], np.arange(shares[stratum])
+                picks.append(starts[stratum] + (sample_id * share + slot) % counts[stratum])
+                slots.append((slot + 0.5) / share)
+                picked_strata.append(np.full(share, stratum))
+            if not picks:
+                continue
+            picks = np.concatenate(picks)[np.lexsort((np.concatenate(picked_strata), np.concatenate(slots)))]
+            frame = pd.DataFrame({col: self.rows[col][picks] for col in SAMPLE_COLUMNS})
+            frame.insert(0, 'sample_rank', np.arange(len(picks)))
+            frame.insert(0, 'pickup_month', self.month)
+            frame.insert(0, 'sample_id', sample_id)
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=['sample_id', 'pickup_month', 'sample_rank', *SAMPLE_COLUMNS])
+        return pd.concat(frames, ignore_index=True)
+
+
+def save_staged_samples(conn, samples):
+    """Keep the reservoirs of a staging build's TripSamples ({month: TripSample}) for add_database()."""
+    columns = ', '.join(f'{col} REAL' for col in SAMPLE_COLUMNS)
+    conn.execute(f"CREATE TABLE staged_sample_rows (pickup_month TEXT, stratum INTEGER, sample_key REAL, {columns})")
+    conn.execute("CREATE TABLE staged_sample_strata (pickup_month TEXT, stratum INTEGER, trip_count INTEGER)")
+    for month, sample in samples.items():
+        insert_rows(conn, 'staged_sample_rows', pd.DataFrame({'pickup_month': month, **sample.rows}))
+        conn.executemany(
+            "INSERT INTO staged_sample_strata VALUES (?, ?, ?)",
+            [(month, stratum, count) for stratum, count in enumerate(sample.population.tolist()) if count],
+        )
+
+
+def read_staged_samples(conn):
+    """{month: (reservoir rows, population)} saved by save_staged_samples(), for TripSample.merge()."""
+    rows = pd.read_sql_query("SELECT * FROM staged_sample_rows", conn)
+    strata = pd.read_sql_query("SELECT * FROM staged_sample_strata", conn)
+    staged = {}
+    for month, counts in strata.groupby('pickup_month'):
+        population = np.zeros(SAMPLE_STRATA, dtype=np.int64)
+        population[counts['stratum'].to_numpy()] = counts['trip_count'].to_numpy()
+        month_rows = rows[rows['pickup_month'] == month]
+        reservoir = {'stratum': month_rows['stratum'].to_numpy(dtype=np.int64)}
+        reservoir.update((col, month_rows[col].to_numpy(dtype='float64')) for col in ['sample_key', *SAMPLE_COLUMNS])
+        staged[month] = (reservoir, population)
+    return staged
+
+
+class TripLoader:
+    """
+    Inserts chunks of processed trips (pipeline column names) into the
+    partition of their pickup month, creating partitions as months appear.
+    With ``months``, rows from other months are skipped.  ``counts`` is
+    {month: rows inserted} and ``samples`` {month: TripSample}.
+    """
+
+    def __init__(self, conn, months=None):
+        self.conn = conn
+        self.months = months
+        self.counts = {}
+        self.samples = {}
+        self.rows_read = 0
+        self.label_ids = load_label_ids(conn)
+
+    def write(self, chunk):
+        chunk = chunk.rename(columns=RENAME_COLUMNS)
+
+        # Keep only columns that exist in the data
+        available_cols = [c for c in TRIP_COLUMNS if c in chunk.columns]
+        chunk = compact_chunk(self.conn, chunk[available_cols], self.label_ids)
+
+        chunk_months = month_names(chunk['pickup_ts'])
+        if chunk_months.nunique() == 1:
+            groups = [(chunk_months.iloc[0], chunk)]
+        else:
+            groups = chunk.groupby(chunk_months, sort=True)
+        for month, rows in groups:
+            if self.months is not None and month not in self.months:
+                continue
+            insert_rows(self.conn, self.partition(month), rows)
+            self.samples[month].add(rows)
+            self.counts[month] += len(rows)
+        self.rows_read += len(chunk)
+
+    def partition(self, month):
+        """Table for ``month``, created (empty) the first time the month comes up."""
+        if month not in self.counts:
+            create_partition(self.conn, month)
+            self.counts[month] = 0
+            self.samples[month] = TripSample(month)
+        return partition_table(month)
+
+
+def load_trips(conn, paths, months=None):
+    """
+    Insert every chunk of the processed trip files into the partition of its
+    pickup month.  Returns the TripLoader, with the counts and samples.
+    """
+    loader = TripLoader(conn, months)
+    for chunk in iter_trip_chunks(paths):
+        loader.write(chunk)
+        print(f"  Processed {loader.rows_read:,} rows...")
+    return loader
+
+
+class DatabaseBuild:
+    """
+    A full rebuild of ``db_path`` in a scratch file next to it.  Chunks of
+    processed trips (pipeline column names) go in through write(); close()
+    indexes the partitions, adds their rollup rows, creates the views, runs
+    ANALYZE and swaps the file in for ``db_path``.  Leaving a ``with`` block
+    on an exception, or abort(), throws the scratch file away instead.
+
+    A ``staging`` build stops after the inserts: it only holds the partitions,
+    their trip_partitions rows, zone_labels and the sample reservoirs, for
+    another build to take over with add_database().  The pipeline writes one per input file when it
+    processes several files in parallel.
+    """
+
+    def __init__(self, db_path=DB_PATH, zone_lookup_path=ZONE_LOOKUP_PATH, staging=False, verbose=True):
+        self.db_path = Path(db_path)
+        self.staging = staging
+        self.verbose = verbose
+        self.tmp_path = self.db_path.with_name(self.db_path.name + '.loading')
+        self.tmp_path.unlink(missing_ok=True)
+        self.conn = sqlite3.connect(self.tmp_path, isolation_level=None)
+        try:
+            for pragma in LOAD_PRAGMAS:
+                self.conn.execute(pragma)
+
+            # 1. Create tables (trip partitions are created as their months appear)
+            self._print("\n[1/5] Creating tables...")
+            run_script(self.conn, 'schema.sql')
+            self._print("Tables created successfully.")
+
+            self.conn.execute("BEGIN")
+
+            # 2. Load zones
+            self._print("\n[2/5] Loading zones...")
+            zone_count = load_zones(self.conn, zone_lookup_path)
+            self._print(f"Zones loaded successfully. ({zone_count} rows)")
+
+            # 3. Trips, as they are written
+            self._print("\n[3/5] Loading cleaned trip data...")
+            self.loader = TripLoader(self.conn)
+            self._start = time.perf_counter()
+        except BaseException:
+            self.abort()
+            raise
+
+    @property
+    def rows_written(self):
+        return sum(self.loader.counts.values())
+
+    def write(self, chunk):
+        self.loader.write(chunk)
+        self._print(f"  Processed {self.loader.rows_read:,} rows...")
+
+    def add_database(self, path):
+        """Copy the partitions, zone labels and sample reservoirs of the staging build at ``path`` into this one."""
+        conn = self.conn
+        staged = sqlite3.connect(path)
+        try:
+            labels = staged.execute("SELECT label_id, borough, zone_name, service_zone FROM zone_labels").fetchall()
+            partitions = staged.execute("SELECT month, table_name, row_count FROM trip_partitions ORDER BY month").fetchall()
+            samples = read_staged_samples(staged)
+        finally:
+            staged.close()
+        label_map = [(staged_id, label_id(conn, self.loader.label_ids, tuple(label))) for staged_id, *label in labels]
+        # Create the tables before attaching, so their unqualified DROP/CREATE
+        # cannot reach into the staging database
+        for month, _, _ in partitions:
+            self.loader.partition(month)
+        for month, (rows, population) in samples.items():
+            self.loader.samples[month].merge(rows, population)
+
+        # ATTACH is not allowed inside a transaction
+        conn.execute("COMMIT")
+        conn.execute("ATTACH DATABASE ? AS staged", (str(path),))
+        try:
+            conn.execute("BEGIN")
+            conn.execute("CREATE TEMP TABLE label_map (staged_id INTEGER PRIMARY KEY, label_id INTEGER)")
+            conn.executemany("INSERT INTO temp.label_map VALUES (?, ?)", label_map)
+            for month, table, rows in partitions:
+                # Everything but trip_id (numbered by this database), with the labels renumbered
+                columns = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})") if row[1] != 'trip_id']
+                select = [{'pu_label_id': 'pl.label_id', 'do_label_id': 'dl.label_id'}.get(c, f"t.{c}") for c in columns]
+                conn.execute(f"""
+                    INSERT INTO main.{table} ({', '.join(columns)})
+                    SELECT {', '.join(select)}
+                    FROM staged.{table} t
+                    LEFT JOIN temp.label_map pl ON pl.staged_id = t.pu_label_id
+                    LEFT JOIN temp.label_map dl ON dl.staged_id = t.do_label_id
+                    ORDER BY t.trip_id
+                """)
+                self.loader.counts[month] += rows
+            conn.execute("DROP TABLE temp.label_map")
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.execute("DETACH DATABASE staged")
+        conn.execute("BEGIN")
+        self._print(f"  Added {', '.join(month for month, _, _ in partitions) or 'no trips'} from {Path(path).name}")
+
+    def close(self):
+        """Finish the build and swap it in for ``db_path``."""
+        if self.conn is None:
+            return
+        conn = self.conn
+        try:
+            conn.execute("COMMIT")
+            counts = self.loader.counts
+            self._print(
+                f"Trip data loaded successfully. "
+                f"({self.rows_written:,} total rows in {time.perf_counter() - self._start:.1f}s)"
+            )
+            for month, rows in counts.items():
+                self._print(f"  {partition_table(month)}: {rows:,} rows")
+
+            if self.staging:
+                conn.execute("BEGIN")
+                for month in counts:
+                    record_partition(conn, month)
+                save_staged_samples(conn, self.loader.samples)
+                conn.execute("COMMIT")
+            else:
+                # 4-5. Per partition: indexes once the data is in, then the
+                # pre-aggregated rows for the API; planner statistics last
+                self._print("\n[4/5] Creating indexes and rollups...")
+                start = time.perf_counter()
+                for month in counts:
+                    finish_partition(conn, month, self.loader.samples[month])
+                self._print(f"Indexes and rollups built. ({time.perf_counter() - start:.1f}s)")
+
+                self._print("\n[5/5] Creating trips view and analyzing...")
+                refresh_trips_view(conn)
+                stamp_data_version(conn)
+                conn.execute("ANALYZE")
+                self._print("Done.")
+        except BaseException:
+            self.abort()
+            raise
+        conn.close()
+        self.conn = None
+        os.replace(self.tmp_path, self.db_path)
+
+    def abort(self):
+        """Throw the scratch file away; ``db_path`` is left as it was."""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        self.tmp_path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _print(self, message):
+        if self.verbose:
+            print(message)
+
+
+def build_database(db_path=DB_PATH, output_dir=OUTPUT_DIR, zone_lookup_path=ZONE_LOOKUP_PATH):
+    """Build the whole database from the files in ``output_dir`` and swap it in for ``db_path``."""
+    trip_files = find_trip_files(output_dir)
+    if not trip_files:
+        raise FileNotFoundError(f"no processed trips found in {output_dir}. Run the data pipeline first.")
+
+    with DatabaseBuild(db_path, zone_lookup_path) as build:
+        for chunk in iter_trip_chunks(trip_files):
+            build.write(chunk)
+    return build.rows_written
+
+
+def _open_partitioned(db_path):
+    db_path = Path(db_path)
+    if not db_path.exists():
+        raise FileNotFoundError(f"{db_path} does not exist. Run a full load first.")
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+        conn.close()
+        raise ValueError(f"{db_path} was built with an older layout. Run a full load to rebuild it.")
+    return conn
+
+
+def replace_months(months, db_path=DB_PATH, output_dir=OUTPUT_DIR):
+    """
+    Reload only ``months`` from the pipeline output into the existing database,
+    in one transaction; other partitions are left alone.  Only files named for
+    one of ``months`` (or for no month) are read.
+    """
+    months = set(months)
+    for month in months:
+        partition_table(month)  # validates the format
+    trip_files = [p for p in find_trip_files(output_dir) if month_of(p) in months or month_of(p) is None]
+    if not trip_files:
+        raise FileNotFoundError(f"no processed trips for {', '.join(sorted(months))} in {output_dir}.")
+
+    conn = _open_partitioned(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for month in months:
+            drop_partition(conn, month)
+        loader = load_trips(conn, trip_files, months)
+        counts = loader.counts
+        missing = months - counts.keys()
+        if missing:
+            raise FileNotFoundError(f"no trips for {', '.join(sorted(missing))} in {output_dir}.")
+        for month in counts:
+            finish_partition(conn, month, loader.samples[month])
+            print(f"  {partition_table(month)}: {counts[month]:,} rows")
+        refresh_trips_view(conn)
+        stamp_data_version(conn)
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return counts
+
+
+def drop_months(months, db_path=DB_PATH):
+    """
+    Delete whole months (table, rollup rows, catalog entry) from the existing
+    database.  Raises ValueError, and leaves the database alone, if one of
+    ``months`` is not loaded.
+    """
+    months = set(months)
+    for month in months:
+        partition_table(month)  # validates the format
+    conn = _open_partitioned(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        loaded = {row[0] for row in conn.execute("SELECT month FROM trip_partitions")}
+        unknown = months - loaded
+        if unknown:
+            raise ValueError(f"not loaded: {', '.join(sorted(unknown))} (loaded: {', '.join(sorted(loaded)) or 'none'})")
+        for month in months:
+            drop_partition(conn, month)
+        if months:
+            # A new version only when something went: it empties the API's cache
+            refresh_trips_view(conn)
+            stamp_data_version(conn)
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Load the pipeline output into taxi_data.db.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--month", nargs="+", metavar="YYYY-MM",
+                       help="reload only these months into the existing database")
+    group.add_argument("--drop-month", nargs="+", metavar="YYYY-MM",
+                       help="delete these months from the existing database")
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    print("Starting database population...")
+    try:
+        if args.month:
+            replace_months(args.month)
+        elif args.drop_month:
+            drop_months(args.drop_month)
+        else:
+            build_database()
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}")
+        exit(1)
+
+    # Verify
+    print("\nVerifying database...")
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT month, row_count FROM trip_partitions ORDER BY month")
+    for month, rows in cursor.fetchall():
+        print(f"Trips {month}: {rows:,}")
+
+    cursor.execute("SELECT COUNT(*) FROM trips")
+    print(f"Total trips: {cursor.fetchone()[0]:,}")
+
+    cursor.execute("SELECT COUNT(*) FROM zones")
+    print(f"Total zones: {cursor.fetchone()[0]}")
+
+    print(f"\nDatabase setup complete. File: {DB_PATH}")
+
+    conn.close()
 
-print(f"\nDatabase setup complete. File: {BASE_DIR / 'taxi_data.db'}")
 
-conn.close()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
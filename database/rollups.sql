@@ -0,0 +1,92 @@
+-- Urban Mobility Data Explorer - Rollup Rows for One Partition
+-- Run by load_data.py after a partition's indexes, with {table} and {month}
+-- filled in; the month's old rollup rows are deleted before.
+-- The tables themselves are defined in schema.sql.
+
+INSERT INTO rollup_trips
+SELECT
+    '{month}',
+    date(pickup_ts, 'unixepoch'),
+    pickup_hour,
+    pickup_dow,
+    pickup_zone_id,
+    payment_type,
+    COUNT(*),
+    COUNT(fare_amount),
+    SUM(fare_amount),
+    SUM(fare_amount * fare_amount),
+    COUNT(total_amount),
+    SUM(total_amount),
+    SUM(total_amount * total_amount),
+    COUNT(trip_distance),
+    SUM(trip_distance),
+    SUM(trip_distance * trip_distance),
+    COUNT(trip_duration_min),
+    SUM(trip_duration_min),
+    SUM(trip_duration_min * trip_duration_min),
+    COUNT(speed_mph),
+    SUM(speed_mph),
+    SUM(speed_mph * speed_mph),
+    COUNT(cost_per_mile),
+    SUM(cost_per_mile),
+    SUM(cost_per_mile * cost_per_mile),
+    COUNT(tip_percentage),
+    SUM(tip_percentage),
+    SUM(tip_percentage * tip_percentage),
+    COUNT(tolls_amount),
+    SUM(tolls_amount),
+    SUM(tolls_amount * tolls_amount),
+    COUNT(extra),
+    SUM(extra),
+    SUM(extra * extra),
+    COUNT(congestion_surcharge),
+    SUM(congestion_surcharge),
+    SUM(congestion_surcharge * congestion_surcharge)
+FROM {table}
+GROUP BY date(pickup_ts, 'unixepoch'), pickup_hour, pickup_dow, pickup_zone_id, payment_type;
+
+INSERT INTO rollup_zone_hour
+SELECT
+    pickup_month,
+    pickup_dow,
+    pickup_hour,
+    pickup_zone_id,
+    SUM(trip_count),
+    SUM(fare_amount_n),
+    SUM(fare_amount_sum),
+    SUM(fare_amount_sumsq),
+    SUM(total_amount_n),
+    SUM(total_amount_sum),
+    SUM(total_amount_sumsq),
+    SUM(trip_distance_n),
+    SUM(trip_distance_sum),
+    SUM(trip_distance_sumsq),
+    SUM(trip_duration_min_n),
+    SUM(trip_duration_min_sum),
+    SUM(trip_duration_min_sumsq),
+    SUM(speed_mph_n),
+    SUM(speed_mph_sum),
+    SUM(speed_mph_sumsq),
+    SUM(cost_per_mile_n),
+    SUM(cost_per_mile_sum),
+    SUM(cost_per_mile_sumsq),
+    SUM(tip_percentage_n),
+    SUM(tip_percentage_sum),
+    SUM(tip_percentage_sumsq),
+    SUM(tolls_amount_n),
+    SUM(tolls_amount_sum),
+    SUM(tolls_amount_sumsq),
+    SUM(extra_n),
+    SUM(extra_sum),
+    SUM(extra_sumsq),
+    SUM(congestion_surcharge_n),
+    SUM(congestion_surcharge_sum),
+    SUM(congestion_surcharge_sumsq)
+FROM rollup_trips
+WHERE pickup_month = '{month}'
+GROUP BY pickup_dow, pickup_hour, pickup_zone_id;
+
+INSERT INTO rollup_routes
+SELECT '{month}', pickup_zone_id, dropoff_zone_id, COUNT(*)
+FROM {table}
+GROUP BY pickup_zone_id, dropoff_zone_id;
@@ -1,5 +1,21 @@
 -- Urban Mobility Data Explorer - SQLite Schema
 
+-- Layout version of this schema; backend/API.py queries older databases
+-- through their trips table instead of the rollups and compact partitions
+-- (version 1), samples fare vs distance with ORDER BY RANDOM() on
+-- databases without trip_samples (version 2), stamps the responses of
+-- databases without meta with the file's identity (version 3), and samples
+-- fare vs distance under a filter finer than whole months from the trips on
+-- databases whose samples lack the filter columns (version 4)
+PRAGMA user_version = 4;
+
+-- Facts about the loaded data.  load_data.py sets data_version to a new value
+-- whenever the data changes; the API's response cache and ETags key on it
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
 -- Zones lookup table
 CREATE TABLE IF NOT EXISTS zones (
     zone_id INTEGER PRIMARY KEY,
@@ -8,49 +24,210 @@ CREATE TABLE IF NOT EXISTS zones (
     service_zone TEXT
 );
 
--- Trips fact table
-CREATE TABLE IF NOT EXISTS trips (
-    trip_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    vendor_id INTEGER,
-    ratecode_id INTEGER,
-    store_and_fwd_flag TEXT,
+-- Trips are stored one compact table per pickup month (trips_YYYY_MM, created
+-- from trips_partition.sql).  load_data.py points the trips_compact view at the
+-- UNION ALL of them; the trips view below turns that back into the readable
+-- columns.
+CREATE TABLE IF NOT EXISTS trip_partitions (
+    month TEXT PRIMARY KEY,           -- YYYY-MM
+    table_name TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    first_pickup TEXT,
+    last_pickup TEXT,
+    loaded_at TEXT NOT NULL
+);
+
+-- Borough / zone / service zone text as the pipeline wrote it on each trip
+-- (cleaned, so it can differ from zones), stored once per distinct combination
+-- and referenced by pu_label_id / do_label_id
+CREATE TABLE IF NOT EXISTS zone_labels (
+    label_id INTEGER PRIMARY KEY,
+    borough TEXT,
+    zone_name TEXT,
+    service_zone TEXT
+);
+
+-- Trips with readable columns, as the pre-compact trips table had them
+CREATE VIEW IF NOT EXISTS trips AS
+SELECT
+    t.trip_id,
+    t.vendor_id,
+    t.ratecode_id,
+    t.store_and_fwd_flag,
+    t.payment_type,
+    datetime(t.pickup_ts, 'unixepoch') || '+00:00' AS pickup_datetime,
+    datetime(t.dropoff_ts, 'unixepoch') || '+00:00' AS dropoff_datetime,
+    t.pickup_zone_id,
+    t.dropoff_zone_id,
+    pl.borough AS pu_borough,
+    dl.borough AS do_borough,
+    pl.zone_name AS pu_zone,
+    dl.zone_name AS do_zone,
+    pl.service_zone AS pu_service_zone,
+    dl.service_zone AS do_service_zone,
+    t.passenger_count,
+    t.trip_distance,
+    t.fare_amount,
+    t.extra,
+    t.mta_tax,
+    t.tip_amount,
+    t.tolls_amount,
+    t.improvement_surcharge,
+    t.congestion_surcharge,
+    t.total_amount,
+    t.trip_duration_min,
+    t.speed_mph,
+    t.cost_per_mile,
+    t.tip_percentage,
+    t.pickup_hour,
+    CASE t.pickup_dow
+        WHEN 0 THEN 'Monday'
+        WHEN 1 THEN 'Tuesday'
+        WHEN 2 THEN 'Wednesday'
+        WHEN 3 THEN 'Thursday'
+        WHEN 4 THEN 'Friday'
+        WHEN 5 THEN 'Saturday'
+        WHEN 6 THEN 'Sunday'
+    END AS pickup_day_of_week
+FROM trips_compact t
+LEFT JOIN zone_labels pl ON pl.label_id = t.pu_label_id
+LEFT JOIN zone_labels dl ON dl.label_id = t.do_label_id;
+
+-- Rollup tables: pre-aggregated trips the API answers from instead of scanning
+-- trips, filled per partition by rollups.sql.
+-- Every measure is stored as <measure>_n (non-NULL values), <measure>_sum and
+-- <measure>_sumsq, so averages are SUM(<measure>_sum) / SUM(<measure>_n) --
+-- NULLs are skipped exactly as AVG() skips them -- and variances can be
+-- derived from the sums of squares.
+
+-- Finest grain: one row per pickup date, hour, pickup zone and payment type
+CREATE TABLE IF NOT EXISTS rollup_trips (
+    pickup_month TEXT NOT NULL,
+    pickup_date TEXT,
+    pickup_hour INTEGER,
+    pickup_dow INTEGER,               -- 0 = Monday ... 6 = Sunday
+    pickup_zone_id INTEGER,
     payment_type INTEGER,
-    pickup_datetime TEXT NOT NULL,
-    dropoff_datetime TEXT NOT NULL,
+    trip_count INTEGER NOT NULL,
+    fare_amount_n INTEGER NOT NULL,
+    fare_amount_sum REAL,
+    fare_amount_sumsq REAL,
+    total_amount_n INTEGER NOT NULL,
+    total_amount_sum REAL,
+    total_amount_sumsq REAL,
+    trip_distance_n INTEGER NOT NULL,
+    trip_distance_sum REAL,
+    trip_distance_sumsq REAL,
+    trip_duration_min_n INTEGER NOT NULL,
+    trip_duration_min_sum REAL,
+    trip_duration_min_sumsq REAL,
+    speed_mph_n INTEGER NOT NULL,
+    speed_mph_sum REAL,
+    speed_mph_sumsq REAL,
+    cost_per_mile_n INTEGER NOT NULL,
+    cost_per_mile_sum REAL,
+    cost_per_mile_sumsq REAL,
+    tip_percentage_n INTEGER NOT NULL,
+    tip_percentage_sum REAL,
+    tip_percentage_sumsq REAL,
+    tolls_amount_n INTEGER NOT NULL,
+    tolls_amount_sum REAL,
+    tolls_amount_sumsq REAL,
+    extra_n INTEGER NOT NULL,
+    extra_sum REAL,
+    extra_sumsq REAL,
+    congestion_surcharge_n INTEGER NOT NULL,
+    congestion_surcharge_sum REAL,
+    congestion_surcharge_sumsq REAL
+);
+
+-- Day of week x hour x pickup zone: what the whole-dataset endpoints group by
+CREATE TABLE IF NOT EXISTS rollup_zone_hour (
+    pickup_month TEXT NOT NULL,
+    pickup_dow INTEGER,               -- 0 = Monday ... 6 = Sunday
+    pickup_hour INTEGER,
+    pickup_zone_id INTEGER,
+    trip_count INTEGER NOT NULL,
+    fare_amount_n INTEGER NOT NULL,
+    fare_amount_sum REAL,
+    fare_amount_sumsq REAL,
+    total_amount_n INTEGER NOT NULL,
+    total_amount_sum REAL,
+    total_amount_sumsq REAL,
+    trip_distance_n INTEGER NOT NULL,
+    trip_distance_sum REAL,
+    trip_distance_sumsq REAL,
+    trip_duration_min_n INTEGER NOT NULL,
+    trip_duration_min_sum REAL,
+    trip_duration_min_sumsq REAL,
+    speed_mph_n INTEGER NOT NULL,
+    speed_mph_sum REAL,
+    speed_mph_sumsq REAL,
+    cost_per_mile_n INTEGER NOT NULL,
+    cost_per_mile_sum REAL,
+    cost_per_mile_sumsq REAL,
+    tip_percentage_n INTEGER NOT NULL,
+    tip_percentage_sum REAL,
+    tip_percentage_sumsq REAL,
+    tolls_amount_n INTEGER NOT NULL,
+    tolls_amount_sum REAL,
+    tolls_amount_sumsq REAL,
+    extra_n INTEGER NOT NULL,
+    extra_sum REAL,
+    extra_sumsq REAL,
+    congestion_surcharge_n INTEGER NOT NULL,
+    congestion_surcharge_sum REAL,
+    congestion_surcharge_sumsq REAL
+);
+
+-- Pickup zone x drop-off zone trip counts: routes and drop-off totals
+CREATE TABLE IF NOT EXISTS rollup_routes (
+    pickup_month TEXT NOT NULL,
     pickup_zone_id INTEGER,
     dropoff_zone_id INTEGER,
-    -- zone details added by pipeline
-    pu_borough TEXT,
-    do_borough TEXT,
-    pu_zone TEXT,
-    do_zone TEXT,
-    pu_service_zone TEXT,
-    do_service_zone TEXT,
-    passenger_count INTEGER,
+    trip_count INTEGER NOT NULL
+);
+
+-- Fare vs distance scatter: a few pre-drawn random samples of each month's
+-- trips with a positive distance and fare, stratified by distance x fare
+-- bucket (load_data.py).  Within a sample, every prefix in sample_rank
+-- order is itself stratified, so the API reads as many rows as it needs.
+-- The trip's filter columns let the API sample under a filter too.
+CREATE TABLE IF NOT EXISTS trip_samples (
+    sample_id INTEGER NOT NULL,
+    pickup_month TEXT NOT NULL,
+    sample_rank INTEGER NOT NULL,
     trip_distance REAL,
     fare_amount REAL,
-    extra REAL,
-    mta_tax REAL,
-    tip_amount REAL,
-    tolls_amount REAL,
-    improvement_surcharge REAL,
-    congestion_surcharge REAL,
     total_amount REAL,
-    -- engineered features
-    trip_duration_min REAL,
-    speed_mph REAL,
-    cost_per_mile REAL,
-    tip_percentage REAL,
+    tip_amount REAL,
+    pickup_ts INTEGER,
     pickup_hour INTEGER,
-    pickup_day_of_week TEXT,
-    FOREIGN KEY (pickup_zone_id) REFERENCES zones(zone_id),
-    FOREIGN KEY (dropoff_zone_id) REFERENCES zones(zone_id)
-);
-
--- Indexes
-CREATE INDEX IF NOT EXISTS idx_pickup_zone ON trips(pickup_zone_id);
-CREATE INDEX IF NOT EXISTS idx_dropoff_zone ON trips(dropoff_zone_id);
-CREATE INDEX IF NOT EXISTS idx_pickup_time ON trips(pickup_datetime);
-CREATE INDEX IF NOT EXISTS idx_payment_type ON trips(payment_type);
-CREATE INDEX IF NOT EXISTS idx_pickup_hour ON trips(pickup_hour);
-CREATE INDEX IF NOT EXISTS idx_pickup_dow ON trips(pickup_day_of_week);
\ No newline at end of file
+    pickup_zone_id INTEGER,
+    payment_type INTEGER,
+    PRIMARY KEY (sample_id, pickup_month, sample_rank)
+) WITHOUT ROWID;
+
+-- Trips each month's samples were drawn from, to split a sample between months
+CREATE TABLE IF NOT EXISTS trip_sample_months (
+    pickup_month TEXT PRIMARY KEY,
+    trip_count INTEGER NOT NULL
+);
+
+-- Rollup indexes, shaped after the API queries (checked by
+-- benchmarks/check_query_plans.py): the GROUP BY key first, then trip_count
+-- so count-only queries are answered from the index alone (trips by day of
+-- week also under an hour filter)
+CREATE INDEX IF NOT EXISTS idx_rollup_trips_month ON rollup_trips(pickup_month);
+CREATE INDEX IF NOT EXISTS idx_rollup_zone_hour_month ON rollup_zone_hour(pickup_month);
+CREATE INDEX IF NOT EXISTS idx_rollup_zone_hour_zone ON rollup_zone_hour(pickup_zone_id, pickup_dow, pickup_hour, trip_count);
+CREATE INDEX IF NOT EXISTS idx_rollup_zone_hour_hour ON rollup_zone_hour(pickup_hour, trip_count);
+CREATE INDEX IF NOT EXISTS idx_rollup_zone_hour_dow ON rollup_zone_hour(pickup_dow, pickup_hour, trip_count);
+CREATE INDEX IF NOT EXISTS idx_rollup_routes_month ON rollup_routes(pickup_month);
+CREATE INDEX IF NOT EXISTS idx_rollup_routes_route ON rollup_routes(pickup_zone_id, dropoff_zone_id, trip_count);
+CREATE INDEX IF NOT EXISTS idx_rollup_routes_dropoff ON rollup_routes(dropoff_zone_id, trip_count);
+
+-- Borough grouping walks zones in borough order
+CREATE INDEX IF NOT EXISTS idx_zones_borough ON zones(borough);
+
+-- Partition indexes live in indexes.sql: load_data.py creates them after the bulk insert
@@ -0,0 +1,41 @@
+-- Urban Mobility Data Explorer - Trips Partition
+-- One month of trips.  load_data.py fills in {table} (trips_YYYY_MM) and
+-- creates one of these per pickup month.
+-- Compact layout: times are Unix epoch seconds (UTC), the day of week is
+-- 0 = Monday ... 6 = Sunday, and the zone text is a zone_labels id.  The trips
+-- view in schema.sql shows the readable columns.
+
+CREATE TABLE {table} (
+    trip_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    vendor_id INTEGER,
+    ratecode_id INTEGER,
+    store_and_fwd_flag TEXT,
+    payment_type INTEGER,
+    pickup_ts INTEGER NOT NULL,
+    dropoff_ts INTEGER NOT NULL,
+    pickup_zone_id INTEGER,
+    dropoff_zone_id INTEGER,
+    pu_label_id INTEGER,
+    do_label_id INTEGER,
+    passenger_count INTEGER,
+    trip_distance REAL,
+    fare_amount REAL,
+    extra REAL,
+    mta_tax REAL,
+    tip_amount REAL,
+    tolls_amount REAL,
+    improvement_surcharge REAL,
+    congestion_surcharge REAL,
+    total_amount REAL,
+    -- engineered features
+    trip_duration_min REAL,
+    speed_mph REAL,
+    cost_per_mile REAL,
+    tip_percentage REAL,
+    pickup_hour INTEGER,
+    pickup_dow INTEGER,
+    FOREIGN KEY (pickup_zone_id) REFERENCES zones(zone_id),
+    FOREIGN KEY (dropoff_zone_id) REFERENCES zones(zone_id),
+    FOREIGN KEY (pu_label_id) REFERENCES zone_labels(label_id),
+    FOREIGN KEY (do_label_id) REFERENCES zone_labels(label_id)
+);
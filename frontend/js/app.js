@@ -1,11 +1,13 @@
 // ── Main entry point ──────────────────────────────────────
-import { ENDPOINTS, applyChartDefaults } from './config.js';
+import { ENDPOINTS, DASHBOARD_DATASETS, applyChartDefaults } from './config.js';
 import { state } from './state.js';
-import { fetchAPI, hideLoading } from './dataLoader.js';
+import { fetchAPI, fetchDashboard, hideLoading, withParams } from './dataLoader.js';
+import { bindFilterEvents, populateBoroughs } from './filters.js';
 import { renderKPIs } from './kpi.js';
 import { renderTripsByHour, renderTripsByDay, renderFareByBorough, renderScatter, renderTopZones } from './charts.js';
 import { renderMap, bindMapEvents } from './map.js';
 import { renderTopRoutes } from './routes.js';
+import { topologyToGeoJSON } from './topology.js';
 
 // ── Render everything (called after each filter change) ───
 export function renderAll() {
@@ -19,37 +21,44 @@ export function renderAll() {
   renderTopZones();
 }
 
+// ── Load the data for a filter (URLSearchParams, empty for none) ──
+async function loadData(params) {
+  // Fetch the chart data in one batched request, the map shapes alongside
+  // (sent pre-compressed when unfiltered, so kept out of the batch)
+  const [datasets, geojson] = await Promise.all([
+    fetchDashboard(ENDPOINTS.dashboard, DASHBOARD_DATASETS, params),
+    fetchAPI(withParams(ENDPOINTS.geojson, params)),
+  ]);
+
+  // Store in shared state
+  Object.assign(state, datasets);
+  state.geojson = geojson.type === 'Topology' ? topologyToGeoJSON(geojson) : geojson;
+}
+
+// ── Reload and redraw when the filter changes ─────────────
+async function applyFilter(params) {
+  document.body.style.cursor = 'progress';
+  try {
+    await loadData(params);
+    renderAll();
+  } catch (err) {
+    console.error('Failed to apply filter:', err);
+    alert(`Could not apply the filter: ${err.message}`);
+  } finally {
+    document.body.style.cursor = '';
+  }
+}
+
 // ── Bootstrap ─────────────────────────────────────────────
 async function init() {
   applyChartDefaults();
   try {
-    // Fetch all API data in parallel
-    const [
-      summary, tripsByHour, tripsByDay, fareByBorough,
-      fareVsDistance, topPickupZones, topRoutes, geojson
-    ] = await Promise.all([
-      fetchAPI(ENDPOINTS.summary),
-      fetchAPI(ENDPOINTS.tripsByHour),
-      fetchAPI(ENDPOINTS.tripsByDay),
-      fetchAPI(ENDPOINTS.fareByBorough),
-      fetchAPI(ENDPOINTS.fareVsDistance),
-      fetchAPI(ENDPOINTS.topPickupZones),
-      fetchAPI(ENDPOINTS.topRoutes),
-      fetchAPI(ENDPOINTS.geojson),
-    ]);
-
-    // Store in shared state
-    state.summary        = summary;
-    state.tripsByHour    = tripsByHour;
-    state.tripsByDay     = tripsByDay;
-    state.fareByBorough  = fareByBorough;
-    state.fareVsDistance = fareVsDistance;
-    state.topPickupZones = topPickupZones;
-    state.topRoutes      = topRoutes;
-    state.geojson        = geojson;
+    await loadData(new URLSearchParams());
 
     console.log('API data loaded successfully');
 
+    populateBoroughs(state.fareByBorough);
+    bindFilterEvents(applyFilter);
     bindMapEvents();
     renderAll();
     hideLoading();
@@ -7,8 +7,20 @@ export const ENDPOINTS = {
   fareVsDistance: '/api/fare-vs-distance',
   topPickupZones: '/api/top-pickup-zones',
   topRoutes:      '/api/top-routes',
-  geojson:        '/api/geojson',
+  geojson:        '/api/geojson?level=medium&format=topojson',
   boroughStats:   '/api/borough-stats',
+  dashboard:      '/api/dashboard',
+};
+
+// ── Datasets fetched together from /api/dashboard (state key → dataset) ──
+export const DASHBOARD_DATASETS = {
+  summary:        'summary',
+  tripsByHour:    'trips-by-hour',
+  tripsByDay:     'trips-by-day',
+  fareByBorough:  'avg-fare-by-borough',
+  fareVsDistance: 'fare-vs-distance',
+  topPickupZones: 'top-pickup-zones',
+  topRoutes:      'top-routes',
 };
 
 // ── Chart.js colour palette ───────────────────────────────
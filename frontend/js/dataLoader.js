@@ -1,3 +1,10 @@
+// ── Add query parameters to an endpoint (which may already have some) ──
+export function withParams(endpoint, params) {
+  const query = new URLSearchParams(params).toString();
+  if (!query) return endpoint;
+  return `${endpoint}${endpoint.includes('?') ? '&' : '?'}${query}`;
+}
+
 // ── Fetch JSON from an API endpoint ──────────────────────
 export async function fetchAPI(endpoint) {
   const res = await fetch(endpoint);
@@ -5,6 +12,20 @@ export async function fetchAPI(endpoint) {
   return res.json();
 }
 
+// ── Fetch several datasets in one /api/dashboard request ──
+// datasets maps a name of your choice to an API dataset; resolves to the
+// same keys with each dataset's JSON. params (filters) apply to every dataset.
+export async function fetchDashboard(endpoint, datasets, params = {}) {
+  const names = Object.values(datasets).join(',');
+  const url = withParams(`${endpoint}?datasets=${names}`, params);
+  const { datasets: data, errors } = await fetchAPI(url);
+  if (errors) {
+    const [name, error] = Object.entries(errors)[0];
+    throw new Error(`HTTP ${error.status} loading ${name}`);
+  }
+  return Object.fromEntries(Object.entries(datasets).map(([key, name]) => [key, data[name]]));
+}
+
 // ── Hide the loading overlay ──────────────────────────────
 export function hideLoading() {
   const el = document.getElementById('loadingOverlay');
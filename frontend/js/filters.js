@@ -1,2 +1,39 @@
-// Filters module (no-op - API returns pre-aggregated data)
-// Kept as a module stub so existing imports don't break.
+// ── Filter bar ────────────────────────────────────────────
+// The API filters every aggregate server-side; this module only turns the
+// filter bar into query parameters (see backend/trip_filters.py).
+
+const FIELDS = {
+  start:        'filterStart',
+  end:          'filterEnd',
+  borough:      'filterBorough',
+  hour_from:    'filterHourFrom',
+  hour_to:      'filterHourTo',
+  payment_type: 'filterPayment',
+};
+
+// ── Current filter as URLSearchParams (empty fields left out) ──
+export function filterParams() {
+  const params = new URLSearchParams();
+  for (const [name, id] of Object.entries(FIELDS)) {
+    const value = document.getElementById(id).value;
+    if (value !== '') params.set(name, value);
+  }
+  return params;
+}
+
+// ── Fill the borough list (once, from the unfiltered data) ──
+export function populateBoroughs(rows) {
+  const select = document.getElementById(FIELDS.borough);
+  for (const { borough } of rows) {
+    if (borough) select.add(new Option(borough, borough));
+  }
+}
+
+// ── Call onChange(params) when Apply or Reset is clicked ──
+export function bindFilterEvents(onChange) {
+  document.getElementById('btnApply').addEventListener('click', () => onChange(filterParams()));
+  document.getElementById('btnReset').addEventListener('click', () => {
+    for (const id of Object.values(FIELDS)) document.getElementById(id).value = '';
+    onChange(filterParams());
+  });
+}
@@ -0,0 +1,40 @@
+// ── TopoJSON → GeoJSON ────────────────────────────────────
+// The API can send zone shapes as TopoJSON: every border is stored once as
+// an "arc" of delta-encoded integer points, and each polygon ring lists the
+// arcs it runs along (~i = arc i walked backwards). Leaflet wants GeoJSON,
+// so rebuild the rings here.
+
+export function topologyToGeoJSON(topology) {
+  const [sx, sy] = topology.transform.scale;
+  const [tx, ty] = topology.transform.translate;
+
+  const arcs = topology.arcs.map(arc => {
+    let x = 0, y = 0;
+    return arc.map(([dx, dy]) => {
+      x += dx;
+      y += dy;
+      return [x * sx + tx, y * sy + ty];
+    });
+  });
+
+  // consecutive arcs share their end/start point, so skip it after the first arc
+  const ring = indexes => {
+    const points = [];
+    indexes.forEach((i, k) => {
+      const arc = i < 0 ? arcs[~i].slice().reverse() : arcs[i];
+      points.push(...(k === 0 ? arc : arc.slice(1)));
+    });
+    return points;
+  };
+
+  const geometry = g => {
+    if (g.type === 'Polygon') return { type: 'Polygon', coordinates: g.arcs.map(ring) };
+    if (g.type === 'MultiPolygon') return { type: 'MultiPolygon', coordinates: g.arcs.map(p => p.map(ring)) };
+    return null;
+  };
+
+  const features = Object.values(topology.objects).flatMap(obj =>
+    obj.geometries.map(g => ({ type: 'Feature', properties: g.properties || {}, geometry: geometry(g) }))
+  );
+  return { type: 'FeatureCollection', features };
+}